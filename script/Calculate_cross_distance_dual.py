@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨来源（h3k4 ↔ euchr）空间邻近：同一细胞内 H3K4me3 bin 相对常染色质 bin 的位置
+
+输出目录 <Sample>/Whole_genome_distance_dual_cross/：
+  {base}_cross_pairs.txt    距离 ≤ --threshold 的二部点对，列同 *_distance_filtered.txt：
+                            h3k4_homolog h3k4_locus euchr_homolog euchr_locus dist（按 h3k4 行、euchr 行排序）
+  {base}_cross_nearest.tsv  每个 bin 到另一来源最近 bin 的距离（source=h3k4 / euchr 两段）
+  {base}_cross_sweep.tsv    逐阈值：二部点对数、有跨来源邻居（≤thr）的 bin 数与占比
+计算全部是两棵 KD-tree 之间的批量查询（sparse_distance_matrix / count_neighbors / query），无逐点循环；
+--mem_budget_mb 时按 h3k4 行分块枚举点对（同 Calculate_distance_whole_dual.py 的流式模式）
+"""
+import sys, argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from Calculate_distance_whole_dual import (
+    ascend_to_sample_dir, cKDTree, chunk_bounds, write_pairs, STREAM_BYTES_PER_PAIR,
+)
+from bin_cache_dual import load_cluster_table
+from profile_dual import StageProfile, NULL_PROFILE
+from stream_io_dual import open_text, atomic_output
+
+CLUSTER_STEMS = {"euchr": "euchromatin_cluster", "h3k4": "h3k4me3_cluster"}
+OUT_DIRNAME = "Whole_genome_distance_dual_cross"
+
+def locate_cluster(sample_dir: Path, label: str):
+    """优先 <Sample>/<Sample>.<stem>.txt，其次 glob；找不到返回 None"""
+    stem = CLUSTER_STEMS[label]
+    exact = sample_dir / f"{sample_dir.name}.{stem}.txt"
+    if exact.is_file(): return exact
+    hits = sorted(sample_dir.glob(f"*{stem}.txt"))
+    return hits[0] if hits else None
+
+def cross_distances(xyz_a, xyz_b, ii, jj):
+    """xyz_a[ii] 与 xyz_b[jj] 的逐对距离；公式同 pair_distances（两来源的输出可直接比较）"""
+    d = np.float_power(xyz_a[ii] - xyz_b[jj], 2.0)
+    return np.sqrt(d[:, 0] + d[:, 1] + d[:, 2])
+
+def cross_pair_blocks(xyz_h, tree_e, threshold, budget_mb=None, prof=NULL_PROFILE):
+    """
+    h3k4 × euchr 距离 ≤ threshold 的点对，按 h3k4 行分块产出 (ii, jj)（块内按 (ii, jj) 排序）
+    每块为一次 “块内 h3k4 KD-tree × 全体 euchr KD-tree” 的 sparse_distance_matrix；
+    budget_mb 为空时整体一块，否则先用 query_ball_point 计数再按预算切块
+    """
+    n = len(xyz_h)
+    if budget_mb:
+        with prof.timer("tree_query"):
+            counts = tree_e.query_ball_point(xyz_h, r=threshold, return_length=True)
+        bounds = chunk_bounds(counts, max(1, int(budget_mb * 1024 * 1024) // STREAM_BYTES_PER_PAIR))
+    else:
+        bounds = [0, n]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        with prof.timer("tree_query"):
+            rec = cKDTree(xyz_h[a:b]).sparse_distance_matrix(tree_e, threshold, output_type='ndarray')
+            ii, jj = rec['i'] + a, rec['j']
+            del rec
+            order = np.lexsort((jj, ii))
+            ii, jj = ii[order], jj[order]
+        yield ii, jj
+
+def nearest_cross(xyz_q, xyz_t, tree_t):
+    """xyz_q 每个点在另一来源中的最近 bin（批量 query）→ (idx, dist)；距离按坐标重算"""
+    _, idx = tree_t.query(xyz_q, k=1)
+    return idx, cross_distances(xyz_q, xyz_t, np.arange(len(xyz_q)), idx)
+
+def sweep_table(tree_h, tree_e, nn_h, nn_e, thresholds):
+    """逐阈值汇总：点对数来自一次 count_neighbors（多半径，双树遍历），邻居占比来自最近距离"""
+    thr = np.asarray(thresholds, dtype=float)
+    n_pairs = np.atleast_1d(tree_h.count_neighbors(tree_e, r=thr))
+    h_with = (nn_h[None, :] <= thr[:, None]).sum(axis=1)
+    e_with = (nn_e[None, :] <= thr[:, None]).sum(axis=1)
+    return pd.DataFrame({
+        'threshold': thr, 'n_pairs': n_pairs,
+        'h3k4_with_euchr': h_with, 'h3k4_frac': h_with / max(len(nn_h), 1),
+        'euchr_with_h3k4': e_with, 'euchr_frac': e_with / max(len(nn_e), 1),
+    })
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cross-source (h3k4 ↔ euchr) proximity pairs and nearest distances")
+    ap.add_argument("--euchr_file", default=None, help="默认 <Sample>/<Sample>.euchromatin_cluster.txt（或 glob）")
+    ap.add_argument("--h3k4_file", default=None, help="默认 <Sample>/<Sample>.h3k4me3_cluster.txt（或 glob）")
+    ap.add_argument("--threshold", type=float, default=5.0, help="输出二部点对的距离阈值（默认5.0）")
+    ap.add_argument("--thresholds", nargs='+', default=["1","1.25","1.5","1.75","2","2.25","2.5","2.75","3"],
+                    help="逐阈值汇总（同 cluster_and_merge_whole_dual.sh 阈值；可大于 --threshold）")
+    ap.add_argument("--mem_budget_mb", type=float, default=None,
+                    help="按 h3k4 行分块枚举点对，点对工作集不超过该预算（MB）；默认一次性枚举")
+    ap.add_argument("--out_dir", default=None, help=f"默认 <Sample>/{OUT_DIRNAME}")
+    ap.add_argument("--sample_dir", default=None,
+                    help="样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("cross", argv)
+
+    script_dir = Path(__file__).resolve().parent
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
+    sample_name = sample_dir.name
+    if cKDTree is None:
+        print("[ERROR] 跨来源分析需要 scipy（cKDTree）", file=sys.stderr); sys.exit(2)
+
+    files = {'euchr': Path(args.euchr_file) if args.euchr_file else locate_cluster(sample_dir, "euchr"),
+             'h3k4': Path(args.h3k4_file) if args.h3k4_file else locate_cluster(sample_dir, "h3k4")}
+    missing = [lab for lab, fp in files.items() if fp is None or not fp.is_file()]
+    if missing:
+        print(f"[ERROR] 缺少 cluster 文件：{', '.join(missing)}（{sample_dir}）", file=sys.stderr); sys.exit(2)
+
+    with prof.timer("parse"):
+        tab_e, cache_e = load_cluster_table(files['euchr'], "euchr")
+        tab_h, cache_h = load_cluster_table(files['h3k4'], "h3k4")
+    ne, nh = len(tab_e), len(tab_h)
+    if ne == 0 or nh == 0:
+        print(f"[Info] No data points (euchr={ne}, h3k4={nh})")
+        sys.exit(0)
+    xyz_e, xyz_h = tab_e.xyz, tab_h.xyz
+
+    base = files['euchr'].name
+    if base.endswith(f".{CLUSTER_STEMS['euchr']}.txt"):
+        base = base[:-len(f".{CLUSTER_STEMS['euchr']}.txt")]
+    out_dir = Path(args.out_dir) if args.out_dir else sample_dir / OUT_DIRNAME
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pairs_path = out_dir / f"{base}_cross_pairs.txt"
+    nearest_path = out_dir / f"{base}_cross_nearest.tsv"
+    sweep_path = out_dir / f"{base}_cross_sweep.tsv"
+
+    with prof.timer("tree_build"):
+        tree_e, tree_h = cKDTree(xyz_e), cKDTree(xyz_h)
+
+    # 1) 二部点对：h3k4 节点在前、euchr 节点在后拼成一张前缀表，复用 write_pairs
+    prefix = np.concatenate([tab_h.keys("\t"), tab_e.keys("\t")])
+    n_pairs = 0
+    with open_text(pairs_path, 'w') as fout:
+        for ii, jj in cross_pair_blocks(xyz_h, tree_e, args.threshold, args.mem_budget_mb, prof):
+            with prof.timer("write"):
+                write_pairs(fout, prefix, ii, jj + nh, cross_distances(xyz_h, xyz_e, ii, jj))
+            n_pairs += len(ii)
+
+    # 2) 每个 bin 的跨来源最近邻
+    with prof.timer("nearest"):
+        idx_h, nn_h = nearest_cross(xyz_h, xyz_e, tree_e)
+        idx_e, nn_e = nearest_cross(xyz_e, xyz_h, tree_h)
+    with prof.timer("write"):
+        nearest = pd.concat([
+            pd.DataFrame({'source': 'h3k4', 'homolog': tab_h.homolog, 'locus': tab_h.locus_str,
+                          'nearest_homolog': tab_e.homolog[idx_h], 'nearest_locus': tab_e.locus_str[idx_h],
+                          'dist': nn_h}),
+            pd.DataFrame({'source': 'euchr', 'homolog': tab_e.homolog, 'locus': tab_e.locus_str,
+                          'nearest_homolog': tab_h.homolog[idx_e], 'nearest_locus': tab_h.locus_str[idx_e],
+                          'dist': nn_e}),
+        ], ignore_index=True)
+        with atomic_output(nearest_path) as tmp:
+            nearest.to_csv(tmp, sep="\t", index=False)
+
+    # 3) 阈值扫描
+    with prof.timer("sweep"):
+        sweep = sweep_table(tree_h, tree_e, nn_h, nn_e, [float(t) for t in args.thresholds])
+        sweep.insert(0, 'prefix', [f"whole{t}" for t in args.thresholds])
+    with atomic_output(sweep_path) as tmp:
+        sweep.to_csv(tmp, sep="\t", index=False)
+
+    prof.count(euchr_bins=ne, h3k4_bins=nh, pairs=n_pairs, threshold=args.threshold,
+               mem_budget_mb=args.mem_budget_mb, bin_cache=f"euchr={cache_e}, h3k4={cache_h}")
+    prof_path = prof.write(pairs_path)
+
+    # -------- REPORT --------
+    print("\n=== Calculate_cross_distance_dual REPORT ===")
+    print(f"Sample name : {sample_name}")
+    print(f"Euchr in    : {files['euchr'].resolve()} ({ne} bins, cache {cache_e})")
+    print(f"H3K4 in     : {files['h3k4'].resolve()} ({nh} bins, cache {cache_h})")
+    print(f"Threshold   : {args.threshold}" + (f" | budget {args.mem_budget_mb:g} MB" if args.mem_budget_mb else ""))
+    print(f"Out dir     : {out_dir.resolve()}")
+    print(f"Files out   : {pairs_path.name}, {nearest_path.name}, {sweep_path.name}")
+    print(f"Pairs<=thr  : {n_pairs}")
+    print(f"Nearest     : h3k4→euchr median {np.median(nn_h):.4f} | euchr→h3k4 median {np.median(nn_e):.4f}")
+    if prof_path:
+        print(f"Profile     : {prof_path.resolve()}")
+    print("============================================\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys, math, argparse, re
+import sys, math, argparse, itertools
 from pathlib import Path
+import numpy as np
+
+from edge_store_dual import EdgeStoreWriter, store_paths, write_sorted_store, sorted_paths, open_edges, EDGES_SUFFIX
+from bin_cache_dual import load_cluster_table
+from profile_dual import StageProfile, NULL_PROFILE
+from stream_io_dual import open_text, open_binary, atomic_output
 
 try:
     from scipy.spatial import cKDTree  # 用于全局KD-tree
 except Exception:
     cKDTree = None
 
-# ---------- 基础：样本定位与格式判定 ----------
+# ---------- 基础：样本定位 ----------
 def ascend_to_sample_dir(start: Path) -> Path:
     p = start.resolve()
     if p.is_file(): p = p.parent
@@ -17,168 +23,716 @@ def ascend_to_sample_dir(start: Path) -> Path:
         if p.parent == p: raise FileNotFoundError(f"上溯失败：{start}")
         p = p.parent
 
-def detect_format_from_file(first_line: str):
-    """
-    返回 ('euchr'|'h3k4', has_header: bool, locus_idx: int)
-    - euchr: 第一列 homolog，如 chr1(mat)，第二列 locus → locus_idx=1
-    - h3k4 : 第一列 chrom, 第二列 allele, 第三列 locus → locus_idx=2
-    """
-    s = first_line.strip()
-    parts = s.split()
-    if not parts: return "euchr", False, 1
-    h0 = parts[0].lower()
-    if h0 == "homolog": return "euchr", True, 1
-    if h0 in ("chrom", "allele"): return "h3k4", True, 2
-    if re.match(r"^chr[^()]+\((mat|pat)\)$", parts[0]): return "euchr", False, 1
-    if len(parts) >= 2 and parts[1] in ("mat","pat"): return "h3k4", False, 2
-    return "euchr", False, 1
-
-def parse_line(parts, fmt):
-    """
-    统一返回 (chrom_label, locus, x, y, z)
-    - euchr: chrom_label = homolog (chr1(mat))
-    - h3k4 : chrom_label = f"{chrom}({allele})"
-    """
-    try:
-        if fmt == "euchr":
-            if len(parts) < 5: return None
-            chrom_label = parts[0]
-            locus = parts[1]
-            x, y, z = float(parts[2]), float(parts[3]), float(parts[4])
-            return chrom_label, locus, x, y, z
+# ---------- KD-tree ----------
+def compute_all_pairs_kdtree(xyz, threshold, prof=NULL_PROFILE):
+    """
+    返回 (pairs, nn_idx)
+    - pairs : (m,2) int ndarray，i<j，按 (i,j) 字典序排序（输出稳定、可 diff）
+    - nn_idx: 每个点最近邻下标；无邻居（n==1）时为 n
+    """
+    with prof.timer("tree_build"):
+        tree = cKDTree(xyz)
+    with prof.timer("tree_query"):
+        pairs = tree.query_pairs(r=threshold, output_type='ndarray')
+        if len(pairs):
+            pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
         else:
-            if len(parts) < 6: return None
-            chrom_label = f"{parts[0]}({parts[1]})"
-            locus = parts[2]
-            x, y, z = float(parts[3]), float(parts[4]), float(parts[5])
-            return chrom_label, locus, x, y, z
-    except ValueError:
-        return None
+            pairs = np.empty((0, 2), dtype=np.intp)
+        _, idxs = tree.query(xyz, k=2)
+    return pairs, idxs[:, 1]
 
-# ---------- KD-tree ----------
-def compute_all_pairs_kdtree(coords, threshold):
-    points = [c[2:5] for c in coords]
-    tree = cKDTree(points)
-    pairs = tree.query_pairs(r=threshold, output_type='set')
-    dists, idxs = tree.query(points, k=2)
-    nearest_info = [(dists[i][1], idxs[i][1]) for i in range(len(points))]
-    return pairs, nearest_info
+# ---------- KD-tree：有界内存流式枚举 ----------
+STREAM_BYTES_PER_PAIR = 96   # 每个候选对（含自身与 j<i 方向）的峰值开销估计：查询记录 + 过滤 / 排序 / 求距副本
+
+def chunk_bounds(counts, cap):
+    """按累计候选数把 [0,n) 切成连续块，每块 sum(counts) ≤ cap；单点超限时独占一块"""
+    cum = np.cumsum(counts, dtype=np.int64)
+    bounds = [0]
+    while bounds[-1] < len(counts):
+        a = bounds[-1]
+        base = int(cum[a-1]) if a else 0
+        b = int(np.searchsorted(cum, base + cap, side='right'))
+        bounds.append(max(b, a + 1))
+    return bounds
+
+def stream_pairs_kdtree(xyz, threshold, budget_mb, prof=NULL_PROFILE):
+    """
+    compute_all_pairs_kdtree 的流式版本，返回 (blocks, nn_idx, n_blocks)
+    - blocks: 生成器，按 i 升序逐块产出 (ii, jj)；拼接后与一次性 query_pairs + lexsort 完全相同
+    - 先做一次计数遍历得到每点邻居数，再按 budget_mb 切块；点对工作集不随总对数增长
+      （坐标、KD-tree、最近邻等 O(n) 部分不计入预算）
+    """
+    with prof.timer("tree_build"):
+        tree = cKDTree(xyz)
+    with prof.timer("tree_query"):
+        _, idxs = tree.query(xyz, k=2)
+        counts = tree.query_ball_point(xyz, r=threshold, return_length=True)
+    cap = max(1, int(budget_mb * 1024 * 1024) // STREAM_BYTES_PER_PAIR)
+    bounds = chunk_bounds(counts, cap)
+
+    def blocks():
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            with prof.timer("tree_query"):
+                rec = cKDTree(xyz[a:b]).sparse_distance_matrix(tree, threshold, output_type='ndarray')
+                ii, jj = rec['i'] + a, rec['j']
+                del rec
+                keep = jj > ii
+                ii, jj = ii[keep], jj[keep]
+                order = np.lexsort((jj, ii))
+                ii, jj = ii[order], jj[order]
+            yield ii, jj
+    return blocks(), idxs[:, 1], len(bounds) - 1
+
+# ---------- 空间分解：平板 + halo ----------
+def slab_bounds(xyz, count):
+    """沿跨度最大的轴按分位数切成 count 个 bin 数相近的平板 → (axis, cuts)，cuts 为 count-1 个内部切面"""
+    axis = int(np.argmax(np.ptp(xyz, axis=0)))
+    return axis, np.quantile(xyz[:, axis], np.arange(1, count) / count)
+
+def slab_members(xyz, index, count, threshold):
+    """
+    第 index 个平板（0 起）：返回 (owner, local, axis)
+    - owner: 每个 bin 所属平板；平板 k 拥有切面 [cuts[k-1], cuts[k]) 内的 bin
+    - local: 本平板 bin + 两侧宽 threshold 的 halo（全局下标，升序）
+    点对 (i<j) 归 i 所在平板输出；j 与 i 距离 ≤ threshold，必在 halo 内，故每对恰好输出一次
+    """
+    axis, cuts = slab_bounds(xyz, count)
+    c = xyz[:, axis]
+    owner = np.searchsorted(cuts, c, side='right')
+    lo = cuts[index-1] if index > 0 else -np.inf
+    hi = cuts[index] if index < count - 1 else np.inf
+    halo = threshold * (1 + 1e-9)   # 略放宽，避免切面附近的浮点舍入漏掉邻居
+    local = np.flatnonzero((c >= lo - halo) & (c <= hi + halo))
+    return owner, local, axis
+
+# ---------- 无 KD-tree：NumPy 分块核（--range / 无 scipy） ----------
+BLOCK_TILE = 1024            # 默认 i 块 × j 块边长
+BLOCK_BYTES_PER_CELL = 48    # 每个块内单元的峰值开销估计：坐标差 (3×f8) + 平方和 / 距离 / 掩码临时量
+NN_RTOL = 1e-12              # sqrt 度量与 hypot 度量之差（≤ 数个 ulp）的放宽量：先宽筛再精确复核
+
+def block_tile(budget_mb=None):
+    """块边长；给定 --mem_budget_mb 时按预算取 sqrt(预算 / 单元开销)，限制在 [64, 4096]"""
+    if not budget_mb:
+        return BLOCK_TILE
+    return int(min(4096, max(64, math.isqrt(int(budget_mb * 1024 * 1024) // BLOCK_BYTES_PER_CELL))))
+
+def hypot_distances(xyz, ii, jj):
+    """与原逐对循环 math.hypot(math.hypot(dx, dy), dz) 逐位一致（np.hypot 末位可能不同，故走 math）"""
+    d = xyz[ii] - xyz[jj]
+    return np.fromiter(map(math.hypot, map(math.hypot, d[:, 0].tolist(), d[:, 1].tolist()), d[:, 2].tolist()),
+                       dtype=float, count=len(d))
+
+class RangeSweep:
+    """
+    原 --range / 无 scipy 双重循环的分块向量化版本：i∈[start,end]，j>i，输出逐字节一致
+    - blocks(): 逐 i 块产出 (ii, jj, dist)，块内按 (i,j) 排序；块内用 sqrt 度量宽筛，
+                候选再按原 hypot 度量精确判定 dist<=threshold（写出的 dist 即 hypot 值）
+    - rescue(): blocks() 遍历完后调用，补边语义同原 nearest_dist：
+        范围内无边的 i → j>i 中 hypot 最近者（同距取最小 j），距离为 hypot
+        范围外 j>end 且与范围无边 → 范围内 sqrt 最近的 i（同距取最小 i），行写作 (j, i)
+        两组按此顺序、组内按下标升序；无序对重复时只保留第一次
+    """
+    def __init__(self, xyz, start, end, threshold, tile=BLOCK_TILE, prof=NULL_PROFILE):
+        self.xyz, self.start, self.end, self.threshold = xyz, start, end, threshold
+        self.tile, self.prof = tile, prof
+        n = len(xyz)
+        self.has_edge = np.zeros(n, dtype=bool)
+        self.row_min = np.full(max(end - start + 1, 0), np.inf)   # 每个 i 到 j>i 的最小 sqrt 距离
+        self.col_d = np.full(n - end - 1, np.inf)                 # 每个 j>end 到范围内的最小 sqrt 距离
+        self.col_i = np.full(n - end - 1, -1, dtype=np.int64)
+
+    def blocks(self):
+        xyz, n, T, end = self.xyz, len(self.xyz), self.tile, self.end
+        cut = self.threshold * (1 + NN_RTOL)
+        for a in range(self.start, end + 1, T):
+            b = min(a + T, end + 1)
+            xi = xyz[a:b]
+            rmin = np.full(b - a, np.inf)
+            parts_i, parts_j = [], []
+            with self.prof.timer("block_dist"):
+                for c in range(a + 1, n, T):
+                    e = min(c + T, n)
+                    d = xi[:, None, :] - xyz[None, c:e, :]
+                    D = np.sqrt(d[..., 0]*d[..., 0] + d[..., 1]*d[..., 1] + d[..., 2]*d[..., 2])
+                    del d
+                    if c < b:    # 与对角线相交的块：屏蔽 j<=i
+                        D[np.arange(a, b)[:, None] >= np.arange(c, e)[None, :]] = np.inf
+                    np.minimum(rmin, D.min(axis=1), out=rmin)
+                    li, lj = np.nonzero(D <= cut)
+                    parts_i.append(li + a); parts_j.append(lj + c)
+                    if e - 1 > end:   # 范围外列：按 i 升序逐块更新最近的范围内 i（严格小于才替换 → 同距取最小 i）
+                        k0 = max(c, end + 1) - c
+                        sub = D[:, k0:]
+                        am = sub.argmin(axis=0)
+                        mv = sub[am, np.arange(sub.shape[1])]
+                        g = np.arange(c + k0, e) - (end + 1)
+                        better = mv < self.col_d[g]
+                        self.col_d[g[better]] = mv[better]
+                        self.col_i[g[better]] = am[better] + a
+                ii = np.concatenate(parts_i) if parts_i else np.empty(0, dtype=np.intp)
+                jj = np.concatenate(parts_j) if parts_j else np.empty(0, dtype=np.intp)
+                dist = hypot_distances(xyz, ii, jj)
+                keep = dist <= self.threshold
+                ii, jj, dist = ii[keep], jj[keep], dist[keep]
+                order = np.lexsort((jj, ii))
+                ii, jj, dist = ii[order], jj[order], dist[order]
+            self.has_edge[ii] = True; self.has_edge[jj] = True
+            self.row_min[a - self.start:b - self.start] = rmin
+            yield ii, jj, dist
+
+    def rescue(self):
+        xyz, n, start, end = self.xyz, len(self.xyz), self.start, self.end
+        rows = start + np.flatnonzero(~self.has_edge[start:end + 1] & np.isfinite(self.row_min))
+        ri = rows.astype(np.int64)
+        rj = np.empty(len(rows), dtype=np.int64)
+        rd = np.empty(len(rows))
+        for k, i in enumerate(rows.tolist()):
+            # sqrt 度量的最小值附近宽筛，再按 hypot 度量取最近（argmin 取首个 → 同距取最小 j）
+            js = np.arange(i + 1, n)
+            D = pair_distances(xyz, np.full(len(js), i), js)
+            cand = js[D <= self.row_min[i - start] * (1 + NN_RTOL)]
+            h = hypot_distances(xyz, np.full(len(cand), i), cand)
+            m = int(np.argmin(h))
+            rj[k], rd[k] = cand[m], h[m]
+        cols = np.flatnonzero(~self.has_edge[end + 1:] & (self.col_i >= 0))
+        ci, cj, cd = cols + end + 1, self.col_i[cols], self.col_d[cols]
+        dup = np.isin(np.minimum(ci, cj) * n + np.maximum(ci, cj), np.minimum(ri, rj) * n + np.maximum(ri, rj))
+        ci, cj, cd = ci[~dup], cj[~dup], cd[~dup]
+        return np.concatenate([ri, ci]), np.concatenate([rj, cj]), np.concatenate([rd, cd])
+
+# ---------- 向量化输出 ----------
+def pair_distances(xyz, ii, jj):
+    """
+    与逐对 math.sqrt((x1-x2)**2+...) 逐位一致的批量距离
+    平方用 np.float_power（逐元素调 C 库 pow，同 Python 的 x**2）；d*d / np.power 是精确舍入的乘法，
+    与 pow 的结果在末位可能不同
+    """
+    d = np.float_power(xyz[ii] - xyz[jj], 2.0)
+    return np.sqrt(d[:, 0] + d[:, 1] + d[:, 2])
+
+def nn_rescue_pairs(has_edge, nn_idx):
+    """
+    无阈值内边的点补一条最近邻边；无序对 {i,nb} 只保留 i 最小的一次（与原 added_pairs 逻辑一致）
+    返回 (ii, jj)，ii 升序
+    """
+    n = len(nn_idx)
+    cand = np.flatnonzero(~has_edge & (nn_idx < n))
+    if not len(cand):
+        return cand, cand
+    nb = nn_idx[cand]
+    key = np.minimum(cand, nb).astype(np.int64) * n + np.maximum(cand, nb)
+    _, first = np.unique(key, return_index=True)
+    keep = cand[np.sort(first)]
+    return keep, nn_idx[keep]
+
+def format_pairs(prefix, ii, jj, dists, block=200000):
+    """
+    按块产出 "c1\tl1\tc2\tl2\tdist\n" 文本；prefix[k] = "c\tl"（object 数组）
+    dist 用 repr，与原 f"{dist}" 字节一致
+    """
+    for s in range(0, len(ii), block):
+        e = s + block
+        ds = np.array(list(map(repr, dists[s:e].tolist())), dtype=object)
+        yield "".join(prefix[ii[s:e]] + "\t" + prefix[jj[s:e]] + "\t" + ds + "\n")
+
+def write_pairs(fout, prefix, ii, jj, dists, block=200000):
+    for text in format_pairs(prefix, ii, jj, dists, block):
+        fout.write(text)
+
+class PairSink:
+    """
+    按 --out_format 把 (ii, jj, dist) 批量写往文本 TSV 和/或二进制边存储
+    文本按扩展名压缩（.gz / .zst，后台线程）；均写临时文件，正常结束才改名，异常时丢弃
+    """
+    def __init__(self, output_file, out_format, tab):
+        self.fout = open_text(output_file, 'w') if out_format in ("text","both") else None
+        self.store = EdgeStoreWriter(output_file, tab.nodes()) if out_format in ("binary","both") else None
+        self.prefix = tab.keys("\t") if self.fout else None
+
+    def write(self, ii, jj, dists):
+        if self.fout: write_pairs(self.fout, self.prefix, ii, jj, dists)
+        if self.store: self.store.write(ii, jj, dists)
+
+    def close(self):
+        if self.fout: self.fout.close()
+        if self.store: self.store.close()
+
+    def abort(self):
+        if self.fout: self.fout.abort()
+        if self.store: self.store.abort()
+
+    def __enter__(self): return self
+    def __exit__(self, et, ev, tb):
+        if et is None: self.close()
+        else: self.abort()
+
+# ---------- 增量更新：只重算变化的 bin ----------
+SNAPSHOT_SUFFIX = ".bins.npz"
+INCREMENTAL_MAX_FRAC = 0.25   # 变化 bin 超过该比例时直接全量（修补已不省时）
+
+def snapshot_path(output_file):
+    """X_distance_filtered.txt[.gz] / .edges.bin → X_distance_filtered.bins.npz（与边存储同前缀）"""
+    edges_path, _ = store_paths(output_file)
+    return Path(str(edges_path)[:-len(EDGES_SUFFIX)] + SNAPSHOT_SUFFIX)
+
+def output_files(output_file, out_format):
+    files = [Path(output_file)] if out_format in ("text", "both") else []
+    return files + (list(store_paths(output_file)) if out_format in ("binary", "both") else [])
+
+def write_snapshot(output_file, out_format, tab, threshold, fwd, deg, n_pairs, n_rescue):
+    """
+    本次输出对应的输入快照：bin 键与坐标、每行的前向点对数（以该 bin 为 i 的行数）与度数、点对 / 补边行数，
+    以及输出文件的 size / mtime 指纹（输出被其他途径改写后快照即失效）
+    """
+    st = [f.stat() for f in output_files(output_file, out_format)]
+    path = snapshot_path(output_file)
+    with atomic_output(path) as tmp:
+        np.savez(tmp, keys=tab.keys("\t").astype(str), xyz=np.asarray(tab.xyz, dtype=float),
+                 fwd=np.asarray(fwd, dtype=np.int64), deg=np.asarray(deg, dtype=np.int64),
+                 n_pairs=n_pairs, n_rescue=n_rescue, threshold=threshold, out_format=out_format,
+                 out_size=np.array([x.st_size for x in st], dtype=np.int64),
+                 out_mtime=np.array([x.st_mtime_ns for x in st], dtype=np.int64))
+    return path
+
+def load_snapshot(output_file, out_format, threshold):
+    """→ (快照 dict, None) 或 (None, 不可用原因)"""
+    path = snapshot_path(output_file)
+    if not path.is_file():
+        return None, f"无快照 {path.name}"
+    with np.load(path) as z:
+        snap = {k: z[k] for k in z.files}
+    if float(snap['threshold']) != threshold or str(snap['out_format']) != out_format:
+        return None, "阈值或输出格式与快照不同"
+    files = output_files(output_file, out_format)
+    if not all(f.is_file() for f in files):
+        return None, "输出文件缺失"
+    st = [f.stat() for f in files]
+    if [x.st_size for x in st] != snap['out_size'].tolist() or [x.st_mtime_ns for x in st] != snap['out_mtime'].tolist():
+        return None, "输出文件在快照之后被改动"
+    return snap, None
+
+def ball_neighbors(tree, pts, r):
+    """每个查询点半径 r 内的点（拉平）→ (查询序号, 邻居下标)"""
+    if not len(pts):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    lists = tree.query_ball_point(pts, r=r)
+    cnt = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    nb = np.fromiter(itertools.chain.from_iterable(lists), dtype=np.int64, count=int(cnt.sum()))
+    return np.repeat(np.arange(len(lists)), cnt), nb
+
+class LineCursor:
+    """
+    二进制行流的顺序游标（按行数消费）：copy(k, out) 原样拷贝 k 行；take(k) 返回 k 行（bytes，不含换行）
+    换行位置按块用 NumPy 一次定位，逐行的 Python 开销只发生在 take 的行上
+    """
+    def __init__(self, fh, chunk=1 << 22):
+        self.fh, self.chunk = fh, chunk
+        self.buf, self.nl, self.pos, self.li = b"", np.empty(0, dtype=np.int64), 0, 0
+
+    def _fill(self):
+        data = self.fh.read(self.chunk)
+        if not data:
+            raise ValueError("距离文件行数少于快照记录")
+        self.buf = self.buf[self.pos:] + data
+        self.nl = np.flatnonzero(np.frombuffer(self.buf, dtype=np.uint8) == 10)
+        self.pos = self.li = 0
+
+    def _lines(self, k, sink):
+        while k > 0:
+            avail = len(self.nl) - self.li
+            if not avail:
+                self._fill(); continue
+            t = min(k, avail)
+            end = int(self.nl[self.li + t - 1]) + 1
+            sink(self.buf[self.pos:end])
+            self.pos, self.li, k = end, self.li + t, k - t
+
+    def copy(self, k, out):
+        self._lines(k, out.write)
+
+    def take(self, k):
+        parts = []
+        self._lines(k, parts.append)
+        return b"".join(parts).split(b"\n")[:-1]
+
+class DistancePatch:
+    """
+    新 cluster 表相对快照的增量更新（输出与 KD-tree 全量重算逐字节一致）
+    按键 (homolog, locus) 对齐新旧 bin：坐标逐位相同为不变；其余新下标记为 fresh（新增 / 改动），
+    旧下标记为 stale（删除 / 改动）
+    - 新点对：只用 fresh bin 查询新坐标的 KD-tree，i<j 去重后按 (i,j) 排序
+    - 旧点对：只删除触及 stale bin 的行，其余原样保留（不变 bin 相对顺序不变 → 旧行的 (i,j) 顺序不变）
+    - 补边：度数由快照增量维护，只对无边 bin 查询最近邻，再走 nn_rescue_pairs（同全量）
+    reason 非空时不可增量（键不唯一、不变 bin 相对顺序改变、变化比例过大），由调用方全量计算
+    """
+    def __init__(self, snap, tab, threshold, prof=NULL_PROFILE):
+        self.threshold, self.prof = threshold, prof
+        self.keys_old, self.xyz_old = snap['keys'], snap['xyz']
+        self.fwd_old, self.deg_old = snap['fwd'], snap['deg']
+        self.n_pairs_old, self.n_rescue_old = int(snap['n_pairs']), int(snap['n_rescue'])
+        self.prefix = tab.keys("\t")
+        self.xyz = np.asarray(tab.xyz, dtype=float)
+        n, n_old = len(self.xyz), len(self.keys_old)
+        self.reason = None
+        uniq, inv = np.unique(np.concatenate([self.keys_old, self.prefix.astype(str)]), return_inverse=True)
+        if len(np.unique(inv[:n_old])) != n_old or len(np.unique(inv[n_old:])) != n:
+            self.reason = "bin 键不唯一"; return
+        lookup = np.full(len(uniq), -1, dtype=np.int64)
+        lookup[inv[:n_old]] = np.arange(n_old)
+        self.new_to_old = lookup[inv[n_old:]]
+        m = self.new_to_old >= 0
+        self.same = np.zeros(n, dtype=bool)
+        self.same[m] = (self.xyz[m] == self.xyz_old[self.new_to_old[m]]).all(axis=1)
+        self.kept_new = np.flatnonzero(self.same)
+        self.kept_old = self.new_to_old[self.kept_new]
+        self.old_to_new = np.full(n_old, -1, dtype=np.int64)
+        self.old_to_new[self.kept_old] = self.kept_new
+        self.fresh = np.flatnonzero(~self.same)
+        self.stale = np.flatnonzero(self.old_to_new < 0)
+        self.n_added = int((~m).sum())
+        self.n_changed = len(self.fresh) - self.n_added
+        self.n_removed = len(self.stale) - self.n_changed
+        if np.any(np.diff(self.kept_old) <= 0):
+            self.reason = "不变 bin 的相对顺序改变"
+        elif n < 2:
+            self.reason = "bin 少于 2 个"
+        elif len(self.fresh) + len(self.stale) > INCREMENTAL_MAX_FRAC * n:
+            self.reason = f"变化 bin 过多（{len(self.fresh)} 新增/改动，{len(self.stale)} 删除/改动，共 {n}）"
+
+    @property
+    def changed(self):
+        return bool(len(self.fresh) or len(self.stale))
+
+    def query(self):
+        """新点对 (ni, nj, nd) 与需要解析的旧行组（旧下标：含待删行或待插入行的不变 bin）"""
+        xyz, n = self.xyz, len(self.xyz)
+        with self.prof.timer("tree_build"):
+            self.tree = cKDTree(xyz)
+        with self.prof.timer("tree_query"):
+            q, nb = ball_neighbors(self.tree, xyz[self.fresh], self.threshold)
+            a = self.fresh[q]
+            keep = nb != a
+            lo, hi = np.minimum(a[keep], nb[keep]), np.maximum(a[keep], nb[keep])
+            key = np.unique(lo * n + hi)
+            self.ni, self.nj = key // n, key % n
+            self.nd = pair_distances(xyz, self.ni, self.nj)
+            # 旧文件中 (不变 i, stale j>i) 的行位于行组 i：用 stale bin 的旧坐标查新树（不变 bin 坐标未变），略放宽半径取超集
+            q, nb = ball_neighbors(self.tree, self.xyz_old[self.stale], self.threshold * (1 + 1e-9))
+            nb_old = np.where(self.same[nb], self.new_to_old[nb], -1)
+            hit = (nb_old >= 0) & (nb_old < self.stale[q])
+            recv = self.ni[self.same[self.ni]]
+            self.special = np.union1d(nb_old[hit], self.new_to_old[recv])
+
+    def rescue(self, dropped_inc, dropped_fwd):
+        """按删去的旧行修正度数，对无边 bin 补最近邻边 → (ri, rj, rd)；同时得到新快照的 fwd / deg"""
+        xyz, n = self.xyz, len(self.xyz)
+        fwd = np.zeros(n, dtype=np.int64); deg = np.zeros(n, dtype=np.int64)
+        fwd[self.kept_new] = self.fwd_old[self.kept_old] - dropped_fwd[self.kept_old]
+        deg[self.kept_new] = self.deg_old[self.kept_old] - dropped_inc[self.kept_old]
+        fwd += np.bincount(self.ni, minlength=n)
+        deg += np.bincount(self.ni, minlength=n) + np.bincount(self.nj, minlength=n)
+        self.fwd, self.deg = fwd, deg
+        has_edge = deg > 0
+        nn_idx = np.full(n, n, dtype=np.int64)
+        cand = np.flatnonzero(~has_edge)
+        with self.prof.timer("nn_rescue"):
+            if len(cand):
+                _, idx = self.tree.query(xyz[cand], k=2)
+                nn_idx[cand] = idx[:, 1]
+            ri, rj = nn_rescue_pairs(has_edge, nn_idx)
+        return ri, rj, pair_distances(xyz, ri, rj)
+
+    def patch_binary(self, output_file, nodes, finish):
+        """边存储：memmap 旧记录，删去触及 stale 的点对、下标重映射，新点对按 (i,j) 插入，补边整体替换"""
+        n, n_old = len(self.xyz), len(self.keys_old)
+        rec = open_edges(output_file)[:self.n_pairs_old]
+        u, v = rec['u'].astype(np.int64), rec['v'].astype(np.int64)
+        nu, nv = self.old_to_new[u], self.old_to_new[v]
+        keep = (nu >= 0) & (nv >= 0)
+        du, dv = u[~keep & (nu >= 0)], v[~keep & (nv >= 0)]
+        dropped_fwd = np.bincount(du, minlength=n_old)
+        ri, rj, rd = finish(dropped_fwd + np.bincount(dv, minlength=n_old), dropped_fwd)
+        nu, nv = nu[keep], nv[keep]
+        pos = np.searchsorted(nu * n + nv, self.ni * n + self.nj)
+        with self.prof.timer("write"), EdgeStoreWriter(output_file, nodes) as store:
+            store.write(np.insert(nu, pos, self.ni), np.insert(nv, pos, self.nj),
+                        np.insert(rec['d'][keep], pos, self.nd))
+            store.write(ri, rj, rd)
+        return len(nu) + len(self.ni)
+
+    def patch_text(self, output_file, finish):
+        """
+        文本：未受影响的行组整段原样拷贝；含待删 / 待插入行的不变 bin 行组解析后合并重写；stale bin 的行组解析后丢弃；
+        旧补边行整体替换。只有受影响行组的行被逐行处理
+        """
+        n_old = len(self.keys_old)
+        cum = np.concatenate([[0], np.cumsum(self.fwd_old)])
+        new_index = {k.encode(): i for i, k in enumerate(self.prefix.tolist())}
+        same, new_to_old, stale, prefix = self.same, self.new_to_old, self.stale, self.prefix
+        dropped_inc = np.zeros(n_old, dtype=np.int64); dropped_fwd = np.zeros(n_old, dtype=np.int64)
+        events = np.union1d(self.old_to_new[self.special], self.ni[~same[self.ni]])
+        n_lines, o = 0, 0
+
+        def parse(o):
+            """旧行组 o → [(j 的新下标，stale 为 -1, 行)]"""
+            key = self.keys_old[o].encode()
+            rows = []
+            for ln in cur.take(int(self.fwd_old[o])):
+                f = ln.split(b"\t", 4)
+                if len(f) != 5 or f[0] + b"\t" + f[1] != key:
+                    raise ValueError(f"距离文件第 {o} 组与快照不一致")
+                j = new_index.get(f[2] + b"\t" + f[3], -1)
+                rows.append((j if j >= 0 and same[j] else -1, ln))
+            return rows
+
+        def advance(o_stop):
+            """消费旧行组 [o, o_stop)：不变 bin 的整段拷贝，stale bin 的解析后丢弃（记下对端不变 bin 少掉的度数）"""
+            nonlocal o, n_lines
+            if o_stop <= o: return
+            for s in stale[np.searchsorted(stale, o):np.searchsorted(stale, o_stop)].tolist():
+                cur.copy(int(cum[s] - cum[o]), out); n_lines += int(cum[s] - cum[o])
+                for j, _ in parse(s):
+                    if j >= 0: dropped_inc[new_to_old[j]] += 1
+                o = s + 1
+            cur.copy(int(cum[o_stop] - cum[o]), out); n_lines += int(cum[o_stop] - cum[o])
+            o = o_stop
+
+        with open_binary(output_file, 'r') as fin, open_binary(output_file) as out:
+            cur = LineCursor(fin)
+            for i in events.tolist():
+                if same[i]:
+                    oi = int(new_to_old[i])
+                    advance(oi)
+                    rows = parse(oi)
+                    kept = [(j, ln) for j, ln in rows if j >= 0]
+                    dropped_inc[oi] += len(rows) - len(kept); dropped_fwd[oi] += len(rows) - len(kept)
+                    o = oi + 1
+                else:
+                    c = int(np.searchsorted(self.kept_new, i))
+                    if c: advance(int(self.kept_old[c - 1]) + 1)
+                    kept = []
+                a, b = np.searchsorted(self.ni, [i, i + 1])
+                text = "".join(format_pairs(prefix, self.ni[a:b], self.nj[a:b], self.nd[a:b]))
+                add = list(zip(self.nj[a:b].tolist(), text.encode().split(b"\n")[:-1]))
+                merged = sorted(kept + add, key=lambda r: r[0])
+                out.write(b"".join(ln + b"\n" for _, ln in merged)); n_lines += len(merged)
+            advance(n_old)                 # 其后只剩旧补边行，不再读取
+            ri, rj, rd = finish(dropped_inc, dropped_fwd)
+            for text in format_pairs(prefix, ri, rj, rd):
+                out.write(text.encode())
+        return n_lines
+
+    def run(self, output_file, out_format, nodes):
+        """修补输出 → (点对行数, 补边行数)；无变化时不改动输出"""
+        self.query()
+        if not self.changed:
+            self.fwd, self.deg = self.fwd_old, self.deg_old
+            return self.n_pairs_old, self.n_rescue_old
+        done = {}
+        def finish(dropped_inc, dropped_fwd):
+            if 'r' not in done:
+                done['r'] = self.rescue(dropped_inc, dropped_fwd)
+            return done['r']
+        if out_format in ("binary", "both"):
+            n_pairs = self.patch_binary(output_file, nodes, finish)
+        if out_format in ("text", "both"):
+            with self.prof.timer("write"):
+                n_pairs = self.patch_text(output_file, finish)
+        return n_pairs, len(done['r'][0])
 
 # ---------- 主流程 ----------
-def main():
+def main(argv=None):
     ap = argparse.ArgumentParser(description="Whole-genome pairwise distances (dual formats)")
     ap.add_argument("input_file", help="*.euchromatin_cluster.txt 或 *.h3k4me3_cluster.txt")
-    ap.add_argument("output_file", help="输出文件路径（由批脚本放到 dual_euchr/dual_h3k4）")
+    ap.add_argument("output_file", help="输出文件路径（由批脚本放到 dual_euchr/dual_h3k4）；以 .gz / .zst 结尾时压缩写出")
     ap.add_argument("--source_label", type=str, default=None, help="euchr/h3k4；若不传则自动判定")
     ap.add_argument("--range", type=int, nargs=2, metavar=('START','END'),
                     help="可选：仅处理 i∈[START,END] 的bin（分块计算用）")
+    ap.add_argument("--slab", type=int, nargs=2, metavar=('INDEX','COUNT'),
+                    help="可选：空间分块（需 scipy）。沿最长轴切 COUNT 个平板，仅输出第 INDEX 个（0 起）平板拥有的点对；"
+                         "结果同 --range 用 merge_distance_parts_dual.py 合并并做全局最近邻补边")
     ap.add_argument("--threshold", type=float, default=5.0,
                     help="距离阈值（默认5.0）")
-    args = ap.parse_args()
+    ap.add_argument("--out_format", default="text", choices=["text","binary","both"],
+                    help="text=TSV；binary=同前缀 .edges.bin + .nodes.tsv（int32/float64，可 memmap）；both=两者")
+    ap.add_argument("--sorted_index", action="store_true",
+                    help="另存按距离排序的 .edges.sorted.bin + 阈值偏移索引（需 --out_format binary/both）；"
+                         "analyze_graph 读该文件时只读所需前缀")
+    ap.add_argument("--mem_budget_mb", type=float, default=None,
+                    help="KD-tree 模式按块流式枚举并边算边写，点对工作集不超过该预算（MB）；默认一次性在内存中枚举。"
+                         "--range / 无 scipy 时按该预算确定 NumPy 分块边长（默认 1024）")
+    ap.add_argument("--incremental", action="store_true",
+                    help="增量模式（KD-tree）：输出旁保存输入快照 *.bins.npz；再次运行时若快照与输出一致，"
+                         "只对新增 / 改动 / 删除的 bin 重算并修补已有输出，否则全量计算")
+    ap.add_argument("--sample_dir", default=None,
+                    help="样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("distance", argv)
 
     script_dir = Path(__file__).resolve().parent
-    sample_dir = ascend_to_sample_dir(script_dir)
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
     sample_name = sample_dir.name
 
     # 读取与格式判定
-    coords = []  # [(chrom_label, locus, x, y, z)]
-    with open(args.input_file, 'r', encoding='utf-8') as fin:
-        first = fin.readline()
-        fmt, has_header, locus_idx = detect_format_from_file(first)
-        if args.source_label:
-            if args.source_label not in ("euchr","h3k4"):
-                print("[ERROR] --source_label 只能是 euchr/h3k4", file=sys.stderr); sys.exit(2)
-            fmt = args.source_label  # 以显式为准
-        if not has_header:
-            fin.seek(0)
-        for line in fin:
-            if not line.strip(): continue
-            parts = line.split()
-            parsed = parse_line(parts, fmt)
-            if parsed is None: continue
-            coords.append(parsed)
-
-    n = len(coords)
+    if args.source_label and args.source_label not in ("euchr","h3k4"):
+        print("[ERROR] --source_label 只能是 euchr/h3k4", file=sys.stderr); sys.exit(2)
+    with prof.timer("parse"):
+        tab, cache_state = load_cluster_table(args.input_file, args.source_label)
+    fmt, locus_idx = tab.fmt, tab.locus_idx
+
+    n = len(tab)
     if n == 0:
         print(f"[Info] No data points in {args.input_file}")
         sys.exit(0)
 
     threshold = args.threshold
+    use_slab = args.slab is not None
+    if use_slab:
+        if args.range is not None:
+            ap.error("--range 与 --slab 不能同时使用")
+        if not 0 <= args.slab[0] < args.slab[1]:
+            ap.error("--slab 需满足 0 ≤ INDEX < COUNT")
+        if cKDTree is None:
+            print("[ERROR] --slab 需要 scipy（cKDTree）；无 scipy 时请用 --range", file=sys.stderr); sys.exit(2)
     use_range = args.range is not None
     start_idx, end_idx = (args.range if use_range else (0, n-1))
     if start_idx < 0: start_idx = 0
     if end_idx >= n: end_idx = n-1
 
+    use_kdtree = (not use_range) and (not use_slab) and cKDTree is not None
+    if args.out_format != "text" and not use_kdtree:
+        print("[ERROR] --out_format binary/both 仅支持 KD-tree 模式；分块结果请用 merge_distance_parts_dual.py 输出",
+              file=sys.stderr); sys.exit(2)
+    if args.sorted_index and args.out_format == "text":
+        print("[ERROR] --sorted_index 需要 --out_format binary/both", file=sys.stderr); sys.exit(2)
+    if args.incremental and not use_kdtree:
+        print("[ERROR] --incremental 仅支持 KD-tree 全量模式（需 scipy，不能与 --range / --slab 同用）",
+              file=sys.stderr); sys.exit(2)
+
     pairs_written = 0
     added_nn = 0
+    n_blocks = None
+    slab_info = None
+    tile = None
+    fwd = deg = None     # 增量快照：每行前向点对数与度数
 
-    with open(args.output_file, 'w', encoding='utf-8') as fout:
-        if (not use_range) and cKDTree:
-            print(f"[Info] KD-tree all-pairs ≤ {threshold}")
-            pairs, nearest_info = compute_all_pairs_kdtree(coords, threshold)
-            for i, j in pairs:
-                c1, l1, x1, y1, z1 = coords[i]
-                c2, l2, x2, y2, z2 = coords[j]
-                dist = math.sqrt((x1-x2)**2 + (y1-y2)**2 + (z1-z2)**2)
-                fout.write(f"{c1}\t{l1}\t{c2}\t{l2}\t{dist}\n")
-                pairs_written += 1
-            has_edge = [False]*n
-            for i,j in pairs:
-                has_edge[i]=True; has_edge[j]=True
-            added_pairs=set()
-            for i,(d,nb) in enumerate(nearest_info):
-                if not has_edge[i] and nb is not None:
-                    key = tuple(sorted((i,nb)))
-                    if key in added_pairs: continue
-                    added_pairs.add(key)
-                    c1, l1, x1, y1, z1 = coords[i]
-                    c2, l2, x2, y2, z2 = coords[nb]
-                    dist = math.sqrt((x1-x2)**2 + (y1-y2)**2 + (z1-z2)**2)
-                    fout.write(f"{c1}\t{l1}\t{c2}\t{l2}\t{dist}\n")
-                    pairs_written += 1; added_nn += 1
-        else:
-            if use_range:
-                print(f"[Info] Brute-force range i∈[{start_idx},{end_idx}] (thr={threshold})")
+    patch = None
+    if args.incremental:
+        snap, why = load_snapshot(args.output_file, args.out_format, threshold)
+        if snap is not None:
+            patch = DistancePatch(snap, tab, threshold, prof)
+            why = patch.reason
+        if why:
+            print(f"[Info] 增量不可用（{why}），全量计算"); patch = None
+    if patch is not None:
+        print(f"[Info] KD-tree incremental ≤ {threshold} ({len(patch.fresh)} fresh / {len(patch.stale)} stale bins)")
+        try:
+            pairs_written, added_nn = patch.run(args.output_file, args.out_format, tab.nodes())
+            pairs_written += added_nn
+            fwd, deg = patch.fwd, patch.deg
+        except ValueError as e:
+            print(f"[WARN] 增量修补失败（{e}），改为全量计算", file=sys.stderr); patch = None
+
+    if patch is None:
+        with PairSink(args.output_file, args.out_format, tab) as sink:
+            if use_kdtree and args.mem_budget_mb:
+                print(f"[Info] KD-tree streaming pairs ≤ {threshold} (budget {args.mem_budget_mb:g} MB)")
+                xyz = tab.xyz
+                blocks, nn_idx, n_blocks = stream_pairs_kdtree(xyz, threshold, args.mem_budget_mb, prof)
+                has_edge = np.zeros(n, dtype=bool)
+                fwd = np.zeros(n, dtype=np.int64); deg = np.zeros(n, dtype=np.int64)
+                for ii, jj in blocks:
+                    with prof.timer("write"):
+                        sink.write(ii, jj, pair_distances(xyz, ii, jj))
+                    has_edge[ii] = True; has_edge[jj] = True
+                    fwd += np.bincount(ii, minlength=n); deg += np.bincount(jj, minlength=n)
+                    pairs_written += len(ii)
+                deg += fwd
+                with prof.timer("nn_rescue"):
+                    ri, rj = nn_rescue_pairs(has_edge, nn_idx)
+                with prof.timer("write"):
+                    sink.write(ri, rj, pair_distances(xyz, ri, rj))
+                pairs_written += len(ri); added_nn += len(ri)
+            elif use_slab:
+                k, count = args.slab
+                xyz = tab.xyz
+                owner, local, axis = slab_members(xyz, k, count, threshold)
+                owned = int((owner == k).sum())
+                slab_info = (k, count, "xyz"[axis], owned, len(local) - owned)
+                print(f"[Info] KD-tree slab {k}/{count} (axis {slab_info[2]}, {owned} owned + {slab_info[4]} halo bins, thr={threshold})")
+                if len(local) < 2:
+                    blocks = []
+                elif args.mem_budget_mb:
+                    blocks, _, n_blocks = stream_pairs_kdtree(xyz[local], threshold, args.mem_budget_mb, prof)
+                else:
+                    pairs, _ = compute_all_pairs_kdtree(xyz[local], threshold, prof)
+                    blocks = [(pairs[:, 0], pairs[:, 1])]
+                # 局部下标 → 全局下标（local 升序，i<j 与字典序保持不变）；只保留 i 归本平板的点对
+                # 不补最近邻：无边 bin 的全局最近邻可能在 halo 之外，由 merge_distance_parts_dual.py 统一补
+                for li, lj in blocks:
+                    ii, jj = local[li], local[lj]
+                    keep = owner[ii] == k
+                    ii, jj = ii[keep], jj[keep]
+                    with prof.timer("write"):
+                        sink.write(ii, jj, pair_distances(xyz, ii, jj))
+                    pairs_written += len(ii)
+            elif use_kdtree:
+                print(f"[Info] KD-tree all-pairs ≤ {threshold}")
+                xyz = tab.xyz
+                pairs, nn_idx = compute_all_pairs_kdtree(xyz, threshold, prof)
+                ii, jj = pairs[:, 0], pairs[:, 1]
+                with prof.timer("write"):
+                    sink.write(ii, jj, pair_distances(xyz, ii, jj))
+                pairs_written += len(ii)
+                fwd = np.bincount(ii, minlength=n); deg = fwd + np.bincount(jj, minlength=n)
+                with prof.timer("nn_rescue"):
+                    has_edge = np.zeros(n, dtype=bool)
+                    has_edge[ii] = True; has_edge[jj] = True
+                    ri, rj = nn_rescue_pairs(has_edge, nn_idx)
+                with prof.timer("write"):
+                    sink.write(ri, rj, pair_distances(xyz, ri, rj))
+                pairs_written += len(ri); added_nn += len(ri)
             else:
-                print(f"[Info] cKDTree unavailable, brute-force all (thr={threshold})")
-            nearest_dist = {}  # i -> (min_dist, j)
-            for i in range(start_idx, end_idx+1):
-                c1, l1, x1, y1, z1 = coords[i]
-                min_dist = float('inf'); min_j = None
-                for j in range(i+1, n):
-                    _, l2, x2, y2, z2 = coords[j]
-                    dist = math.hypot(math.hypot(x1-x2, y1-y2), z1-z2)
-                    if dist <= threshold:
-                        fout.write(f"{c1}\t{l1}\t{coords[j][0]}\t{l2}\t{dist}\n")
-                        pairs_written += 1
-                        nearest_dist[i] = (0, None)
-                        nearest_dist[j] = (0, None)
-                    if dist < min_dist:
-                        min_dist = dist; min_j = j
-                if i not in nearest_dist:
-                    nearest_dist[i] = (min_dist, min_j)
-            for j in range(end_idx+1, n):
-                if j not in nearest_dist or nearest_dist[j][0] != 0:
-                    min_dist = float('inf'); min_i = None
-                    for i in range(start_idx, end_idx+1):
-                        dx = coords[i][2] - coords[j][2]
-                        dy = coords[i][3] - coords[j][3]
-                        dz = coords[i][4] - coords[j][4]
-                        dist = math.sqrt(dx*dx + dy*dy + dz*dz)
-                        if dist < min_dist:
-                            min_dist = dist; min_i = i
-                    if j not in nearest_dist or min_dist < nearest_dist[j][0]:
-                        nearest_dist[j] = (min_dist, min_i)
-            added_pairs=set()
-            for i,(dist,nb) in nearest_dist.items():
-                if dist == 0 or nb is None: continue
-                key = tuple(sorted((i,nb)))
-                if key in added_pairs: continue
-                added_pairs.add(key)
-                c1, l1 = coords[i][0], coords[i][1]
-                c2, l2 = coords[nb][0], coords[nb][1]
-                fout.write(f"{c1}\t{l1}\t{c2}\t{l2}\t{dist}\n")
-                pairs_written += 1; added_nn += 1
+                tile = block_tile(args.mem_budget_mb)
+                if use_range:
+                    print(f"[Info] Blocked NumPy range i∈[{start_idx},{end_idx}] (thr={threshold}, tile={tile})")
+                else:
+                    print(f"[Info] cKDTree unavailable, blocked NumPy all-pairs (thr={threshold}, tile={tile})")
+                sweep = RangeSweep(tab.xyz, start_idx, end_idx, threshold, tile, prof)
+                for ii, jj, dist in sweep.blocks():
+                    with prof.timer("write"):
+                        sink.write(ii, jj, dist)
+                    pairs_written += len(ii)
+                with prof.timer("nn_rescue"):
+                    ri, rj, rd = sweep.rescue()
+                with prof.timer("write"):
+                    sink.write(ri, rj, rd)
+                pairs_written += len(ri); added_nn += len(ri)
+
+    sorted_out = None
+    if args.sorted_index and not (patch is not None and not patch.changed and sorted_paths(args.output_file)[1].is_file()):
+        with prof.timer("sort_index"):
+            sorted_out = write_sorted_store(args.output_file)
+    snap_path = None
+    if args.incremental:
+        with prof.timer("snapshot"):
+            snap_path = write_snapshot(args.output_file, args.out_format, tab, threshold, fwd, deg,
+                                       pairs_written - added_nn, added_nn)
+
+    mode = 'KD-tree' if use_kdtree else ('range' if use_range else ('slab' if use_slab else 'bruteforce'))
+    if slab_info:
+        mode += f" {slab_info[0]}/{slab_info[1]} (axis {slab_info[2]}, owned {slab_info[3]}, halo {slab_info[4]})"
+    if tile is not None:
+        mode += f" blocked NumPy (tile {tile})"
+    if n_blocks is not None:
+        mode += f" streaming ({n_blocks} blocks, budget {args.mem_budget_mb:g} MB)"
+    if patch is not None:
+        mode += (f" incremental (changed {patch.n_changed}, added {patch.n_added}, removed {patch.n_removed})"
+                 if patch.changed else " incremental (no change)")
+    prof.count(bins=n, range_start=start_idx, range_end=end_idx, pairs=pairs_written - added_nn,
+               nn_added=added_nn, threshold=threshold, mode=mode, bin_cache=cache_state,
+               mem_budget_mb=args.mem_budget_mb)
+    prof_path = prof.write(args.output_file)
 
     # -------- REPORT：输出存储结构 --------
     print("\n=== Calculate_distance_whole_dual REPORT ===")
@@ -186,11 +740,22 @@ def main():
     print(f"Script dir  : {script_dir}")
     print(f"Input file  : {Path(args.input_file).resolve()}")
     print(f"Format      : {fmt} (locus_col={locus_idx})")
-    print(f"Mode        : {'KD-tree' if (not use_range and cKDTree) else ('range' if use_range else 'bruteforce')}")
+    print(f"Bin cache   : {cache_state}")
+    print(f"Mode        : {mode}")
     print(f"Threshold   : {threshold}")
     print(f"Bins        : {n}  | Range: [{start_idx},{end_idx}]")
-    print(f"Output file : {Path(args.output_file).resolve()}")
+    if args.out_format in ("text","both"):
+        print(f"Output file : {Path(args.output_file).resolve()}")
+    if args.out_format in ("binary","both"):
+        edges_path, nodes_path = store_paths(args.output_file)
+        print(f"Edge store  : {edges_path.resolve()} (+ {nodes_path.name})")
+    if sorted_out:
+        print(f"Sorted store: {sorted_out[0].resolve()} (+ {sorted_out[1].name}, {sorted_out[2]} thresholds)")
     print(f"Pairs<=thr  : {pairs_written}  | Added NN: {added_nn}")
+    if snap_path:
+        print(f"Snapshot    : {snap_path.resolve()}")
+    if prof_path:
+        print(f"Profile     : {prof_path.resolve()}")
     print("===========================================\n")
 
 if __name__ == "__main__":
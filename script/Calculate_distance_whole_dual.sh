@@ -2,9 +2,32 @@
 # Calculate_distance_whole_dual.sh
 # Usage: bash Calculate_distance_whole_dual.sh [NUM_TASKS]
 # NUM_TASKS≤1: 单任务，用KD-tree；>1：切分为NUM_TASKS个SLURM任务
+# OUT_FORMAT=text|binary|both（默认 text）：binary 另存 *_distance_filtered.edges.bin + .nodes.tsv
+# MEM_BUDGET_MB=N（可选）：KD-tree 按块流式枚举，点对工作集不超过 N MB（单任务与 slab 任务）；range 任务按 N 确定分块边长
+# SPLIT_MODE=range|slab（默认 range，NUM_TASKS>1 时生效）：
+#   range = 按 bin 下标切分，边界按 j>i 三角的点对数均分（早段任务的 i 更少），每任务 NumPy 分块计算；
+#   slab = 沿最长轴切空间平板 + 宽 threshold 的 halo，每任务只建本平板局部 KD-tree；两者都由 merge 作业去重并做全局最近邻补边
+# COMPRESS=none|gz|zst（默认 none）：文本距离文件（含 partial）写成 .txt.gz / .txt.zst（后台线程压缩）
+# SORTED_INDEX=1（需 OUT_FORMAT=binary/both）：另存按距离排序的 *_distance_filtered.edges.sorted.bin + 阈值索引，
+#   cluster_and_merge_whole_dual.sh 的各阈值作业只读 d≤thr 的前缀（分块时由 merge 作业生成）
+# INCREMENTAL=1（仅单任务）：输出旁保存输入快照，cluster 文件只改动少数 bin 时只重算这些 bin 并修补已有输出
+# 所有输出先写同目录临时文件，成功后才改名；作业被杀不会留下截断的距离文件
 set -euo pipefail
 
 TASKS=${1:-1}
+OUT_FORMAT="${OUT_FORMAT:-text}"
+MEM_BUDGET_MB="${MEM_BUDGET_MB:-}"
+SPLIT_MODE="${SPLIT_MODE:-range}"
+INCREMENTAL="${INCREMENTAL:-}"
+SORTED_INDEX="${SORTED_INDEX:-}"
+[[ -z "$SORTED_INDEX" || "$OUT_FORMAT" != "text" ]] || { echo "ERROR: SORTED_INDEX=1 需要 OUT_FORMAT=binary/both" >&2; exit 1; }
+[[ "$SPLIT_MODE" == "range" || "$SPLIT_MODE" == "slab" ]] || { echo "ERROR: SPLIT_MODE 只能是 range/slab" >&2; exit 1; }
+COMPRESS="${COMPRESS:-none}"
+case "$COMPRESS" in
+  none) TXT_EXT=".txt" ;;
+  gz|zst) TXT_EXT=".txt.${COMPRESS}" ;;
+  *) echo "ERROR: COMPRESS 只能是 none/gz/zst" >&2; exit 1 ;;
+esac
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 BASE_DIR="$(dirname "$SCRIPT_DIR")"
 
@@ -41,6 +64,20 @@ count_bins() {
   awk 'NR==1{if($1=="homolog"||$1=="chrom") next}{c++}END{print c+0}' "$f"
 }
 
+# 按点对数均分 [0,n)：第 i 行的工作量为 n-1-i（j>i），前 c 行累计 C(c)=c(n-1)-c(c-1)/2；
+# 第 t 个边界取 C(c)=t/T·n(n-1)/2 的根。每行输出一个 "start end"（闭区间），空区间跳过
+balanced_ranges() {
+  awk -v n="$1" -v T="$2" 'BEGIN{
+    b = 2*n - 1; tot = n*(n-1)/2; prev = 0
+    for (t = 1; t <= T; t++) {
+      cut = (t == T) ? n : int((b - sqrt(b*b - 8*tot*t/T))/2 + 0.5)
+      if (cut > n) cut = n
+      if (cut <= prev) continue
+      print prev, cut - 1; prev = cut
+    }
+  }'
+}
+
 echo "========== PLAN（输入读取结构） =========="
 echo "Sample name : ${SAMPLE_NAME}"
 echo "Sample dir  : ${SAMPLE_DIR}"
@@ -51,6 +88,11 @@ echo "Outputs:"
 echo "  euchr → ${OUT_EU}"
 echo "  h3k4 → ${OUT_H3}"
 echo "Tasks per file: ${TASKS}"
+echo "Split mode    : ${SPLIT_MODE}"
+echo "Out format    : ${OUT_FORMAT}"
+echo "Mem budget MB : ${MEM_BUDGET_MB:-none (in-memory)}"
+echo "Incremental   : ${INCREMENTAL:-off}"
+echo "Sorted index  : ${SORTED_INDEX:-off}"
 echo "========================================="
 
 submit_one() {
@@ -66,26 +108,34 @@ submit_one() {
     base="${fname%.h3k4me3_cluster.txt}"
   fi
 
-  echo "[WholeGenome-${label}] Computing distances for $fname (tasks=$TASKS)…"
+  echo "[WholeGenome-${label}] Computing distances for $fname (tasks=$TASKS, split=$SPLIT_MODE)…"
   if [[ ${TASKS} -le 1 ]]; then
-    local out_file="${outroot}/${base}_distance_filtered.txt"
+    local out_file="${outroot}/${base}_distance_filtered${TXT_EXT}"
     python3 "${SCRIPT_DIR}/Calculate_distance_whole_dual.py" \
-      "$infile" "$out_file" --source_label "$label"
+      "$infile" "$out_file" --source_label "$label" --out_format "$OUT_FORMAT" \
+      ${MEM_BUDGET_MB:+--mem_budget_mb "$MEM_BUDGET_MB"} ${INCREMENTAL:+--incremental} ${SORTED_INDEX:+--sorted_index}
     [[ $? -eq 0 ]] || { echo "[Error] compute failed for $fname"; exit 1; }
   else
-    local total_bins bins_per_task part_dir
+    local total_bins part_dir
+    local -a ranges=()
     total_bins=$(count_bins "$infile")
-    bins_per_task=$(( (total_bins + TASKS - 1) / TASKS ))
+    [[ "$SPLIT_MODE" == "slab" ]] || mapfile -t ranges < <(balanced_ranges "$total_bins" "$TASKS")
     part_dir="${outroot}/partial_${base}"
     mkdir -p "$part_dir"
+    local deps=() part_list=""
 
     for (( t=1; t<=TASKS; t++ )); do
-      start_index=$(( (t-1) * bins_per_task ))
-      [[ $start_index -lt $total_bins ]] || break
-      end_index=$(( t * bins_per_task - 1 ))
-      [[ $end_index -lt $total_bins ]] || end_index=$(( total_bins - 1 ))
+      if [[ "$SPLIT_MODE" == "slab" ]]; then
+        split_args="--slab $(( t - 1 )) ${TASKS}${MEM_BUDGET_MB:+ --mem_budget_mb ${MEM_BUDGET_MB}}"
+        split_desc="slab $(( t - 1 ))/${TASKS}"
+      else
+        [[ $t -le ${#ranges[@]} ]] || break
+        read -r start_index end_index <<< "${ranges[t-1]}"
+        split_args="--range $start_index $end_index${MEM_BUDGET_MB:+ --mem_budget_mb ${MEM_BUDGET_MB}}"
+        split_desc="bins $start_index–$end_index"
+      fi
 
-      part_out="${part_dir}/${base}_dist_part${t}.txt"
+      part_out="${part_dir}/${base}_dist_part${t}${TXT_EXT}"
       job_script=$(mktemp /tmp/dist_whole_${label}_${t}_XXXX.sh)
       cat > "$job_script" << EOF
 #!/bin/bash
@@ -96,16 +146,37 @@ submit_one() {
 #SBATCH --mem=8G
 
 python3 "${SCRIPT_DIR}/Calculate_distance_whole_dual.py" \
-  "$infile" "$part_out" --source_label "$label" --range $start_index $end_index
+  "$infile" "$part_out" --source_label "$label" ${split_args}
 EOF
-      sbatch "$job_script" >/dev/null
+      jid=$(sbatch "$job_script" | awk '{print $NF}')
       rm -f "$job_script"
-      echo "  Submitted ${label} task $t for bins $start_index–$end_index"
+      deps+=("$jid")
+      part_list+=" \"${part_out}\""
+      echo "  Submitted ${label} task $t for ${split_desc} (jobid=${jid})"
     done
 
-    echo "[WholeGenome-${label}] All ${TASKS} tasks submitted for ${base}."
-    echo "  Merge after completion:"
-    echo "    cat ${part_dir}/${base}_dist_part*.txt > ${outroot}/${base}_distance_filtered.txt"
+    echo "[WholeGenome-${label}] ${#deps[@]} tasks submitted for ${base}."
+
+    # 归并：去重 + 全局最近邻补边 → 与单任务 KD-tree 输出一致
+    # 只传本次提交的 part 文件（part_dir 里可能留有上次更大 TASKS 的 part）
+    local dep_str merge_job
+    dep_str=$(IFS=:; echo "${deps[*]}")
+    merge_job=$(mktemp /tmp/dist_merge_${label}_XXXX.sh)
+    cat > "$merge_job" << EOF
+#!/bin/bash
+#SBATCH --job-name=dist_merge_${label}
+#SBATCH --output=${SCRIPT_DIR}/tmp/whole_${label}_merge.out
+#SBATCH --error=${SCRIPT_DIR}/tmp/whole_${label}_merge.err
+#SBATCH --time=02:00:00
+#SBATCH --mem=8G
+
+python3 "${SCRIPT_DIR}/merge_distance_parts_dual.py" \
+  "$infile" "${outroot}/${base}_distance_filtered${TXT_EXT}" \
+  ${part_list} --source_label "$label" --out_format "$OUT_FORMAT"${SORTED_INDEX:+ --sorted_index}
+EOF
+    sbatch --dependency=afterok:${dep_str} "$merge_job" >/dev/null
+    rm -f "$merge_job"
+    echo "  Scheduled merge → ${outroot}/${base}_distance_filtered${TXT_EXT}"
   fi
 }
 
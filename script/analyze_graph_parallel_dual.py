@@ -1,9 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import argparse, os, re, sys
+import argparse, math, os, sys
 from pathlib import Path
+import numpy as np
+import pandas as pd
 import networkx as nx
 
+from edge_store_dual import is_edge_store, is_sorted_store, read_nodes, open_edges, open_sorted_prefix, load_sorted_index
+from columnar_io_dual import read_distance_edges
+from bin_cache_dual import load_cluster_table
+from metrics_store_dual import resolve_db_path, upsert_metrics
+from profile_dual import StageProfile, NULL_PROFILE
+from stream_io_dual import open_text, atomic_output, strip_compression
+
+try:
+    from scipy import sparse
+    from scipy.sparse import csgraph  # sparse 后端
+except Exception:
+    sparse = csgraph = None
+
 def ascend_to_sample_dir(start: Path) -> Path:
     p = start.resolve()
     if p.is_file(): p = p.parent
@@ -13,69 +28,53 @@ def ascend_to_sample_dir(start: Path) -> Path:
         p = p.parent
 
 def iter_edges(dist_file, thr):
-    with open(dist_file, encoding='utf-8') as fin:
-        for line in fin:
-            p = line.strip().split()
-            if len(p) < 5: continue
-            try:
-                d = float(p[4])
-            except ValueError:
-                continue
-            if d <= thr:
-                yield f"{p[0]}:{p[1]}", f"{p[2]}:{p[3]}"
+    labels, _, u, v, d = load_edges(dist_file, thr)
+    m = d <= thr
+    for a, b in zip(u[m].tolist(), v[m].tolist()):
+        yield labels[a], labels[b]
 
 def collect_all_endpoints(dist_file):
-    nodes = set()
-    with open(dist_file, encoding='utf-8') as fin:
-        for line in fin:
-            p = line.strip().split()
-            if len(p) >= 4:
-                nodes.add(f"{p[0]}:{p[1]}")
-                nodes.add(f"{p[2]}:{p[3]}")
-    return nodes
+    """距离文件中出现过的全部端点，按首次出现顺序"""
+    if is_sorted_store(dist_file):
+        labels = [f"{c}:{l}" for c, l in read_nodes(dist_file)]
+        return [labels[k] for k in sorted_endpoints(dist_file).tolist()]
+    labels, _, u, v, _ = load_edges(dist_file)
+    return [labels[k] for k in first_appearance(np.column_stack([u, v]).ravel()).tolist()]
 
 def collect_all_bins_from_cluster(cluster_file):
     """
     支持两种表头：
     - euchr:  homolog locus x y z ...
     - h3k4 :  chrom   allele locus x y z ...
+    返回按文件顺序去重的节点列表
     """
-    nodes = set()
-    with open(cluster_file, encoding='utf-8') as f:
-        first = f.readline().strip()
-        has_header = first and first.split()[0].lower() in ("homolog","chrom")
-        if not has_header:
-            f.seek(0)
-        for line in f:
-            if not line.strip(): continue
-            p = line.strip().split()
-            if len(p) < 2: continue
-            head = first.split()[0].lower() if has_header else None
-            if head == "homolog" or (not has_header and re.match(r"^chr[^()]+\((mat|pat)\)$", p[0])):
-                # euchr
-                nodes.add(f"{p[0]}:{p[1]}")
-            else:
-                # h3k4
-                if len(p) < 3: continue
-                nodes.add(f"{p[0]}({p[1]}):{p[2]}")
-    return nodes
-
-def build_and_analyze(dist_file, thr, node_mode, cluster_file=None):
+    tab, _ = load_cluster_table(cluster_file, require_xyz=False)
+    return pd.unique(tab.keys(":")).tolist()
+
+def build_and_analyze(dist_file, thr, node_mode, cluster_file=None, backend="networkx",
+                      clustering="exact", samples=1000, seed=0, prof=NULL_PROFILE):
+    if backend == "sparse":
+        return build_and_analyze_sparse(dist_file, thr, node_mode, cluster_file, clustering, samples, seed, prof)
+
     G = nx.Graph()
 
-    if node_mode == "all_distance_endpoints":
-        nodes = collect_all_endpoints(dist_file); G.add_nodes_from(nodes)
-    elif node_mode == "all_bins":
-        if not cluster_file:
-            raise ValueError("--node_mode all_bins 需要 --cluster_file")
-        nodes = collect_all_bins_from_cluster(cluster_file); G.add_nodes_from(nodes)
-    # else: leq_thr_endpoints → 不预置节点
+    with prof.timer("parse_build"):    # networkx 路径中解析与建图交织
+        if node_mode == "all_distance_endpoints":
+            nodes = collect_all_endpoints(dist_file); G.add_nodes_from(nodes)
+        elif node_mode == "all_bins":
+            if not cluster_file:
+                raise ValueError("--node_mode all_bins 需要 --cluster_file")
+            nodes = collect_all_bins_from_cluster(cluster_file); G.add_nodes_from(nodes)
+        # else: leq_thr_endpoints → 不预置节点
 
-    for u, v in iter_edges(dist_file, thr):
-        G.add_edge(u, v)
+        for u, v in iter_edges(dist_file, thr):
+            G.add_edge(u, v)
 
-    comps = list(nx.connected_components(G))
-    mapping = {node: cid+1 for cid, comp in enumerate(comps) for node in comp}
+    with prof.timer("components"):
+        comps = list(nx.connected_components(G))
+        mapping = {node: cid+1 for cid, comp in enumerate(comps) for node in comp}
+    with prof.timer("clustering"):
+        cstats = clustering_stats(nx_local_clustering(G), list(G.nodes), clustering, "exact_networkx", samples, seed)
     stats = {
         'threshold': thr,
         'node_mode': node_mode,
@@ -83,68 +82,621 @@ def build_and_analyze(dist_file, thr, node_mode, cluster_file=None):
         'num_edges': G.number_of_edges(),
         'num_components': len(comps),
         'largest_cc_size': max((len(c) for c in comps), default=0),
-        'avg_clustering': nx.average_clustering(G) if G.number_of_nodes() else 0.0,
+        **cstats,
         'density': nx.density(G) if G.number_of_nodes() > 1 else 0.0,
     }
     return mapping, stats
 
-if __name__ == '__main__':
+# ---------- 平均聚类系数：精确 / 抽样 ----------
+def clustering_stats(local_fn, nodes, method, exact_label, samples, seed):
+    """
+    平均聚类系数（含零度节点，同 nx.average_clustering）
+    - exact  ：local_fn(全部节点) 按加入顺序求和
+    - sampled：无放回均匀抽 samples 个节点，返回均值与 95% 置信区间（正态近似，含有限总体校正）
+    返回的键会原样写入 metrics；avg_clustering_method 记录所用方法
+    """
+    N = len(nodes)
+    if N == 0:
+        return {'avg_clustering': 0.0, 'avg_clustering_method': exact_label}
+    if method == "exact" or samples >= N:
+        return {'avg_clustering': sum(local_fn(nodes)) / N, 'avg_clustering_method': exact_label}
+    if samples < 1:
+        raise ValueError(f"clustering samples 至少为 1（收到 {samples}）")
+    pick = np.sort(np.random.default_rng(seed).choice(N, size=samples, replace=False))
+    c = np.asarray(local_fn([nodes[k] for k in pick.tolist()]), dtype=float)
+    mean = float(c.mean())
+    se = float(c.std(ddof=1)) / math.sqrt(samples) * math.sqrt(1 - samples / N) if samples > 1 else float('nan')
+    half = 1.959963984540054 * se
+    return {
+        'avg_clustering': mean,
+        'avg_clustering_method': 'sampled',
+        'avg_clustering_ci95_low': max(0.0, mean - half),
+        'avg_clustering_ci95_high': min(1.0, mean + half),
+        'avg_clustering_samples': samples,
+        'avg_clustering_seed': seed,
+    }
+
+def nx_local_clustering(G):
+    """networkx 参考实现：只计算给定节点"""
+    def local(ns):
+        cl = nx.clustering(G, ns)
+        return [cl[v] for v in ns]
+    return local
+
+# ---------- 整数索引：读入、预置节点、加入顺序 ----------
+def first_appearance(seq):
+    """seq 中的不同值，按首次出现顺序"""
+    uniq, first = np.unique(seq, return_index=True)
+    return uniq[np.argsort(first)]
+
+def load_edge_store(dist_file):
+    """二进制边存储（memmap，无逐行解析）→ 与 load_edges 相同的返回结构；节点 id 即存储中的 id"""
+    labels = [f"{c}:{l}" for c, l in read_nodes(dist_file)]
+    index_of = {k: i for i, k in enumerate(labels)}
+    rec = open_edges(dist_file)
+    return (labels, index_of, rec['u'].astype(np.int64), rec['v'].astype(np.int64),
+            rec['d'].astype(float))
+
+def load_sorted_store(dist_file, max_thr=None):
+    """
+    按距离排序的边存储：只读 d<=max_thr 的前缀，再按 pos 还原为原文件顺序
+    → 与 load_edges 相同的返回结构（边集为原文件中 d<=max_thr 的子序列）
+    """
+    labels = [f"{c}:{l}" for c, l in read_nodes(dist_file)]
+    index_of = {k: i for i, k in enumerate(labels)}
+    rec = open_sorted_prefix(dist_file, max_thr)
+    rec = rec[np.argsort(rec['pos'])]
+    return (labels, index_of, rec['u'].astype(np.int64), rec['v'].astype(np.int64),
+            rec['d'].astype(float))
+
+def sorted_endpoints(dist_file):
+    """排序存储：全部端点的首次出现顺序（索引中预存，不读边记录）；其他格式返回 None"""
+    if not is_sorted_store(dist_file):
+        return None
+    return load_sorted_index(dist_file)['endpoint_order'].astype(np.int64)
+
+def load_edges(dist_file, max_thr=None):
+    """
+    一次读入距离文件 → (labels, index_of, u, v, d)
+    文本：共享列式读取，节点 id 按在文件中首次出现的顺序分配（先 u 后 v）；*.edges.bin 走 memmap
+    *.edges.sorted.bin：只读 d<=max_thr 的前缀（其他格式忽略 max_thr，由调用方过滤）
+    """
+    if is_sorted_store(dist_file):
+        return load_sorted_store(dist_file, max_thr)
+    if is_edge_store(dist_file):
+        return load_edge_store(dist_file)
+    return read_distance_edges(dist_file, sep=":")
+
+def preset_node_ids(node_mode, labels, index_of, seq, cluster_file=None, endpoints=None, bins=None):
+    """
+    按 node_mode 预置的节点 id（顺序即加入顺序）；all_bins 中不在距离文件里的 bin 追加到 labels
+    endpoints: 已知的全部端点首次出现顺序（排序存储只读了前缀，seq 不完整）
+    bins     : all_bins 的节点键（调用方已载入 cluster 表时直接传入，不再读 cluster_file）
+    """
+    if node_mode == "all_distance_endpoints":
+        return endpoints if endpoints is not None else first_appearance(seq).astype(np.int64)
+    if node_mode == "all_bins":
+        if bins is None and not cluster_file:
+            raise ValueError("--node_mode all_bins 需要 --cluster_file")
+        pre = []
+        for key in (collect_all_bins_from_cluster(cluster_file) if bins is None else bins):
+            k = index_of.get(key)
+            if k is None:
+                k = index_of[key] = len(labels); labels.append(key)
+            pre.append(k)
+        return np.array(pre, dtype=np.int64)
+    return np.empty(0, dtype=np.int64)
+
+def insertion_order(n, preset, seq, edge_mask):
+    """
+    图中节点按“加入图”的顺序：预置节点在前，其余按文件中首次出现（仅 edge_mask 内的边）
+    seq 为文件顺序的端点序列 [u0,v0,u1,v1,...]
+    """
+    rank = np.full(n, -1, dtype=np.int64)
+    rank[preset] = np.arange(len(preset))
+    uniq, first = np.unique(seq[np.repeat(edge_mask, 2)], return_index=True)
+    is_new = rank[uniq] < 0
+    rank[uniq[is_new]] = len(preset) + np.argsort(np.argsort(first[is_new]))
+    nodes = np.flatnonzero(rank >= 0)
+    return nodes[np.argsort(rank[nodes])]
+
+def component_rows(labels, nodes, comp):
+    """
+    components_single 的行 (locus_id, cid)：同 networkx 路径逐组件写出（按组件编号），组内按节点加入顺序
+    networkx 单阈值路径的组内顺序是集合迭代序（随 PYTHONHASHSEED 变化），两者只在组内行序上可能不同
+    """
+    order = np.argsort(comp, kind='stable')
+    return zip((labels[k] for k in nodes[order].tolist()), comp[order].tolist())
+
+def number_components(group):
+    """group[k] 为第 k 个节点（按加入顺序）所在分量的任意标识 → (1 起始的组件编号, 分量大小)"""
+    ugroup, inv = np.unique(group, return_inverse=True)
+    first_pos = np.full(len(ugroup), len(group), dtype=np.int64)
+    np.minimum.at(first_pos, inv, np.arange(len(group)))
+    cid = np.empty(len(ugroup), dtype=np.int64)
+    cid[np.argsort(first_pos)] = np.arange(1, len(ugroup) + 1)
+    return cid[inv], np.bincount(inv, minlength=len(ugroup))
+
+# ---------- sparse 后端（CSR + csgraph） ----------
+def csr_adjacency(n, u, v):
+    """去重、去自环的对称 0/1 CSR 邻接矩阵，以及含自环的无向边数（同 nx.Graph.number_of_edges）"""
+    lo, hi = np.minimum(u, v), np.maximum(u, v)
+    keys = np.unique(lo * n + hi)
+    num_edges = len(keys)
+    lo, hi = keys // n, keys % n
+    off = lo != hi
+    r = np.concatenate([lo[off], hi[off]]); c = np.concatenate([hi[off], lo[off]])
+    A = sparse.csr_matrix((np.ones(len(r), dtype=np.int64), (r, c)), shape=(n, n))
+    return A, num_edges
+
+def triangle_counts(A):
+    """
+    每个节点的三角形数（精确）。按 (度, id) 给边定向，每个三角形 a<b<c 只枚举一次：
+    W1=(U@U)∘U 的 (a,c) 计数 b → 行和计入 a、列和计入 c；W2=(UᵀU)∘U 的行和计入 b
+    定向后出度 ≤ √(2m)，高度数节点不再展开全部二跳路径
+    """
+    n = A.shape[0]
+    deg = np.diff(A.indptr)
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((np.arange(n), deg))] = np.arange(n)
+    coo = A.tocoo()
+    keep = rank[coo.row] < rank[coo.col]
+    U = sparse.csr_matrix((np.ones(int(keep.sum()), dtype=np.int64), (coo.row[keep], coo.col[keep])), shape=(n, n))
+    W1 = (U @ U).multiply(U)
+    W2 = (U.T @ U).multiply(U)
+    return (np.asarray(W1.sum(axis=1)).ravel() + np.asarray(W1.sum(axis=0)).ravel()
+            + np.asarray(W2.sum(axis=1)).ravel())
+
+def sparse_local_clustering(A):
+    """
+    CSR 版 local_fn：与 nx.clustering 同公式 2T / (d(d-1))
+    请求节点较多时一次性做全图三角形计数；少量抽样节点只算对应行 ((A[s]@A)∘A[s])
+    """
+    deg_all = np.diff(A.indptr)
+    cache = {}
+    def local(ns):
+        ns = np.asarray(ns, dtype=np.int64)
+        if len(ns) * 4 >= A.shape[0]:
+            if 'tri2' not in cache:
+                cache['tri2'] = 2 * triangle_counts(A)
+            tri2 = cache['tri2'][ns]
+        else:
+            rows = A[ns]
+            tri2 = np.asarray((rows @ A).multiply(rows).sum(axis=1)).ravel()
+        deg = deg_all[ns]
+        c = np.zeros(len(ns), dtype=float)
+        ok = tri2 > 0
+        c[ok] = tri2[ok] / (deg[ok] * (deg[ok] - 1))
+        return c.tolist()
+    return local
+
+def sparse_stats(thr, node_mode, n, nodes, u, v, clustering="exact", samples=1000, seed=0, prof=NULL_PROFILE):
+    """对给定节点（加入顺序）与边集计算组件与全部 metrics"""
+    with prof.timer("graph_build"):
+        A, num_edges = csr_adjacency(n, u, v)
+    with prof.timer("components"):
+        _, labels_cc = csgraph.connected_components(A, directed=False)
+        comp, sizes = number_components(labels_cc[nodes])
+    with prof.timer("clustering"):
+        # 与 nx.average_clustering 同序求和，精确值逐位一致
+        cstats = clustering_stats(sparse_local_clustering(A), nodes.tolist(), clustering, "exact_triangles", samples, seed)
+    num_nodes = len(nodes)
+    stats = {
+        'threshold': thr,
+        'node_mode': node_mode,
+        'num_nodes': num_nodes,
+        'num_edges': num_edges,
+        'num_components': len(sizes),
+        'largest_cc_size': int(sizes.max()) if len(sizes) else 0,
+        **cstats,
+        'density': 2 * num_edges / (num_nodes * (num_nodes - 1)) if num_nodes > 1 else 0.0,
+    }
+    return comp, stats
+
+def build_and_analyze_sparse(dist_file, thr, node_mode, cluster_file=None,
+                             clustering="exact", samples=1000, seed=0, prof=NULL_PROFILE):
+    """
+    与 build_and_analyze 等价的整数索引实现：标签一次映射为稠密 id，
+    边存为 CSR，组件由 scipy.sparse.csgraph 计算
+    """
+    if sparse is None:
+        raise RuntimeError("--backend sparse 需要 scipy")
+    with prof.timer("parse"):
+        labels, index_of, u, v, d = load_edges(dist_file, thr)
+        seq = np.column_stack([u, v]).ravel()
+        preset = preset_node_ids(node_mode, labels, index_of, seq, cluster_file, sorted_endpoints(dist_file))
+    n = len(labels)
+    mask = d <= thr
+    with prof.timer("graph_build"):
+        nodes = insertion_order(n, preset, seq, mask)
+    comp, stats = sparse_stats(thr, node_mode, n, nodes, u[mask], v[mask], clustering, samples, seed, prof)
+    mapping = dict(component_rows(labels, nodes, comp))
+    return mapping, stats
+
+# ---------- 多阈值单遍扫描（union-find） ----------
+class UnionFind:
+    """按大小合并 + 路径减半"""
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb: return
+        if self.size[ra] < self.size[rb]: ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+
+    def roots(self):
+        """全部节点的根（指针跳跃，向量化）"""
+        p = np.asarray(self.parent, dtype=np.int64)
+        while True:
+            pp = p[p]
+            if np.array_equal(pp, p): return p
+            p = pp
+
+def threshold_prefixes(thresholds):
+    """
+    阈值文本 → {阈值: f"whole{文本}"}（文本保持原样）
+    文本不同但数值相同（如 1 与 1.0）时会落到同一输出，报 ValueError
+    """
+    prefix_of = {}
+    for t in thresholds:
+        thr = float(t)
+        if thr in prefix_of:
+            raise ValueError(f"阈值 {t} 与 {prefix_of[thr][len('whole'):]} 数值相同")
+        prefix_of[thr] = f"whole{t}"
+    return prefix_of
+
+def sweep_thresholds(dist_file, thresholds, node_mode, cluster_file=None, backend="networkx",
+                     clustering="exact", samples=1000, seed=0, prof=NULL_PROFILE):
+    """
+    读一次距离文件，按距离排序后用 union-find 依次扫过所有阈值（升序）
+    逐阈值产出 (thr, labels, node_ids, comp_ids, stats)，结果与 build_and_analyze 一致：
+    - 节点集合与 node_mode 语义相同；组件编号按节点“加入图”的先后顺序（同 networkx）
+    - networkx 后端：num_edges/density/avg_clustering 来自增量维护的同一张图
+    - sparse 后端：组件与全部 metrics 由当前前缀边集的 CSR 计算，不建 nx 图
+    """
+    if backend == "sparse" and sparse is None:
+        raise RuntimeError("--backend sparse 需要 scipy")
+    with prof.timer("parse"):
+        labels, index_of, u, v, d = load_edges(dist_file, max(thresholds))
+        seq = np.column_stack([u, v]).ravel()     # 文件顺序的端点序列
+        preset = preset_node_ids(node_mode, labels, index_of, seq, cluster_file, sorted_endpoints(dist_file))
+    yield from sweep_edges(labels, u, v, d, preset, thresholds, node_mode, backend, clustering, samples, seed, prof)
+
+def sweep_edges(labels, u, v, d, preset, thresholds, node_mode, backend="networkx",
+                clustering="exact", samples=1000, seed=0, prof=NULL_PROFILE):
+    """
+    sweep_thresholds 的扫描部分：边已在内存中（u, v, d 为文件顺序，preset 同 preset_node_ids）
+    供内存端到端模式直接传入 KD-tree 结果，不经距离文件
+    """
+    if backend == "sparse" and sparse is None:
+        raise RuntimeError("--backend sparse 需要 scipy")
+    seq = np.column_stack([u, v]).ravel()
+    n = len(labels)
+    with prof.timer("graph_build"):
+        order = np.argsort(d, kind='stable')
+        su, sv, sd = u[order], v[order], d[order]
+        uf = UnionFind(n)
+        G = None
+        if backend == "networkx":
+            G = nx.Graph(); G.add_nodes_from(preset.tolist())
+    pos = 0
+    for thr in sorted(thresholds):
+        end = int(np.searchsorted(sd, thr, side='right'))
+        with prof.timer("graph_build"):
+            nodes = insertion_order(n, preset, seq, d <= thr)
+        if G is None:
+            comp, stats = sparse_stats(thr, node_mode, n, nodes, su[:end], sv[:end], clustering, samples, seed, prof)
+            yield thr, labels, nodes, comp, stats
+            continue
+
+        with prof.timer("graph_build"):
+            for a, b in zip(su[pos:end].tolist(), sv[pos:end].tolist()):
+                uf.union(a, b)
+            G.add_edges_from(zip(su[pos:end].tolist(), sv[pos:end].tolist()))
+        pos = end
+
+        # 组件编号：按各组件最早加入节点的顺序
+        with prof.timer("components"):
+            comp, sizes = number_components(uf.roots()[nodes])
+        with prof.timer("clustering"):
+            # 按加入顺序求和，浮点结果与逐阈值建图一致
+            cstats = clustering_stats(nx_local_clustering(G), nodes.tolist(), clustering, "exact_networkx", samples, seed)
+        stats = {
+            'threshold': thr,
+            'node_mode': node_mode,
+            'num_nodes': G.number_of_nodes(),
+            'num_edges': G.number_of_edges(),
+            'num_components': len(sizes),
+            'largest_cc_size': int(sizes.max()) if len(sizes) else 0,
+            **cstats,
+            'density': nx.density(G) if G.number_of_nodes() > 1 else 0.0,
+        }
+        yield thr, labels, nodes, comp, stats
+
+# ---------- 连续阈值的渗流曲线（单遍 union-find） ----------
+def percolation_curve(su, sv, sd, n, preset):
+    """
+    按距离升序的边 (su, sv, sd) 单遍增量 union-find；节点集合 = preset ∪ 已处理边的端点（同 node_mode 语义）
+    返回 (curve, chi_peak)
+    - curve   : DataFrame[distance, lcc_size, num_nodes, lcc_frac]；
+                首行为无边状态（distance=0），之后 LCC 规模或节点数每变化一次记一行（同距离的边全部处理完才记），
+                即阈值 t 的精确 LCC 占比 = distance ≤ t 的最后一行
+    - chi_peak: (distance, chi) 非最大组件平均规模 χ=(Σs²-s_max²)/(N-s_max) 取最大处（有限体系的渗流阈值估计）；
+                Σs² 随合并增量维护（a、b 合并 +2ab），同样只在每个距离的末条边后取值
+    """
+    parent, size = list(range(n)), [1] * n
+    active = np.zeros(n, dtype=bool)
+    active[preset] = True
+    active = active.tolist()
+    N = s2 = len(preset)
+    lcc = 1 if N else 0
+    rows = [(0.0, lcc, N)]
+    chi_best, chi_d = 0.0, float('nan')
+    su, sv, sd = su.tolist(), sv.tolist(), sd.tolist()
+    m = len(sd)
+    for k in range(m):
+        a, b = su[k], sv[k]
+        for x in (a, b):
+            if not active[x]:
+                active[x] = True; N += 1; s2 += 1
+                if not lcc: lcc = 1
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]; a = parent[a]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]; b = parent[b]
+        if a != b:
+            if size[a] < size[b]: a, b = b, a
+            parent[b] = a
+            s2 += 2 * size[a] * size[b]
+            size[a] += size[b]
+            if size[a] > lcc: lcc = size[a]
+        if k == m - 1 or sd[k + 1] != sd[k]:
+            if lcc != rows[-1][1] or N != rows[-1][2]:
+                rows.append((sd[k], lcc, N))
+            chi = (s2 - lcc * lcc) / (N - lcc) if N > lcc else 0.0
+            if chi > chi_best:
+                chi_best, chi_d = chi, sd[k]
+    curve = pd.DataFrame(rows, columns=['distance', 'lcc_size', 'num_nodes'])
+    curve = curve.drop_duplicates('distance', keep='last').reset_index(drop=True)
+    curve['lcc_frac'] = curve['lcc_size'] / curve['num_nodes'].where(curve['num_nodes'] > 0)
+    return curve, (chi_d, chi_best)
+
+def percolation_estimates(curve, chi_peak):
+    """
+    渗流阈值的三种估计（取自同一条曲线）：
+    t_c_chi = χ 峰值处距离；t_jump = LCC 占比单步增量最大处；t_half = LCC 占比首次 ≥ 0.5 处（未达到为 NaN）
+    """
+    frac = curve['lcc_frac'].fillna(0.0).to_numpy()
+    dist = curve['distance'].to_numpy()
+    jump = np.diff(frac, prepend=frac[:1])
+    k = int(np.argmax(jump)) if len(jump) else 0
+    half = np.flatnonzero(frac >= 0.5)
+    return {
+        't_c_chi': chi_peak[0], 'chi_max': chi_peak[1],
+        't_jump': float(dist[k]) if len(dist) else float('nan'), 'jump': float(jump[k]) if len(jump) else 0.0,
+        't_half': float(dist[half[0]]) if len(half) else float('nan'),
+        'lcc_frac_max': float(frac[-1]) if len(frac) else 0.0,
+    }
+
+def percolation_sweep(dist_file, node_mode, cluster_file=None, max_distance=None, prof=NULL_PROFILE):
+    """
+    距离文件 → (curve, estimates)：一次读入、一次排序、一次 union-find 扫描
+    max_distance：只用 d ≤ max_distance 的边（距离阶段阈值之外只剩最近邻补边，曲线在该处截断）
+    node_mode 须为 all_bins / all_distance_endpoints：leq_thr_endpoints 的节点集合随边增长，LCC 占比恒为 1
+    """
+    if node_mode == "leq_thr_endpoints":
+        raise ValueError("percolation_sweep 不支持 node_mode=leq_thr_endpoints（分母只含已加入边的端点，LCC 占比恒为 1）")
+    with prof.timer("parse"):
+        labels, index_of, u, v, d = load_edges(dist_file, max_distance)
+        seq = np.column_stack([u, v]).ravel()
+        preset = preset_node_ids(node_mode, labels, index_of, seq, cluster_file, sorted_endpoints(dist_file))
+    with prof.timer("sort"):
+        if max_distance is not None:
+            keep = d <= max_distance
+            u, v, d = u[keep], v[keep], d[keep]
+        order = np.argsort(d, kind='stable')
+    with prof.timer("union_find"):
+        curve, chi_peak = percolation_curve(u[order], v[order], d[order], len(labels), preset)
+    est = percolation_estimates(curve, chi_peak)
+    est['n_edges'] = len(d)
+    return curve, est
+
+# ---------- 组件规模分布与 homolog 组成 ----------
+def homolog_codes(names):
+    """节点名（homolog:locus，如 chr1(mat):40000）→ (每个节点的 homolog 编码 int64, 按名称排序的 homolog 表)"""
+    hom = pd.Series(names, dtype=object).str.rsplit(":", n=1).str[0]
+    codes, uniq = pd.factorize(hom, sort=True)
+    return codes.astype(np.int64), list(uniq)
+
+def component_tables(comp, hcodes, homologs, top_k):
+    """
+    comp: 各节点的组件编号（1 起，连续）；hcodes: 各节点的 homolog 编码
+    → (size_dist, top)
+    - size_dist: 组件规模分布（size, n_components），size 升序
+    - top      : 前 top_k 大组件（同规模按编号），列 rank, component, size, n_homologs, 各 homolog 节点数
+    全部为 bincount / 整数数组运算，不展开逐组件集合
+    """
+    comp = np.asarray(comp, dtype=np.int64)
+    sizes = np.bincount(comp, minlength=1)[1:]
+    size_vals, size_counts = np.unique(sizes, return_counts=True)
+    size_dist = pd.DataFrame({'size': size_vals, 'n_components': size_counts})
+
+    top = np.argsort(-sizes, kind='stable')[:top_k]
+    rank = np.full(len(sizes), -1, dtype=np.int64)
+    rank[top] = np.arange(len(top))
+    r = rank[comp - 1]
+    sel = r >= 0
+    H = max(len(homologs), 1)
+    mat = np.bincount(r[sel] * H + hcodes[sel], minlength=len(top) * H).reshape(len(top), H)[:, :len(homologs)]
+    top_df = pd.DataFrame({'rank': np.arange(1, len(top) + 1), 'component': top + 1, 'size': sizes[top],
+                           'n_homologs': (mat > 0).sum(axis=1)})
+    top_df = pd.concat([top_df, pd.DataFrame(mat, columns=homologs)], axis=1)
+    return size_dist, top_df
+
+def write_component_tables(mdir, base, prefix, size_dist, top_df):
+    """与 *_metrics.txt 同目录：{base}_{prefix}_comp_sizes.tsv、{base}_{prefix}_top_components.tsv"""
+    sf = mdir / f"{base}_{prefix}_comp_sizes.tsv"
+    tf = mdir / f"{base}_{prefix}_top_components.tsv"
+    with atomic_output(sf) as tmp:
+        size_dist.to_csv(tmp, sep="\t", index=False)
+    with atomic_output(tf) as tmp:
+        top_df.to_csv(tmp, sep="\t", index=False)
+    return sf, tf
+
+def write_outputs(out_root, base, prefix, rows, stats, comp_single=True):
+    """写 metrics 与 components_single；rows 为 (locus_id, cid) 可迭代对象；comp_single=False 时只写 metrics（compf 为 None）"""
+    mdir = out_root / prefix
+    mdir.mkdir(parents=True, exist_ok=True)
+    cdir = out_root / 'components_single'
+
+    # metrics
+    mf = mdir / f"{base}_{prefix}_metrics.txt"
+    with open_text(mf, 'w') as f:
+        for k, v in stats.items():
+            f.write(f"{k}\t{v}\n")
+    if not comp_single:
+        return mdir, cdir, mf, None
+    cdir.mkdir(parents=True, exist_ok=True)
+
+    # components（两列：locus_id, component_<prefix>）
+    compf = cdir / f"{base}_comp_{prefix}.txt"
+    colname = f"component_{prefix}"
+    with open_text(compf, 'w') as f:
+        f.write(f"locus_id\t{colname}\n")
+        for locus_id, cid in rows:
+            f.write(f"{locus_id}\t{cid}\n")
+    return mdir, cdir, mf, compf
+
+def main(argv=None):
     ap = argparse.ArgumentParser()
     ap.add_argument('--distance_file', required=True)
-    ap.add_argument('--threshold', type=float, required=True)
-    ap.add_argument('--output_prefix', required=True, help='如 whole1 或 whole1.25')
+    ap.add_argument('--threshold', type=float, default=None)
+    ap.add_argument('--output_prefix', default=None, help='如 whole1 或 whole1.25')
+    ap.add_argument('--thresholds', nargs='+', default=None,
+                   help='多阈值单遍扫描（union-find）；输出前缀为 whole{thr}，thr 保持原样文本')
     ap.add_argument('--node_mode', default='leq_thr_endpoints',
                    choices=['leq_thr_endpoints','all_distance_endpoints','all_bins'])
     ap.add_argument('--cluster_file', default=None, help='all_bins 模式需要')
+    ap.add_argument('--backend', default='networkx', choices=['networkx','sparse'],
+                   help='networkx（参考实现）或 sparse（整数 id + CSR + csgraph，省内存）；组件划分与 metrics 相同，'
+                        'comp 文件均按组件编号逐组件写出，组内行序 networkx 为集合迭代序、sparse 为节点加入顺序')
+    ap.add_argument('--clustering', default='exact', choices=['exact','sampled'],
+                   help='平均聚类系数：exact（sparse 后端用三角形计数）或 sampled（抽样估计 + 95%% CI）')
+    ap.add_argument('--clustering_samples', type=int, default=1000, help='sampled 模式抽样节点数')
+    ap.add_argument('--clustering_seed', type=int, default=0, help='sampled 模式随机种子')
+    ap.add_argument('--top_k', type=int, default=20,
+                   help='每个阈值另写组件规模分布与前 top_k 大组件的 homolog 组成（与 metrics 同目录）；0=不写')
     ap.add_argument('--source_label', required=True, choices=['euchr','h3k4'],
                    help='来源标签（决定输出落地目录）')
     ap.add_argument('--out_root', default=None,
                    help='覆盖输出根目录；默认在工程根下 graph_matrix_dual_{label}')
-    args = ap.parse_args()
+    ap.add_argument('--sample_dir', default=None,
+                   help='样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）')
+    ap.add_argument('--metrics_db', default=os.environ.get('ANDIE_METRICS_DB'),
+                   help='同时写入跨样本 metrics 库（SQLite 路径，auto=样本上一级默认位置；默认取 ANDIE_METRICS_DB）')
+    args = ap.parse_args(argv)
+    prof = StageProfile("graph", argv)
+    if args.thresholds is None and (args.threshold is None or args.output_prefix is None):
+        ap.error('需要 --threshold 与 --output_prefix，或使用 --thresholds')
+    if args.clustering_samples < 1:
+        ap.error('--clustering_samples 至少为 1')
+    if args.thresholds:
+        try:
+            prefix_of = threshold_prefixes(args.thresholds)
+        except ValueError as e:
+            ap.error(f'--thresholds：{e}')
 
     script_dir = Path(__file__).resolve().parent
-    project_dir = script_dir.parent
-    sample_dir = ascend_to_sample_dir(script_dir)
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
+    project_dir = sample_dir if args.sample_dir else script_dir.parent
     sample_name = sample_dir.name
 
     # 输出根目录（按来源分开）
     out_root = Path(args.out_root) if args.out_root else (project_dir / f"graph_matrix_dual_{args.source_label}")
     out_root.mkdir(parents=True, exist_ok=True)
 
-    base = os.path.basename(args.distance_file).replace('_distance.txt','').replace('_distance_filtered.txt','')
-    mdir = out_root / args.output_prefix
-    mdir.mkdir(parents=True, exist_ok=True)
-    cdir = out_root / 'components_single'
-    cdir.mkdir(parents=True, exist_ok=True)
+    base = strip_compression(os.path.basename(args.distance_file))
+    for suf in ('_distance_filtered.edges.sorted.bin', '_distance_filtered.edges.bin', '_distance.txt', '_distance_filtered.txt'):
+        base = base.replace(suf, '')
 
-    mapping, stats = build_and_analyze(args.distance_file, args.threshold, args.node_mode, args.cluster_file)
+    if args.thresholds:
+        written = []
+        hc_all = None
+        for thr, labels, nodes, comp, stats in sweep_thresholds(
+                args.distance_file, list(prefix_of), args.node_mode, args.cluster_file, args.backend,
+                args.clustering, args.clustering_samples, args.clustering_seed, prof):
+            rows = component_rows(labels, nodes, comp)
+            with prof.timer("write"):
+                mdir, cdir, mf, compf = write_outputs(out_root, base, prefix_of[thr], rows, stats)
+            if args.top_k > 0:
+                with prof.timer("comp_tables"):
+                    if hc_all is None:   # labels 在各阈值间不变，homolog 编码只算一次
+                        hc_all, homologs = homolog_codes(labels)
+                    write_component_tables(mdir, base, prefix_of[thr],
+                                           *component_tables(comp, hc_all[nodes], homologs, args.top_k))
+            written.append((thr, mf, compf, prefix_of[thr], stats))
+            print(f"Finished threshold={thr} [{args.node_mode}] -> {mf}, {compf}")
+    else:
+        mapping, stats = build_and_analyze(args.distance_file, args.threshold, args.node_mode,
+                                           args.cluster_file, args.backend,
+                                           args.clustering, args.clustering_samples, args.clustering_seed, prof)
+        with prof.timer("write"):
+            mdir, cdir, mf, compf = write_outputs(out_root, base, args.output_prefix, mapping.items(), stats)
+        if args.top_k > 0:
+            with prof.timer("comp_tables"):
+                hcodes, homologs = homolog_codes(list(mapping))
+                comp = np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))
+                write_component_tables(mdir, base, args.output_prefix,
+                                       *component_tables(comp, hcodes, homologs, args.top_k))
+        written = [(args.threshold, mf, compf, args.output_prefix, stats)]
 
-    # metrics
-    mf = mdir / f"{base}_{args.output_prefix}_metrics.txt"
-    with open(mf, 'w', encoding='utf-8') as f:
-        for k, v in stats.items():
-            f.write(f"{k}\t{v}\n")
+    db_path = resolve_db_path(args.metrics_db, sample_dir)
+    if db_path:
+        with prof.timer("metrics_db"):
+            upsert_metrics(db_path, [(sample_name, args.source_label, prefix, stats, str(mf.resolve()))
+                                     for _, mf, _, prefix, stats in written])
 
-    # components（两列：locus_id, component_<prefix>）
-    compf = cdir / f"{base}_comp_{args.output_prefix}.txt"
-    colname = f"component_{args.output_prefix}"
-    with open(compf,'w', encoding='utf-8') as f:
-        f.write(f"locus_id\t{colname}\n")
-        for locus_id, cid in mapping.items():
-            f.write(f"{locus_id}\t{cid}\n")
+    # 运行画像：逐阈值规模 + 各阶段累计耗时；单阈值写在该阈值 metrics 旁，扫描写在输出根下
+    for thr, _, _, prefix, stats in written:
+        prof.append("per_threshold", {'threshold': thr, 'prefix': prefix, 'num_nodes': stats['num_nodes'],
+                                      'num_edges': stats['num_edges'], 'num_components': stats['num_components']})
+    prof.count(backend=args.backend, node_mode=args.node_mode, clustering=args.clustering)
+    prof_path = prof.write(out_root / f"{base}_sweep" if args.thresholds else written[0][1])
 
     # REPORT（输出存储结构）
     print("\n=== analyze_graph_parallel_dual REPORT ===")
     print(f"Sample name : {sample_name}")
     print(f"Distance in : {Path(args.distance_file).resolve()}")
     print(f"Source label: {args.source_label}")
+    print(f"Backend     : {args.backend}")
     if args.node_mode == "all_bins":
         print(f"Cluster in  : {Path(args.cluster_file).resolve() if args.cluster_file else 'N/A'}")
     print(f"Out root    : {out_root.resolve()}")
-    print(f"Metrics dir : {mdir.resolve()}")
+    if args.thresholds:
+        print(f"Mode        : sweep ({len(written)} thresholds, single pass)")
+        print(f"Metrics dirs: {', '.join(w[1].parent.name for w in written)}")
+    else:
+        print(f"Metrics dir : {mdir.resolve()}")
     print(f"Comp single : {cdir.resolve()}")
-    print(f"Files out   : {mf.name}, {compf.name}")
+    print(f"Files out   : {', '.join(f'{w[1].name}, {w[2].name}' for w in written)}")
+    if db_path:
+        print(f"Metrics DB  : {db_path.resolve()} (+{len(written)} rows)")
+    if prof_path:
+        print(f"Profile     : {prof_path.resolve()}")
     print("==========================================\n")
 
-    print(f"Finished threshold={args.threshold} [{args.node_mode}] -> {mf}, {compf}")
+    if not args.thresholds:
+        print(f"Finished threshold={args.threshold} [{args.node_mode}] -> {mf}, {compf}")
 
+if __name__ == '__main__':
+    main()
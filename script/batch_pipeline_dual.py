@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多样本批处理驱动：distance → graph → merge → summary，本地进程池并行
+（--in_memory：这四个阶段合并为一次 inmemory_pipeline_dual.py 调用，点对与组件不经中间文本往返）
+
+每个 Sample-* 目录作为一个任务交给进程池（默认大小 = 本节点可用核数），
+各阶段在 worker 进程内直接调用对应脚本的 main(argv)，解释器与依赖只在每个 worker 启动时导入一次。
+- 失败隔离：单个样本任一阶段出错只终止该样本，其余样本继续；worker 进程异常退出（如 OOM）时
+  未完成的样本在新进程池中重试（--retries 次）
+- 每个样本的输出写入 <Sample>/logs_batch_dual/batch_dual.log
+- 结束时写汇总 TSV（--report），并打印 REPORT
+
+用法：
+  python batch_pipeline_dual.py '/data/cohort/Sample-*' [--workers 32] [--stages distance,graph,merge]
+"""
+import os, sys, glob, time, argparse, traceback, contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent))     # summarize_lcc_trend_dual.py 位于工程根
+
+import Calculate_distance_whole_dual as distance_stage
+import Calculate_cross_distance_dual as cross_stage
+import null_model_dual as null_stage
+import analyze_graph_parallel_dual as graph_stage
+import merge_components_dual as merge_stage
+import summarize_lcc_trend_dual as summary_stage
+import inmemory_pipeline_dual as memory_stage
+from stream_io_dual import open_text, with_compression, COMPRESS_CHOICES
+
+STAGES = ("distance", "cross", "null", "graph", "merge", "summary", "memory")
+DEFAULT_STAGES = ("distance", "graph", "merge", "summary")   # cross（h3k4↔euchr 邻近）、null（空模型重复）需显式选择
+MEMORY_COVERS = ("distance", "graph", "merge", "summary")    # memory 阶段（内存端到端）一次完成的阶段
+LABELS = {"euchr": "euchromatin_cluster", "h3k4": "h3k4me3_cluster"}
+LOG_DIRNAME = "logs_batch_dual"
+
+# ---------- 样本与输入定位（同 Calculate_distance_whole_dual.sh） ----------
+def expand_samples(patterns):
+    """glob / 路径 / 列表文件（@list.txt，每行一个目录）→ 去重后的 Sample-* 目录"""
+    out = []
+    for pat in patterns:
+        if pat.startswith("@"):
+            with open(pat[1:], encoding='utf-8') as f:
+                items = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        else:
+            items = sorted(glob.glob(pat)) or [pat]
+        for it in items:
+            p = Path(it).resolve()
+            if p.is_dir() and p.name.startswith("Sample-") and p not in out:
+                out.append(p)
+            elif not p.is_dir() or not p.name.startswith("Sample-"):
+                print(f"[WARN] 跳过非 Sample-* 目录：{it}", file=sys.stderr)
+    return out
+
+def find_cluster_file(sample_dir: Path, label: str):
+    exact = sample_dir / f"{sample_dir.name}.{LABELS[label]}.txt"
+    if exact.is_file(): return exact
+    hits = sorted(sample_dir.glob(f"*{LABELS[label]}.txt"))
+    return hits[0] if hits else None
+
+def distance_base(cluster_file: Path):
+    name = cluster_file.name
+    for label, stem in LABELS.items():
+        if name.endswith(f".{stem}.txt"):
+            return name[:-len(f".{stem}.txt")]
+    return name
+
+def distance_opts(cfg):
+    """distance 阶段的可选参数（流式内存预算、排序索引、增量）；未设置时不追加，保持原命令行"""
+    opts = ["--mem_budget_mb", f"{cfg['mem_budget_mb']:g}"] if cfg.get('mem_budget_mb') else []
+    opts += ["--sorted_index"] if cfg.get('sorted_index') else []
+    return opts + (["--incremental"] if cfg.get('incremental') else [])
+
+def distance_ext(cfg):
+    """graph 阶段读取的距离文件后缀（文本输出按 --compress 带 .gz / .zst）"""
+    if cfg.get('sorted_index'):
+        return ".edges.sorted.bin"
+    if cfg['out_format'] in ("binary", "both"):
+        return ".edges.bin"
+    return ".txt" + COMPRESS_CHOICES[cfg.get('compress') or "none"]
+
+# ---------- 单样本流水线（worker 内执行） ----------
+def run_stage(fn, argv):
+    """调用阶段 main(argv)；sys.exit(0)（如无数据）视为正常结束"""
+    try:
+        fn(argv)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"exit status {e.code}") from None
+
+def run_sample(sample_dir, cfg):
+    """
+    对一个样本依次跑各阶段，返回结果字典（不抛异常）
+    status: ok | failed | skipped（两种 cluster 文件均不存在）
+    """
+    sample_dir = Path(sample_dir)
+    res = {'sample': sample_dir.name, 'sample_dir': str(sample_dir), 'status': 'ok',
+           'failed_stage': '', 'error': '', 'labels': '', **{f"t_{s}": '' for s in STAGES}}
+    log_dir = sample_dir / LOG_DIRNAME
+    t_all = time.perf_counter()
+    stage = ''
+    try:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        res['log'] = str(log_dir / "batch_dual.log")
+        with open(res['log'], 'w', encoding='utf-8') as log, \
+             contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            inputs = {lab: find_cluster_file(sample_dir, lab) for lab in LABELS}
+            inputs = {lab: fp for lab, fp in inputs.items() if fp is not None}
+            res['labels'] = ",".join(inputs)
+            if not inputs:
+                res['status'] = 'skipped'; res['error'] = '未找到 cluster 文件'
+                return res
+            dist_ext = distance_ext(cfg)
+            for stage in cfg['stages']:
+                t0 = time.perf_counter()
+                print(f"\n######## [{sample_dir.name}] stage={stage} ########", flush=True)
+                for lab, cluster in inputs.items():
+                    dist_dir = sample_dir / f"Whole_genome_distance_dual_{lab}"
+                    dist_txt = dist_dir / f"{distance_base(cluster)}_distance_filtered.txt"
+                    dist_in = dist_txt.with_name(dist_txt.name[:-len(".txt")] + dist_ext)
+                    if stage == "distance":
+                        dist_dir.mkdir(parents=True, exist_ok=True)
+                        run_stage(distance_stage.main, [
+                            str(cluster), str(with_compression(dist_txt, cfg.get('compress'))), "--source_label", lab,
+                            "--threshold", str(cfg['threshold']), "--out_format", cfg['out_format'],
+                            "--sample_dir", str(sample_dir), *distance_opts(cfg)])
+                    elif stage == "graph":
+                        run_stage(graph_stage.main, [
+                            "--distance_file", str(dist_in), "--thresholds", *cfg['thresholds'],
+                            "--node_mode", cfg['node_mode'], "--backend", cfg['backend'],
+                            "--source_label", lab, "--cluster_file", str(cluster),
+                            "--out_root", str(sample_dir / f"graph_matrix_dual_{lab}"),
+                            "--sample_dir", str(sample_dir),
+                            *(["--metrics_db", cfg['metrics_db']] if cfg['metrics_db'] else [])])
+                    elif stage == "merge":
+                        run_stage(merge_stage.main, ["--source_label", lab, "--sample_dir", str(sample_dir)])
+                if stage == "cross":
+                    if len(inputs) < len(LABELS):
+                        print(f"[Skip] cross：缺少 {', '.join(set(LABELS) - set(inputs))} cluster 文件", flush=True)
+                    else:
+                        run_stage(cross_stage.main, [
+                            "--euchr_file", str(inputs['euchr']), "--h3k4_file", str(inputs['h3k4']),
+                            "--threshold", str(cfg['threshold']), "--thresholds", *cfg['thresholds'],
+                            "--sample_dir", str(sample_dir),
+                            *(["--mem_budget_mb", f"{cfg['mem_budget_mb']:g}"] if cfg.get('mem_budget_mb') else [])])
+                if stage == "null":
+                    run_stage(null_stage.main, [
+                        "--labels", ",".join(inputs), "--thresholds", *cfg['thresholds'],
+                        "--node_mode", cfg['node_mode'], "--model", cfg['null_model'],
+                        "--replicates", str(cfg['null_replicates']), "--workers", "1",
+                        *[a for lab in inputs for a in (f"--{lab}_file", str(inputs[lab]))],
+                        "--sample_dir", str(sample_dir)])
+                if stage == "summary":
+                    run_stage(summary_stage.main, ["--thresholds", cfg['summary_thresholds'],
+                                                   "--sample_dir", str(sample_dir),
+                                                   *(["--metrics_db", cfg['metrics_db']] if cfg['metrics_db'] else [])])
+                if stage == "memory":
+                    run_stage(memory_stage.main, [
+                        "--sample_dir", str(sample_dir), "--labels", ",".join(inputs),
+                        "--threshold", str(cfg['threshold']), "--thresholds", *cfg['thresholds'],
+                        "--node_mode", cfg['node_mode'], "--backend", cfg['backend'],
+                        "--summary_thresholds", cfg['summary_thresholds'],
+                        "--out_format", cfg['out_format'], "--compress", cfg.get('compress') or "none",
+                        *(["--skip_intermediates"] if cfg.get('skip_intermediates') else []),
+                        *(["--metrics_db", cfg['metrics_db']] if cfg['metrics_db'] else [])])
+                res[f"t_{stage}"] = f"{time.perf_counter() - t0:.2f}"
+    except Exception as e:
+        res['status'] = 'failed'; res['failed_stage'] = stage
+        res['error'] = f"{type(e).__name__}: {e}".replace("\t", " ").replace("\n", " ")
+        try:
+            with open(res.get('log', os.devnull), 'a', encoding='utf-8') as log:
+                log.write(traceback.format_exc())
+        except OSError:
+            pass
+    finally:
+        res['total_s'] = f"{time.perf_counter() - t_all:.2f}"
+    return res
+
+# ---------- 进程池调度 ----------
+def default_workers():
+    try:
+        return len(os.sched_getaffinity(0))       # 尊重 SLURM / cgroup 绑核
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def run_pool(samples, cfg, workers, retries):
+    """逐样本提交；worker 异常退出导致进程池损坏时，未完成样本在新池中重试"""
+    results, pending = {}, list(samples)
+    for attempt in range(retries + 1):
+        if not pending: break
+        broken = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futs = {pool.submit(run_sample, str(s), cfg): s for s in pending}
+            for fut in as_completed(futs):
+                s = futs[fut]
+                try:
+                    res = fut.result()
+                except BrokenProcessPool:
+                    broken.append(s); continue
+                results[s] = res
+                print(f"[{len(results)}/{len(samples)}] {res['sample']}: {res['status']}"
+                      + (f" ({res['failed_stage']}: {res['error']})" if res['status'] == 'failed' else "")
+                      + f" [{res['total_s']}s]", flush=True)
+        pending = broken
+        if broken and attempt < retries:
+            print(f"[WARN] worker 进程异常退出，重试 {len(broken)} 个样本", file=sys.stderr)
+    for s in pending:
+        results[s] = {'sample': s.name, 'sample_dir': str(s), 'status': 'failed', 'failed_stage': '',
+                      'error': 'worker 进程异常退出（OOM / 信号？）', 'total_s': ''}
+    return [results[s] for s in samples]
+
+def write_report(path, rows):
+    cols = ['sample', 'status', 'failed_stage', 'error', 'labels',
+            *(f"t_{s}" for s in STAGES), 'total_s', 'log', 'sample_dir']
+    path = Path(path)
+    with open_text(path, 'w') as f:
+        f.write("\t".join(cols) + "\n")
+        for r in rows:
+            f.write("\t".join(str(r.get(c, '')) for c in cols) + "\n")
+    return path
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="多样本批处理：distance → graph → merge → summary（本地进程池）")
+    ap.add_argument("samples", nargs='+',
+                    help="Sample-* 目录、glob（如 '/data/Sample-*'）或 @列表文件")
+    ap.add_argument("--workers", type=int, default=default_workers(),
+                    help="进程池大小（默认本节点可用核数）")
+    ap.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                    help=f"逗号分隔，按固定顺序执行（可选 {','.join(STAGES)}；默认 {','.join(DEFAULT_STAGES)}）")
+    ap.add_argument("--threshold", type=float, default=5.0, help="距离阈值（同 Calculate_distance_whole_dual.py）")
+    ap.add_argument("--sorted_index", action="store_true",
+                    help="distance 阶段另存按距离排序的边存储 + 阈值索引，graph 阶段只读所需前缀（需 --out_format binary/both）")
+    ap.add_argument("--mem_budget_mb", type=float, default=None,
+                    help="distance 阶段流式枚举的点对内存预算（MB，同 Calculate_distance_whole_dual.py）")
+    ap.add_argument("--out_format", default="text", choices=["text","binary","both"],
+                    help="距离输出格式；binary/both 时 graph 阶段读 .edges.bin")
+    ap.add_argument("--incremental", action="store_true",
+                    help="distance 阶段增量模式：cluster 文件只改动少数 bin 时修补已有距离输出（同 Calculate_distance_whole_dual.py）")
+    ap.add_argument("--compress", default="none", choices=list(COMPRESS_CHOICES),
+                    help="distance 阶段文本输出压缩（gz / zst，后台线程压缩；zst 需 zstandard 包）")
+    ap.add_argument("--in_memory", action="store_true",
+                    help="distance/graph/merge/summary 合并为 memory 阶段：每样本一个进程内完成，最终产物与分阶段一致")
+    ap.add_argument("--skip_intermediates", action="store_true",
+                    help="memory 阶段不写距离文件与 components_single/*.txt（同 inmemory_pipeline_dual.py）")
+    ap.add_argument("--thresholds", nargs='+', default=["1","1.25","1.5","1.75","2","2.25","2.5","2.75","3"],
+                    help="graph 阶段阈值（同 cluster_and_merge_whole_dual.sh）")
+    ap.add_argument("--node_mode", default="all_bins",
+                    choices=["leq_thr_endpoints","all_distance_endpoints","all_bins"])
+    ap.add_argument("--backend", default="networkx", choices=["networkx","sparse"])
+    ap.add_argument("--summary_thresholds", default="1.5,1.75,2.0,2.25,2.5",
+                    help="summary 阶段阈值（同 summarize_lcc_trend_dual.py）")
+    ap.add_argument("--metrics_db", default=None,
+                    help="graph 阶段同时写入跨样本 metrics 库（SQLite 路径；auto=各样本上一级默认位置）")
+    ap.add_argument("--null_replicates", type=int, default=200, help="null 阶段每个来源的随机化次数（样本内单进程）")
+    ap.add_argument("--null_model", default="homolog_rotate", choices=["jitter","homolog_rotate","uniform_box"],
+                    help="null 阶段坐标随机化方式（同 null_model_dual.py --model）")
+    ap.add_argument("--retries", type=int, default=1, help="worker 异常退出后的重试轮数")
+    ap.add_argument("--report", default="batch_report_dual.tsv", help="汇总报告 TSV 路径")
+    args = ap.parse_args(argv)
+    if args.sorted_index and args.out_format == "text":
+        ap.error("--sorted_index 需要 --out_format binary/both")
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    bad = [s for s in stages if s not in STAGES]
+    if bad:
+        ap.error(f"未知阶段：{bad}（可选 {','.join(STAGES)}）")
+    if args.in_memory:
+        if args.sorted_index or args.incremental:
+            ap.error("--in_memory 不支持 --sorted_index / --incremental（点对不落盘再读）")
+        stages = [s for s in stages if s not in MEMORY_COVERS] + (["memory"] if set(stages) & set(MEMORY_COVERS) else [])
+    stages = [s for s in STAGES if s in stages]
+    samples = expand_samples(args.samples)
+    if not samples:
+        print("[ERROR] 未找到任何 Sample-* 目录", file=sys.stderr); sys.exit(2)
+
+    cfg = {'stages': stages, 'threshold': args.threshold, 'out_format': args.out_format, 'mem_budget_mb': args.mem_budget_mb,
+           'sorted_index': args.sorted_index, 'compress': args.compress, 'incremental': args.incremental,
+           'skip_intermediates': args.skip_intermediates,
+           'thresholds': args.thresholds, 'node_mode': args.node_mode, 'backend': args.backend,
+           'summary_thresholds': args.summary_thresholds,
+           'null_replicates': args.null_replicates, 'null_model': args.null_model,
+           'metrics_db': str(Path(args.metrics_db).resolve()) if args.metrics_db not in (None, "auto") else args.metrics_db}
+    workers = max(1, min(args.workers, len(samples)))
+    print(f"[Info] {len(samples)} samples | workers={workers} | stages={','.join(stages)}", flush=True)
+    t0 = time.perf_counter()
+    rows = run_pool(samples, cfg, workers, args.retries)
+    report = write_report(args.report, rows)
+
+    n_ok = sum(r['status'] == 'ok' for r in rows)
+    failed = [r for r in rows if r['status'] == 'failed']
+    skipped = [r for r in rows if r['status'] == 'skipped']
+    # -------- REPORT --------
+    print("\n=== batch_pipeline_dual REPORT ===")
+    print(f"Samples     : {len(rows)}  | ok: {n_ok} | failed: {len(failed)} | skipped: {len(skipped)}")
+    print(f"Workers     : {workers}")
+    print(f"Stages      : {' → '.join(stages)}")
+    print(f"Wall time   : {time.perf_counter() - t0:.1f}s")
+    print(f"Report      : {report.resolve()}")
+    print(f"Sample logs : <Sample>/{LOG_DIRNAME}/batch_dual.log")
+    if args.metrics_db:
+        print(f"Metrics DB  : {args.metrics_db}（队列汇总：summarize_lcc_trend_dual.py --cohort --metrics_db …）")
+    for r in failed:
+        print(f"  [FAILED] {r['sample']} @ {r['failed_stage'] or '?'}: {r['error']}")
+    print("==================================\n")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成数据基准：生成 Sample-* 目录树，逐阶段 / 逐模式计时并记录峰值内存
+
+run：
+  - 生成合成样本（euchr + h3k4 两种格式，含 Split_based_on_chr_dual_* 拆分文件），
+    参数：bin 数（1e4 ~ 1e7）、染色体数、空间密度（每单位体积 bin 数，坐标在立方体内均匀分布，
+    阈值 r 内期望邻居数 ≈ density·4/3·π·r³）；相同参数的样本复用
+  - 每个 (阶段, 模式) 在独立子进程中运行：墙钟时间 + 该子进程峰值 RSS（os.wait4）
+      distance: kdtree | kdtree_binary | range（前 --range_bins 个 bin）| bruteforce（屏蔽 scipy.spatial；bin 数 ≤ --brute_max）
+      graph   : 每个 --node_modes × --backends（多阈值单遍扫描）
+      merge   : merge_components_dual.py
+  - 结果追加写入 TSV（--out），每行带 run_id / git 版本 / 主机
+compare：
+  对比两次结果（同参数同阶段同模式），时间或内存超出容差记为回归，存在回归时退出码 1
+
+用法：
+  python benchmark_pipeline_dual.py run --bins 1e4 1e5 --chroms 5 --density 0.02 --out bench.tsv
+  python benchmark_pipeline_dual.py compare base.tsv bench.tsv --tolerance 0.15
+"""
+import os, sys, time, json, socket, argparse, subprocess
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+LABEL_FILES = {"euchr": "euchromatin_cluster", "h3k4": "h3k4me3_cluster"}
+BIN_SIZE = 40000
+RESULT_COLS = ["run_id", "timestamp", "git_rev", "host", "n_bins", "n_chrom", "density", "label",
+               "stage", "mode", "repeat", "wall_s", "peak_rss_mb", "status", "note"]
+KEY_COLS = ["n_bins", "n_chrom", "density", "label", "stage", "mode"]
+# 屏蔽 scipy.spatial → Calculate_distance_whole_dual.py 退化为纯 Python 暴力计算
+NO_KDTREE = ("import os, sys, runpy; sys.modules['scipy.spatial'] = None; sys.argv = sys.argv[1:]; "
+             "sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0]))); "
+             "runpy.run_path(sys.argv[0], run_name='__main__')")
+
+# ---------- 合成数据 ----------
+def sample_name(n_bins, n_chrom, density, seed):
+    return f"Sample-bench_n{n_bins}_c{n_chrom}_d{density:g}_s{seed}"
+
+def write_cluster(path, split_dir, name, label, homolog, chrom, allele, locus, xyz):
+    """按原格式写 cluster 文件与按染色体拆分的文件（euchr 按 homolog，h3k4 按 chrom 拆分）"""
+    if label == "euchr":
+        df = pd.DataFrame({"homolog": homolog, "locus": locus})
+        key = df["homolog"]
+    else:
+        df = pd.DataFrame({"chrom": chrom, "allele": allele, "locus": locus})
+        key = df["chrom"]
+    df["x"], df["y"], df["z"] = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    df.to_csv(path, sep="\t", index=False, float_format="%.4f")
+    split_dir.mkdir(parents=True, exist_ok=True)
+    for k, part in df.groupby(key, sort=False):
+        part.to_csv(split_dir / f"{name}_{k}.txt", sep="\t", index=False, float_format="%.4f")
+
+def make_sample(root, n_bins, n_chrom, density, seed=0):
+    """生成（或复用）一个合成 Sample-* 目录；返回其路径"""
+    name = sample_name(n_bins, n_chrom, density, seed)
+    sdir = Path(root) / name
+    params = {'n_bins': n_bins, 'n_chrom': n_chrom, 'density': density, 'seed': seed}
+    marker = sdir / ".bench_params.json"
+    if marker.is_file() and json.loads(marker.read_text()) == params:
+        return sdir
+    sdir.mkdir(parents=True, exist_ok=True)
+    side = (n_bins / density) ** (1 / 3)
+    for k, label in enumerate(LABEL_FILES):
+        rng = np.random.default_rng(seed * 2 + k)
+        n_hom = 2 * n_chrom
+        counts = np.diff(np.linspace(0, n_bins, n_hom + 1).astype(np.int64))
+        hom_idx = np.repeat(np.arange(n_hom), counts)
+        within = np.arange(n_bins) - np.repeat(np.cumsum(counts) - counts, counts)
+        chrom = np.array([f"chr{c + 1}" for c in range(n_chrom)], dtype=object)[hom_idx // 2]
+        allele = np.array(["mat", "pat"], dtype=object)[hom_idx % 2]
+        homolog = chrom + "(" + allele + ")"
+        xyz = rng.uniform(0, side, size=(n_bins, 3))
+        write_cluster(sdir / f"{name}.{LABEL_FILES[label]}.txt", sdir / f"Split_based_on_chr_dual_{label}",
+                      name, label, homolog, chrom, allele, within * BIN_SIZE, xyz)
+    marker.write_text(json.dumps(params))
+    return sdir
+
+# ---------- 子进程计时 ----------
+def run_measured(argv, log_path, env):
+    """运行子进程 → (wall_s, peak_rss_mb, returncode)；峰值 RSS 取自该子进程自身的 rusage"""
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'w', encoding='utf-8') as log:
+        t0 = time.perf_counter()
+        p = subprocess.Popen(argv, stdout=log, stderr=subprocess.STDOUT, env=env)
+        _, status, ru = os.wait4(p.pid, 0)
+        wall = time.perf_counter() - t0
+    return wall, ru.ru_maxrss / 1024.0, os.waitstatus_to_exitcode(status)
+
+def bench_cases(sdir, label, n, args):
+    """
+    → (cases, prereq)：cases 为 (stage, mode, argv, note) 列表，按依赖顺序（kdtree 的距离输出供 graph 使用）；
+    prereq 为生成 graph 所需距离文件的命令（distance/kdtree 不在本次用例中时不计时执行）
+    """
+    name = sdir.name
+    cluster = sdir / f"{name}.{LABEL_FILES[label]}.txt"
+    ddir = sdir / f"Whole_genome_distance_dual_{label}"
+    dist_txt = ddir / f"{name}_distance_filtered.txt"
+    py, thr = sys.executable, str(args.threshold)
+    calc = [str(SCRIPT_DIR / "Calculate_distance_whole_dual.py"), str(cluster)]
+    common = ["--source_label", label, "--threshold", thr, "--sample_dir", str(sdir)]
+    cases = []
+    if "distance" in args.stages:
+        for mode in args.distance_modes:
+            if mode == "kdtree":
+                cases.append(("distance", mode, [py, *calc, str(dist_txt), *common], ""))
+            elif mode == "kdtree_binary":
+                cases.append(("distance", mode, [py, *calc, str(ddir / "bench_bin_distance_filtered.txt"),
+                                                 *common, "--out_format", "binary"], ""))
+            elif mode == "kdtree_stream":
+                cases.append(("distance", mode, [py, *calc, str(ddir / "bench_stream_distance_filtered.txt"),
+                                                 *common, "--mem_budget_mb", f"{args.mem_budget_mb:g}"],
+                              f"budget {args.mem_budget_mb:g} MB"))
+            elif mode == "range":
+                end = min(n, args.range_bins) - 1
+                cases.append(("distance", mode, [py, *calc, str(ddir / "bench_range_part.txt"), *common,
+                                                 "--range", "0", str(end)], f"bins 0..{end}"))
+            elif mode == "bruteforce":
+                if n > args.brute_max:
+                    cases.append(("distance", mode, None, f"skipped: n_bins > --brute_max {args.brute_max}"))
+                else:
+                    cases.append(("distance", mode, [py, "-c", NO_KDTREE, *calc,
+                                                     str(ddir / "bench_brute_distance.txt"), *common], ""))
+    if "graph" in args.stages:
+        for node_mode in args.node_modes:
+            for backend in args.backends:
+                cases.append(("graph", f"{node_mode}/{backend}", [
+                    py, str(SCRIPT_DIR / "analyze_graph_parallel_dual.py"), "--distance_file", str(dist_txt),
+                    "--thresholds", *args.thresholds, "--node_mode", node_mode, "--backend", backend,
+                    "--source_label", label, "--cluster_file", str(cluster),
+                    "--out_root", str(sdir / f"graph_matrix_dual_{label}"), "--sample_dir", str(sdir)],
+                    f"{len(args.thresholds)} thresholds"))
+    if "merge" in args.stages:
+        cases.append(("merge", "components", [py, str(SCRIPT_DIR / "merge_components_dual.py"),
+                                              "--source_label", label, "--sample_dir", str(sdir)], ""))
+    return cases, [py, *calc, str(dist_txt), *common]
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "-C", str(SCRIPT_DIR), "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+def append_results(path, rows):
+    path = Path(path)
+    new = not path.exists() or path.stat().st_size == 0
+    pd.DataFrame(rows, columns=RESULT_COLS).to_csv(path, sep="\t", index=False, mode='a', header=new)
+
+def cmd_run(args):
+    workdir = Path(args.workdir).resolve()
+    env = dict(os.environ)
+    if not args.bin_cache:
+        env["ANDIE_BIN_CACHE"] = "0"       # 每次都真实解析，避免缓存命中掩盖读取开销
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    meta = {'run_id': run_id, 'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'git_rev': git_rev(), 'host': socket.gethostname()}
+    n_rows = n_fail = 0
+    for n_bins in (int(float(b)) for b in args.bins):
+        for n_chrom in args.chroms:
+            for density in args.density:
+                t0 = time.perf_counter()
+                sdir = make_sample(workdir, n_bins, n_chrom, density, args.seed)
+                print(f"[DATA] {sdir.name} ({time.perf_counter() - t0:.1f}s)", flush=True)
+                for label in args.labels:
+                    cases, prereq = bench_cases(sdir, label, n_bins, args)
+                    (sdir / f"Whole_genome_distance_dual_{label}").mkdir(parents=True, exist_ok=True)
+                    has_kdtree = any(c[:2] == ("distance", "kdtree") for c in cases)
+                    if "graph" in args.stages and not has_kdtree and not Path(prereq[3]).exists():
+                        run_measured(prereq, workdir / "logs" / f"{sdir.name}_{label}_prereq.log", env)
+                    for stage, mode, argv, note in cases:
+                        for rep in range(args.repeat):
+                            base = {**meta, 'n_bins': n_bins, 'n_chrom': n_chrom, 'density': density,
+                                    'label': label, 'stage': stage, 'mode': mode, 'repeat': rep, 'note': note}
+                            if argv is None:
+                                rows = [{**base, 'wall_s': '', 'peak_rss_mb': '', 'status': 'skipped'}]
+                                append_results(args.out, rows); n_rows += 1
+                                print(f"  {label:5s} {stage:8s} {mode:32s} skipped ({note})", flush=True)
+                                break
+                            log = workdir / "logs" / f"{sdir.name}_{label}_{stage}_{mode.replace('/', '-')}_{rep}.log"
+                            wall, rss, rc = run_measured(argv, log, env)
+                            status = "ok" if rc == 0 else f"exit{rc}"
+                            n_fail += rc != 0
+                            append_results(args.out, [{**base, 'wall_s': f"{wall:.3f}",
+                                                       'peak_rss_mb': f"{rss:.1f}", 'status': status}])
+                            n_rows += 1
+                            print(f"  {label:5s} {stage:8s} {mode:32s} {wall:9.2f}s {rss:9.1f} MB  {status}", flush=True)
+
+    print("\n=== benchmark_pipeline_dual REPORT ===")
+    print(f"Run id      : {run_id} (git {meta['git_rev']}, host {meta['host']})")
+    print(f"Work dir    : {workdir}")
+    print(f"Bin cache   : {'on' if args.bin_cache else 'off'}")
+    print(f"Results     : {Path(args.out).resolve()} (+{n_rows} rows, {n_fail} failed)")
+    print("======================================\n")
+    return 1 if n_fail else 0
+
+# ---------- 对比 ----------
+def summarize_runs(df):
+    """同一 (参数, 阶段, 模式) 多次重复取最小墙钟时间与最大峰值内存；只取各文件最后一个 run_id"""
+    df = df[(df["status"] == "ok") & (df["run_id"] == df["run_id"].iloc[-1])] if len(df) else df
+    return df.groupby(KEY_COLS).agg(wall_s=("wall_s", "min"), peak_rss_mb=("peak_rss_mb", "max"))
+
+def cmd_compare(args):
+    base = summarize_runs(pd.read_csv(args.base, sep="\t", dtype={"run_id": str}))
+    new = summarize_runs(pd.read_csv(args.new, sep="\t", dtype={"run_id": str}))
+    cmp = base.join(new, lsuffix="_base", rsuffix="_new", how="outer")
+    cmp["wall_ratio"] = cmp["wall_s_new"] / cmp["wall_s_base"]
+    cmp["rss_ratio"] = cmp["peak_rss_mb_new"] / cmp["peak_rss_mb_base"]
+    slow = (cmp["wall_ratio"] > 1 + args.tolerance) & (cmp["wall_s_new"] - cmp["wall_s_base"] > args.min_seconds)
+    fat = (cmp["rss_ratio"] > 1 + args.rss_tolerance) & (cmp["peak_rss_mb_new"] - cmp["peak_rss_mb_base"] > args.min_mb)
+    cmp["flag"] = np.select([slow & fat, slow, fat, cmp["wall_s_new"].isna(), cmp["wall_s_base"].isna()],
+                            ["REGRESSION(time,mem)", "REGRESSION(time)", "REGRESSION(mem)", "missing_new", "new_case"],
+                            default="")
+    cols = ["wall_s_base", "wall_s_new", "wall_ratio", "peak_rss_mb_base", "peak_rss_mb_new", "rss_ratio", "flag"]
+    with pd.option_context("display.max_rows", None, "display.width", 220, "display.float_format", "{:.3f}".format):
+        print(cmp[cols].reset_index().to_string(index=False))
+    if args.out:
+        cmp[cols].reset_index().to_csv(args.out, sep="\t", index=False)
+    n_reg = int(cmp["flag"].str.startswith("REGRESSION").sum())
+    print(f"\n[{'FAIL' if n_reg else 'OK'}] {n_reg} regressions (time tol {args.tolerance:.0%}, "
+          f"mem tol {args.rss_tolerance:.0%}) among {len(cmp)} cases")
+    return 1 if n_reg else 0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="合成数据基准（distance / graph / merge 各阶段与模式）")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="生成合成样本并计时")
+    p.add_argument("--bins", nargs='+', default=["1e4"], help="bin 数（可多个，如 1e4 1e5 1e6）")
+    p.add_argument("--chroms", nargs='+', type=int, default=[5], help="染色体数（每条 mat/pat 两个 homolog）")
+    p.add_argument("--density", nargs='+', type=float, default=[0.02], help="每单位体积 bin 数")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--labels", nargs='+', default=["euchr", "h3k4"], choices=["euchr", "h3k4"])
+    p.add_argument("--stages", nargs='+', default=["distance", "graph", "merge"],
+                   choices=["distance", "graph", "merge"])
+    p.add_argument("--distance_modes", nargs='+', default=["kdtree", "kdtree_binary", "range", "bruteforce"],
+                   choices=["kdtree", "kdtree_binary", "kdtree_stream", "range", "bruteforce"])
+    p.add_argument("--node_modes", nargs='+', default=["leq_thr_endpoints", "all_distance_endpoints", "all_bins"],
+                   choices=["leq_thr_endpoints", "all_distance_endpoints", "all_bins"])
+    p.add_argument("--backends", nargs='+', default=["networkx", "sparse"], choices=["networkx", "sparse"])
+    p.add_argument("--threshold", type=float, default=5.0, help="距离阈值")
+    p.add_argument("--thresholds", nargs='+', default=["1", "1.5", "2", "2.5", "3"], help="graph 阶段阈值")
+    p.add_argument("--mem_budget_mb", type=float, default=64, help="kdtree_stream 模式的点对内存预算（MB）")
+    p.add_argument("--range_bins", type=int, default=2000, help="range 模式处理的 bin 数（纯 Python，O(range·n)）")
+    p.add_argument("--brute_max", type=int, default=20000, help="bruteforce 模式的最大 bin 数（O(n²)）")
+    p.add_argument("--repeat", type=int, default=1, help="每个用例重复次数（compare 取最小时间）")
+    p.add_argument("--bin_cache", action="store_true", help="允许 bin 缓存（默认关闭，测真实解析开销）")
+    p.add_argument("--workdir", default="bench_dual_work", help="合成样本与日志目录（同参数样本复用）")
+    p.add_argument("--out", default="bench_dual_results.tsv", help="结果 TSV（追加）")
+    p = sub.add_parser("compare", help="对比两次结果并标记回归")
+    p.add_argument("base"); p.add_argument("new")
+    p.add_argument("--tolerance", type=float, default=0.10, help="时间容差（相对，默认 10%%）")
+    p.add_argument("--min_seconds", type=float, default=0.5, help="绝对差小于此值不计为回归")
+    p.add_argument("--rss_tolerance", type=float, default=0.10, help="内存容差（相对）")
+    p.add_argument("--min_mb", type=float, default=20.0, help="内存绝对差小于此值不计为回归")
+    p.add_argument("--out", default=None, help="对比表 TSV")
+    args = ap.parse_args(argv)
+    sys.exit(cmd_run(args) if args.command == "run" else cmd_compare(args))
+
+if __name__ == "__main__":
+    main()
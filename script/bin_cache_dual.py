@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cluster 文件解析结果的持久缓存（可 mmap）
+
+缓存放在输入文件同目录的 .bins_cache/ 下，每个 (文件, 显式格式, 是否需坐标) 一个子目录：
+  .bins_cache/<文件名>.<euchr|h3k4|auto>.<xyz|noxyz>/
+      meta.json     指纹：path, size, mtime_ns, blake2b 内容哈希；以及 fmt / locus_idx、本次构建的 token
+      labels.npy    homolog 分类标签（定长 unicode）
+      codes.npy     int32
+      locus.npy     int64（或定长 unicode）
+      xyz.npy       (n,3) float64（仅 xyz 变体）
+      token         最后写入，内容同 meta.json 中的 token
+有效性：path 须一致（连同 .bins_cache 整体拷贝到别处的缓存不复用）；size 与 mtime 一致直接命中；
+mtime 变化但 size 相同时比对内容哈希（原地拷贝覆盖 / touch 不失效）。
+失效或缺失时重新解析，先写临时目录再原子改名替换，并发任务最多重复构建。meta 与数组分别打开，
+读取端载入数组后再核对 token 与 meta 一致，中途被替换则放弃缓存直接解析，不会混用两次构建的文件。
+环境变量 ANDIE_BIN_CACHE=0 关闭缓存（直接解析）。
+"""
+import os, json, shutil, hashlib
+from pathlib import Path
+import numpy as np
+
+from columnar_io_dual import ClusterTable, read_cluster_table
+
+CACHE_DIRNAME = ".bins_cache"
+CACHE_VERSION = 2
+_ARRAYS = ("labels", "codes", "locus", "xyz")
+
+def content_hash(path, block=1 << 22):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_dir_for(path, source_label=None, require_xyz=True):
+    p = Path(path).resolve()
+    variant = f"{source_label or 'auto'}.{'xyz' if require_xyz else 'noxyz'}"
+    return p.parent / CACHE_DIRNAME / f"{p.name}.{variant}"
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return {'path': str(Path(path).resolve()), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _is_valid(cdir, path):
+    """返回 (是否有效, meta)；只在 size 相同而 mtime 不同时才计算内容哈希"""
+    try:
+        with open(cdir / "meta.json", encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    fp = _fingerprint(path)
+    if (meta.get('version') != CACHE_VERSION or meta.get('path') != fp['path']
+            or meta.get('size') != fp['size']):
+        return False, meta
+    if meta.get('mtime_ns') == fp['mtime_ns']:
+        return True, meta
+    return meta.get('blake2b') == content_hash(path), meta
+
+def _load(cdir, meta):
+    arr = {k: np.load(cdir / f"{k}.npy", mmap_mode='r') for k in _ARRAYS if (cdir / f"{k}.npy").exists()}
+    if (cdir / "token").read_text(encoding='utf-8') != meta['token']:
+        raise ValueError(f"{cdir} 在读取过程中被替换")
+    locus = arr['locus']
+    if locus.dtype.kind == 'U':
+        locus = np.asarray(locus).astype(object)
+    return ClusterTable(meta['fmt'], np.asarray(arr['labels']), arr['codes'], locus,
+                        arr.get('xyz'), meta['locus_idx'])
+
+def _write(cdir, path, tab):
+    """写入临时目录后原子替换 cdir"""
+    cdir.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cdir.parent / f".{cdir.name}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    np.save(tmp / "labels.npy", np.asarray(tab.labels, dtype=str))
+    np.save(tmp / "codes.npy", np.asarray(tab.codes, dtype=np.int32))
+    locus = tab.locus if tab.locus.dtype != object else np.asarray(tab.locus, dtype=str)
+    np.save(tmp / "locus.npy", locus)
+    if tab.xyz is not None:
+        np.save(tmp / "xyz.npy", np.ascontiguousarray(tab.xyz, dtype=float))
+    token = os.urandom(8).hex()
+    meta = dict(_fingerprint(path), version=CACHE_VERSION, blake2b=content_hash(path),
+                fmt=tab.fmt, locus_idx=tab.locus_idx, n=len(tab), token=token)
+    with open(tmp / "meta.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1)
+    (tmp / "token").write_text(token, encoding='utf-8')
+    old = cdir.parent / f".{cdir.name}.old-{os.getpid()}"
+    try:
+        os.replace(cdir, old)
+    except FileNotFoundError:
+        pass
+    except OSError:           # 其他进程正在替换：放弃本次写入
+        shutil.rmtree(tmp, ignore_errors=True); return
+    try:
+        os.replace(tmp, cdir)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    shutil.rmtree(old, ignore_errors=True)
+
+def load_cluster_table(path, source_label=None, require_xyz=True, use_cache=None):
+    """
+    带缓存的 read_cluster_table：命中则 mmap 载入，否则解析并（尽力）写缓存
+    缓存目录不可写时静默退化为直接解析；use_cache=None 时由 ANDIE_BIN_CACHE 决定（默认开）
+    返回 (ClusterTable, 'hit'|'rebuilt'|'off')
+    """
+    if use_cache is None:
+        use_cache = os.environ.get("ANDIE_BIN_CACHE", "1") != "0"
+    if not use_cache:
+        return read_cluster_table(path, source_label, require_xyz), 'off'
+    cdir = cache_dir_for(path, source_label, require_xyz)
+    ok, meta = _is_valid(cdir, path)
+    if ok:
+        try:
+            return _load(cdir, meta), 'hit'
+        except (OSError, ValueError, KeyError):
+            pass
+    tab = read_cluster_table(path, source_label, require_xyz)
+    try:
+        _write(cdir, path, tab)
+    except OSError:
+        return tab, 'off'
+    return tab, 'rebuilt'
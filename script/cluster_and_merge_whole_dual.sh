@@ -1,6 +1,6 @@
 #!/bin/bash
 # cluster_and_merge_whole_dual.sh
-# Usage: bash cluster_and_merge_whole_dual.sh [THRESHOLDS...]
+# Usage: [CLUSTER_MODE=sweep|per_threshold] [GRAPH_BACKEND=networkx|sparse] bash cluster_and_merge_whole_dual.sh [THRESHOLDS...]
 # - 严格：只读带后缀 Whole_genome_distance_dual_{euchr|h3k4}/
 # - 双输出：graph_matrix_dual_{euchr|h3k4}/
 set -euo pipefail
@@ -38,12 +38,27 @@ WHOLE_DIR_EU="${PROJECT_DIR}/Whole_genome_distance_dual_euchr"
 WHOLE_DIR_H3="${PROJECT_DIR}/Whole_genome_distance_dual_h3k4"
 MERGED_EU="${WHOLE_DIR_EU}/${BASE_NAME}_distance_filtered.txt"
 MERGED_H3="${WHOLE_DIR_H3}/${BASE_NAME}_distance_filtered.txt"
+# 无明文时取压缩版本（.txt.gz / .txt.zst，读取端按扩展名解压）
+for ext in gz zst; do
+  if [[ ! -f "$MERGED_EU" && -f "${MERGED_EU}.${ext}" ]]; then MERGED_EU="${MERGED_EU}.${ext}"; fi
+  if [[ ! -f "$MERGED_H3" && -f "${MERGED_H3}.${ext}" ]]; then MERGED_H3="${MERGED_H3}.${ext}"; fi
+done
+# 若存在二进制边存储则优先使用（memmap 读取，无逐行解析）
+[[ -f "${WHOLE_DIR_EU}/${BASE_NAME}_distance_filtered.edges.bin" ]] && MERGED_EU="${WHOLE_DIR_EU}/${BASE_NAME}_distance_filtered.edges.bin"
+[[ -f "${WHOLE_DIR_H3}/${BASE_NAME}_distance_filtered.edges.bin" ]] && MERGED_H3="${WHOLE_DIR_H3}/${BASE_NAME}_distance_filtered.edges.bin"
+# 按距离排序的边存储更优先（Calculate_distance_whole_dual.sh SORTED_INDEX=1）：各阈值作业只读 d≤thr 的前缀
+[[ -f "${WHOLE_DIR_EU}/${BASE_NAME}_distance_filtered.edges.sorted.bin" ]] && MERGED_EU="${WHOLE_DIR_EU}/${BASE_NAME}_distance_filtered.edges.sorted.bin"
+[[ -f "${WHOLE_DIR_H3}/${BASE_NAME}_distance_filtered.edges.sorted.bin" ]] && MERGED_H3="${WHOLE_DIR_H3}/${BASE_NAME}_distance_filtered.edges.sorted.bin"
 
 # 对应 cluster 文件（all_bins 模式需要）
 CLUSTER_EU="$(ls -1 "${SAMPLE_DIR}"/*euchromatin_cluster.txt 2>/dev/null | head -n1 || true)"
 CLUSTER_H3="$(ls -1 "${SAMPLE_DIR}"/*h3k4me3_cluster.txt 2>/dev/null | head -n1 || true)"
 
 NODE_MODE="all_bins"  # 你原来的默认
+# sweep：每个 label 一个作业，单遍 union-find 扫完全部阈值；per_threshold：每阈值一个作业
+CLUSTER_MODE="${CLUSTER_MODE:-sweep}"
+# networkx（参考实现）| sparse（整数 id + CSR，省内存）
+GRAPH_BACKEND="${GRAPH_BACKEND:-networkx}"
 
 echo "========== PLAN（输入读取结构） =========="
 echo "Sample name : ${BASE_NAME}"
@@ -58,6 +73,8 @@ echo "  euchr → ${PROJECT_DIR}/graph_matrix_dual_euchr/"
 echo "  h3k4  → ${PROJECT_DIR}/graph_matrix_dual_h3k4/"
 echo "Thresholds: ${THRESHOLDS[*]}"
 echo "Node mode : ${NODE_MODE}"
+echo "Cluster mode: ${CLUSTER_MODE}"
+echo "Backend   : ${GRAPH_BACKEND}"
 echo "========================================="
 
 # 严格校验输入
@@ -73,11 +90,36 @@ submit_group() {
   local dist_file="$2"
   local cluster_file="$3"
   local deps=()
-  for d in "${THRESHOLDS[@]}"; do
-    tag="${d//./p}"
-    job_script="$(mktemp /tmp/cluster_${label}_${tag}_XXXX.sh)"
+  if [[ "$CLUSTER_MODE" == "sweep" ]]; then
+    job_script="$(mktemp /tmp/cluster_${label}_sweep_XXXX.sh)"
     cat > "$job_script" << EOF
 #!/bin/bash
+#SBATCH --job-name=cluster_${label}_sweep
+#SBATCH --output=${LOG_DIR}/cluster_${label}_sweep.out
+#SBATCH --error=${LOG_DIR}/cluster_${label}_sweep.err
+#SBATCH --time=04:00:00
+#SBATCH --mem=8G
+#SBATCH --chdir=${SCRIPT_DIR}
+
+python3 "${SCRIPT_DIR}/analyze_graph_parallel_dual.py" \
+  --distance_file "${dist_file}" \
+  --thresholds ${THRESHOLDS[*]} \
+  --node_mode "${NODE_MODE}" \
+  --backend "${GRAPH_BACKEND}" \
+  --source_label "${label}" \
+  --cluster_file "${cluster_file}" \
+  --out_root "${PROJECT_DIR}/graph_matrix_dual_${label}"
+EOF
+    jid=$(sbatch "$job_script" | awk '{print $NF}')
+    rm -f "$job_script"
+    deps+=("$jid")
+    echo "Submitted ${label} clustering sweep thr=${THRESHOLDS[*]} (jobid=${jid})"
+  else
+    for d in "${THRESHOLDS[@]}"; do
+      tag="${d//./p}"
+      job_script="$(mktemp /tmp/cluster_${label}_${tag}_XXXX.sh)"
+      cat > "$job_script" << EOF
+#!/bin/bash
 #SBATCH --job-name=cluster_${label}_${tag}
 #SBATCH --output=${LOG_DIR}/cluster_${label}_${tag}.out
 #SBATCH --error=${LOG_DIR}/cluster_${label}_${tag}.err
@@ -90,15 +132,17 @@ python3 "${SCRIPT_DIR}/analyze_graph_parallel_dual.py" \
   --threshold ${d} \
   --output_prefix whole${d} \
   --node_mode "${NODE_MODE}" \
+  --backend "${GRAPH_BACKEND}" \
   --source_label "${label}" \
   --cluster_file "${cluster_file}" \
   --out_root "${PROJECT_DIR}/graph_matrix_dual_${label}"
 EOF
-    jid=$(sbatch "$job_script" | awk '{print $NF}')
-    rm -f "$job_script"
-    deps+=("$jid")
-    echo "Submitted ${label} clustering thr=${d} (jobid=${jid})"
-  done
+      jid=$(sbatch "$job_script" | awk '{print $NF}')
+      rm -f "$job_script"
+      deps+=("$jid")
+      echo "Submitted ${label} clustering thr=${d} (jobid=${jid})"
+    done
+  fi
 
   local dep_str; dep_str=$(IFS=:; echo "${deps[*]}")
   merge_job="$(mktemp /tmp/merge_${label}_XXXX.sh)"
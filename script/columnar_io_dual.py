@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cluster / 距离文件的共享列式读取（C 级分词 + 分块）
+
+- cluster（euchr / h3k4，含拆分后的 Split_based_on_chr_dual_* 文件）→ ClusterTable
+    homolog 标签 → 分类编码（labels + codes），locus → int64（非规范整数文本时保留字符串），
+    坐标 → (n,3) float64
+- 距离文件 → (labels, index_of, u, v, d)，节点 id 按首次出现顺序分配
+
+解析语义与原逐行实现一致：按任意空白切分，多余列忽略，列数不足或坐标/距离无法解析的行跳过
+.gz / .zst 文件按扩展名透明解压（pandas 推断；首行探测走 stream_io_dual.open_text）
+"""
+import re
+import numpy as np
+import pandas as pd
+
+from stream_io_dual import open_text
+
+CHUNK_ROWS = 1_000_000
+
+# ---------- 格式判定 ----------
+def detect_format_from_file(first_line: str):
+    """
+    返回 ('euchr'|'h3k4', has_header: bool, locus_idx: int)
+    - euchr: 第一列 homolog，如 chr1(mat)，第二列 locus → locus_idx=1
+    - h3k4 : 第一列 chrom, 第二列 allele, 第三列 locus → locus_idx=2
+    """
+    s = first_line.strip()
+    parts = s.split()
+    if not parts: return "euchr", False, 1
+    h0 = parts[0].lower()
+    if h0 == "homolog": return "euchr", True, 1
+    if h0 in ("chrom", "allele"): return "h3k4", True, 2
+    if re.match(r"^chr[^()]+\((mat|pat)\)$", parts[0]): return "euchr", False, 1
+    if len(parts) >= 2 and parts[1] in ("mat","pat"): return "h3k4", False, 2
+    return "euchr", False, 1
+
+def _first_line(path):
+    with open_text(path) as f:
+        for line in f:
+            return line
+    return ""
+
+def _read_str_columns(path, ncols, skip_header, chunksize):
+    """
+    按空白切分读取前 ncols 列（全部为 str），逐块产出 DataFrame
+    NA / nan / null 等文本原样保留（同 str.split）；只有列数不足的缺失字段为 NaN
+    """
+    reader = pd.read_csv(path, sep=r"\s+", engine="c", header=None,
+                         names=range(ncols), usecols=range(ncols), dtype=str,
+                         skiprows=1 if skip_header else 0, chunksize=chunksize,
+                         skip_blank_lines=True, na_filter=False, keep_default_na=False)
+    for df in reader:
+        yield df.replace("", np.nan)      # 按空白切分不会产生空字段，"" 只来自缺列
+
+# ---------- cluster 文件 ----------
+class ClusterTable:
+    """
+    列式 bin 表
+    - fmt    : 'euchr' | 'h3k4'
+    - labels : 分类标签（str ndarray，如 'chr1(mat)'），codes 为每行在 labels 中的下标（int32）
+    - locus  : int64 ndarray；若原文本不是规范整数则为 str(object) ndarray
+    - xyz    : (n,3) float64；require_xyz=False 读入时为 None
+    - locus_idx: 原文件中 locus 所在列（报告用）
+    """
+    def __init__(self, fmt, labels, codes, locus, xyz, locus_idx):
+        self.fmt, self.labels, self.codes, self.locus, self.xyz = fmt, labels, codes, locus, xyz
+        self.locus_idx = locus_idx
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def homolog(self):
+        """每行的 homolog 标签（object ndarray）"""
+        return self.labels.astype(object)[self.codes]
+
+    @property
+    def locus_str(self):
+        return self.locus.astype(str).astype(object)
+
+    def keys(self, sep):
+        """每行 f"{homolog}{sep}{locus}"（object ndarray）"""
+        return self.homolog + sep + self.locus_str
+
+    def nodes(self):
+        """[(homolog, locus_str), ...]"""
+        return list(zip(self.homolog.tolist(), self.locus_str.tolist()))
+
+def read_cluster_table(path, source_label=None, require_xyz=True, chunksize=CHUNK_ROWS):
+    """
+    读取 euchr / h3k4 cluster 文件 → ClusterTable
+    source_label 非空时以显式格式为准；require_xyz=False 时只需标签与 locus 列
+    """
+    fmt, has_header, locus_idx = detect_format_from_file(_first_line(path))
+    if source_label:
+        fmt = source_label
+    nlab = 1 if fmt == "euchr" else 2
+    ncols = nlab + 1 + (3 if require_xyz else 0)
+
+    lab_parts, loc_parts, xyz_parts = [], [], []
+    for df in _read_str_columns(path, ncols, has_header, chunksize):
+        df = df.dropna()
+        if require_xyz:
+            xyz = df.iloc[:, nlab + 1:nlab + 4].apply(pd.to_numeric, errors='coerce')
+            ok = xyz.notna().all(axis=1).to_numpy()
+            df, xyz = df[ok], xyz[ok]
+            xyz_parts.append(xyz.to_numpy(dtype=float))
+        lab = df[0] if fmt == "euchr" else df[0] + "(" + df[1] + ")"
+        lab_parts.append(lab.to_numpy(dtype=object))
+        loc_parts.append(df[nlab].to_numpy(dtype=object))
+
+    lab = np.concatenate(lab_parts) if lab_parts else np.empty(0, dtype=object)
+    codes, labels = pd.factorize(lab, sort=False)
+    loc = np.concatenate(loc_parts) if loc_parts else np.empty(0, dtype=object)
+    locus = _as_int_locus(loc)
+    xyz = (np.concatenate(xyz_parts) if xyz_parts else np.empty((0, 3))) if require_xyz else None
+    return ClusterTable(fmt, np.asarray(labels, dtype=str), codes.astype(np.int32), locus, xyz, locus_idx)
+
+def _as_int_locus(loc):
+    """locus 文本 → int64；仅当往返文本完全一致（规范整数）时转换，否则保留字符串"""
+    num = pd.to_numeric(pd.Series(loc), errors='coerce')
+    if num.isna().any() or not (num % 1 == 0).all():
+        return loc
+    as_int = num.to_numpy(dtype=np.int64)
+    if not np.array_equal(as_int.astype(str).astype(object), loc):
+        return loc
+    return as_int
+
+# ---------- 距离文件 ----------
+def iter_distance_chunks(path, chunksize=CHUNK_ROWS):
+    """
+    逐块产出 (c1, l1, c2, l2, d)：前四列为 object ndarray，d 为 float64
+    距离无法解析或列数不足的行跳过
+    """
+    for df in _read_str_columns(path, 5, False, chunksize):
+        d = pd.to_numeric(df[4], errors='coerce')
+        ok = (df[[0, 1, 2, 3]].notna().all(axis=1) & d.notna()).to_numpy()
+        df = df[ok]
+        yield (df[0].to_numpy(dtype=object), df[1].to_numpy(dtype=object),
+               df[2].to_numpy(dtype=object), df[3].to_numpy(dtype=object),
+               d[ok].to_numpy(dtype=float))
+
+def read_distance_edges(path, sep=":", chunksize=CHUNK_ROWS):
+    """
+    距离文件 → (labels, index_of, u, v, d)
+    节点键 f"{chrom}{sep}{locus}"；id 按首次出现顺序（先 u 后 v）分配。
+    每块内先 factorize，再只对块内的新键查全局字典
+    """
+    labels, index_of = [], {}
+    us, vs, ds = [], [], []
+    for c1, l1, c2, l2, d in iter_distance_chunks(path, chunksize):
+        k1 = c1 + sep + l1; k2 = c2 + sep + l2
+        seq = np.column_stack([k1, k2]).ravel()
+        local, uniq = pd.factorize(seq, sort=False)
+        glob = np.empty(len(uniq), dtype=np.int64)
+        for k, key in enumerate(uniq.tolist()):
+            g = index_of.get(key)
+            if g is None:
+                g = index_of[key] = len(labels); labels.append(key)
+            glob[k] = g
+        ids = glob[local].reshape(-1, 2)
+        us.append(ids[:, 0]); vs.append(ids[:, 1]); ds.append(d)
+    cat = lambda parts, dt: np.concatenate(parts) if parts else np.empty(0, dtype=dt)
+    return labels, index_of, cat(us, np.int64), cat(vs, np.int64), cat(ds, float)
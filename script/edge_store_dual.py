@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二进制边存储（替代 _distance_filtered.txt 文本）
+
+一份存储由两个文件组成（同一前缀）：
+  <prefix>.edges.bin  定长记录 (u:int32, v:int32, d:float64)，无表头，按写入顺序
+  <prefix>.nodes.tsv  节点表：第 k 行（表头后）即节点 id=k，两列 chrom_label, locus
+读取用 numpy.memmap，不做逐行解析；距离以 float64 存储，与文本同值（d<=thr 的判定与读文本一致）
+
+按距离排序的副本（可选，供按阈值只读前缀）：
+  <prefix>.edges.sorted.bin      记录 (u, v, d, pos:int64)，按 d 稳定排序；pos 为原存储中的行号（恢复文件顺序）
+  <prefix>.edges.sorted.idx.npz  阈值格点 → 行数 / 字节偏移（d<=格点的前缀长度）+ 全部端点的首次出现顺序
+  读阈值 t：索引定位 t 所在格点区间，区间内二分得到精确前缀，只触及前缀页面
+
+命令行：
+  python edge_store_dual.py to_text   X_distance_filtered.edges.bin  X_distance_filtered.txt
+  python edge_store_dual.py from_text X_distance_filtered.txt         X_distance_filtered.edges.bin
+  python edge_store_dual.py sort      X_distance_filtered.edges.bin  [--step 0.05]
+文本一侧可带 .gz / .zst 扩展名（stream_io_dual 透明压缩）；所有输出先写临时文件再改名
+"""
+import sys, argparse
+from pathlib import Path
+import numpy as np
+
+from stream_io_dual import open_text, open_binary, atomic_output, strip_compression
+from columnar_io_dual import read_distance_edges
+
+EDGE_DTYPE = np.dtype([('u', '<i4'), ('v', '<i4'), ('d', '<f8')])
+SORTED_DTYPE = np.dtype([('u', '<i4'), ('v', '<i4'), ('d', '<f8'), ('pos', '<i8')])
+EDGES_SUFFIX = ".edges.bin"
+NODES_SUFFIX = ".nodes.tsv"
+SORTED_SUFFIX = ".edges.sorted.bin"
+INDEX_SUFFIX = ".edges.sorted.idx.npz"
+INDEX_STEP = 0.05          # 索引格点间距（距离单位）
+INDEX_MAX_POINTS = 4096    # 最远距离很大时放宽间距，索引保持很小
+
+def is_edge_store(path) -> bool:
+    return str(path).endswith(EDGES_SUFFIX)
+
+def is_sorted_store(path) -> bool:
+    return str(path).endswith(SORTED_SUFFIX)
+
+def store_paths(path):
+    """
+    由任一相关路径得到 (edges_bin, nodes_tsv)：
+    X.edges.bin / X.edges.sorted.bin / X.nodes.tsv / X.txt[.gz|.zst] / X → X.edges.bin, X.nodes.tsv
+    """
+    s = strip_compression(path)
+    for suf in (SORTED_SUFFIX, INDEX_SUFFIX, EDGES_SUFFIX, NODES_SUFFIX, ".txt"):
+        if s.endswith(suf):
+            s = s[:-len(suf)]; break
+    return Path(s + EDGES_SUFFIX), Path(s + NODES_SUFFIX)
+
+class EdgeStoreWriter:
+    """
+    追加写入边记录；节点表在打开时一次写出
+    nodes: [(chrom_label, locus), ...]，下标即节点 id
+    两个文件都先写临时文件，close 时改名（边表不压缩：读取端 memmap）；abort 丢弃
+    """
+    def __init__(self, path, nodes):
+        self.edges_path, self.nodes_path = store_paths(path)
+        with open_text(self.nodes_path, 'w') as f:
+            f.write("chrom_label\tlocus\n")
+            f.write("".join(f"{c}\t{l}\n" for c, l in nodes))
+        self._fh = open_binary(self.edges_path)
+        self.count = 0
+
+    def write(self, ii, jj, dists):
+        rec = np.empty(len(ii), dtype=EDGE_DTYPE)
+        rec['u'] = ii; rec['v'] = jj; rec['d'] = dists
+        self._fh.write(rec.tobytes())
+        self.count += len(rec)
+
+    def close(self):
+        self._fh.close()
+
+    def abort(self):
+        self._fh.abort()
+
+    def __enter__(self): return self
+    def __exit__(self, et, ev, tb):
+        if et is None: self.close()
+        else: self.abort()
+
+def read_nodes(path):
+    """节点表 → [(chrom_label, locus), ...]"""
+    _, nodes_path = store_paths(path)
+    with open_text(nodes_path) as f:
+        f.readline()
+        return [tuple(line.rstrip("\n").split("\t", 1)) for line in f if line.strip()]
+
+def open_edges(path):
+    """边记录的只读 memmap（结构化：u, v, d）；空文件返回长度 0 的数组"""
+    edges_path, _ = store_paths(path)
+    size = edges_path.stat().st_size
+    if size % EDGE_DTYPE.itemsize:
+        raise ValueError(f"{edges_path} 长度 {size} 不是记录大小 {EDGE_DTYPE.itemsize} 的整数倍（文件截断？）")
+    if size == 0:
+        return np.empty(0, dtype=EDGE_DTYPE)
+    return np.memmap(edges_path, dtype=EDGE_DTYPE, mode='r')
+
+# ---------- 按距离排序的副本 + 阈值索引 ----------
+def sorted_paths(path):
+    """由任一相关路径得到 (X.edges.sorted.bin, X.edges.sorted.idx.npz)"""
+    edges_path, _ = store_paths(path)
+    s = str(edges_path)[:-len(EDGES_SUFFIX)]
+    return Path(s + SORTED_SUFFIX), Path(s + INDEX_SUFFIX)
+
+def write_sorted_store(path, step=INDEX_STEP, block=1_000_000):
+    """
+    X.edges.bin → X.edges.sorted.bin + 索引；返回 (sorted_path, index_path, 格点数)
+    排序在内存中进行（每条边约 16 字节：float64 距离 + int64 下标），记录按块写出
+    """
+    rec = open_edges(path)
+    sorted_path, index_path = sorted_paths(path)
+    order = np.argsort(rec['d'], kind='stable')          # 同距离保持原顺序
+    with open_binary(sorted_path) as f:
+        for s in range(0, len(order), block):
+            o = order[s:s + block]
+            r = rec[o]
+            out = np.empty(len(o), dtype=SORTED_DTYPE)
+            out['u'] = r['u']; out['v'] = r['v']; out['d'] = r['d']; out['pos'] = o
+            f.write(out.tobytes())
+    d = np.asarray(rec['d'][order])
+    dmax = float(d[-1]) if len(d) else 0.0
+    step = max(step, dmax / INDEX_MAX_POINTS)
+    grid = np.round(np.arange(1, int(np.ceil(dmax / step)) + 1) * step, 10)
+    rows = np.searchsorted(d, grid, side='right').astype(np.int64)
+    seq = np.column_stack([rec['u'], rec['v']]).ravel()
+    uniq, first = np.unique(seq, return_index=True)
+    with atomic_output(index_path) as tmp:
+        np.savez(tmp, thresholds=grid, rows=rows, bytes=rows * SORTED_DTYPE.itemsize,
+                 endpoint_order=uniq[np.argsort(first)].astype(np.int32), n_edges=len(rec))
+    return sorted_path, index_path, len(grid)
+
+def load_sorted_index(path):
+    _, index_path = sorted_paths(path)
+    with np.load(index_path) as z:
+        return {k: z[k] for k in z.files}
+
+def open_sorted_prefix(path, max_thr=None, index=None):
+    """
+    有序存储中 d<=max_thr 的前缀（memmap 切片，按 d 排序）；max_thr=None 时为全部
+    借助索引只在 max_thr 所在的格点区间内二分，不扫描整个距离列
+    """
+    sorted_path, _ = sorted_paths(path)
+    size = sorted_path.stat().st_size
+    if size % SORTED_DTYPE.itemsize:
+        raise ValueError(f"{sorted_path} 长度 {size} 不是记录大小 {SORTED_DTYPE.itemsize} 的整数倍（文件截断？）")
+    if size == 0:
+        return np.empty(0, dtype=SORTED_DTYPE)
+    rec = np.memmap(sorted_path, dtype=SORTED_DTYPE, mode='r')
+    if max_thr is None:
+        return rec
+    idx = index if index is not None else load_sorted_index(path)
+    grid, rows = idx['thresholds'], idx['rows']
+    k = int(np.searchsorted(grid, max_thr, side='left'))     # grid[k-1] < max_thr <= grid[k]
+    lo = int(rows[k-1]) if k > 0 else 0
+    hi = int(rows[k]) if k < len(rows) else len(rec)
+    end = lo + int(np.searchsorted(np.asarray(rec['d'][lo:hi]), max_thr, side='right'))
+    return rec[:end]
+
+# ---------- 转换 ----------
+def to_text(store_path, out_txt, block=1_000_000):
+    """二进制 → 与 Calculate_distance_whole_dual 相同列的 TSV（dist 用 repr，与文本输出字节一致）"""
+    prefix = np.array([f"{c}\t{l}" for c, l in read_nodes(store_path)], dtype=object)
+    rec = open_edges(store_path)
+    with open_text(out_txt, 'w') as fout:
+        for s in range(0, len(rec), block):
+            r = rec[s:s + block]
+            ds = np.array(list(map(repr, r['d'].tolist())), dtype=object)
+            fout.write("".join(prefix[r['u']] + "\t" + prefix[r['v']] + "\t" + ds + "\n"))
+    return len(rec)
+
+def from_text(txt_path, store_path, block=1_000_000):
+    """现有文本距离文件 → 二进制；节点 id 按首次出现顺序分配（列式读取，不逐行解析）"""
+    labels, _, u, v, d = read_distance_edges(txt_path, sep="\t")
+    nodes = [tuple(k.split("\t", 1)) for k in labels]
+    with EdgeStoreWriter(store_path, nodes) as w:
+        for s in range(0, len(u), block):
+            w.write(u[s:s + block], v[s:s + block], d[s:s + block])
+    return len(u), len(nodes)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="二进制边存储与文本互转")
+    ap.add_argument("command", choices=["to_text", "from_text", "sort"])
+    ap.add_argument("src")
+    ap.add_argument("dst", nargs='?', help="to_text / from_text 的输出路径（sort 不需要）")
+    ap.add_argument("--step", type=float, default=INDEX_STEP, help="sort：索引格点间距")
+    args = ap.parse_args()
+    if args.command != "sort" and args.dst is None:
+        ap.error(f"{args.command} 需要 dst")
+
+    if args.command == "sort":
+        if not is_edge_store(args.src):
+            print(f"[ERROR] 需要 *{EDGES_SUFFIX} 输入", file=sys.stderr); sys.exit(2)
+        sorted_path, index_path, n_grid = write_sorted_store(args.src, args.step)
+        print(f"[OK] {sorted_path.resolve()} (+ {index_path.name}, {n_grid} thresholds)")
+    elif args.command == "to_text":
+        if not is_edge_store(args.src):
+            print(f"[ERROR] 需要 *{EDGES_SUFFIX} 输入", file=sys.stderr); sys.exit(2)
+        n_edges = to_text(args.src, args.dst)
+        print(f"[OK] {n_edges} edges → {Path(args.dst).resolve()}")
+    else:
+        n_edges, n_nodes = from_text(args.src, args.dst)
+        edges_path, nodes_path = store_paths(args.dst)
+        print(f"[OK] {n_edges} edges, {n_nodes} nodes → {edges_path.resolve()}, {nodes_path.name}")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单样本内存端到端：cluster → 点对 → 多阈值组件 / metrics → 合并组件表 → LCC 趋势图
+
+每个来源的 cluster 文件只读一次；点对、组件编号与 metrics 全程是内存数组，
+不再经过 距离 TSV → 解析 → comp 文件 → 解析 → metrics 文本 → 解析 的往返。
+最终产物与分阶段流水线（distance → graph --thresholds → merge → summary，文本距离文件）逐字节一致：
+  graph_matrix_dual_<label>/whole{thr}/<base>_whole{thr}_metrics.txt（及 comp_sizes / top_components）
+  graph_matrix_dual_<label>/components/<Sample>_components.txt
+  viz_results_<suffix>_summary/lcc_trend_values.tsv 与三张 LCC 趋势图
+中间文件（距离文件、components_single/*.txt）默认照常写出，供渗流 / 空模型 / 增量等工具复用；
+--skip_intermediates 时不写。合并表的行顺序：有 Split_based_on_chr_dual_<label>/ 时沿用拆分文件（同 merge），
+否则按 cluster 文件行序
+
+用法：
+  python inmemory_pipeline_dual.py --sample_dir /data/Sample-X [--thresholds 1 1.25 ...] [--skip_intermediates]
+"""
+import os, sys, argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))     # summarize_lcc_trend_dual.py 位于工程根
+
+from bin_cache_dual import load_cluster_table
+from metrics_store_dual import resolve_db_path, upsert_metrics
+from profile_dual import StageProfile, NULL_PROFILE
+from stream_io_dual import with_compression, atomic_output, COMPRESS_CHOICES
+from Calculate_distance_whole_dual import (cKDTree, compute_all_pairs_kdtree, pair_distances, nn_rescue_pairs,
+                                           RangeSweep, block_tile, PairSink)
+from analyze_graph_parallel_dual import (ascend_to_sample_dir, preset_node_ids, sweep_edges, write_outputs,
+                                         component_rows, homolog_codes, component_tables, write_component_tables,
+                                         threshold_prefixes)
+from merge_components_dual import read_and_concat_split, component_frame, save_component_matrix
+from summarize_lcc_trend_dual import find_cluster_file, write_lcc_trend, CLUSTER_STEMS
+
+# ---------- 点对（同 Calculate_distance_whole_dual.py 全量模式） ----------
+def distance_edges(xyz, threshold, prof=NULL_PROFILE):
+    """
+    全部 d<=threshold 的点对 + 最近邻补边，顺序与距离文件逐行一致 → (ii, jj, d, n_rescue)
+    有 scipy 时走 KD-tree，否则走 NumPy 分块核（同距离阶段无 scipy 时的输出）
+    """
+    n = len(xyz)
+    if cKDTree is not None:
+        pairs, nn_idx = compute_all_pairs_kdtree(xyz, threshold, prof)
+        with prof.timer("nn_rescue"):
+            has_edge = np.zeros(n, dtype=bool)
+            has_edge[pairs[:, 0]] = True; has_edge[pairs[:, 1]] = True
+            ri, rj = nn_rescue_pairs(has_edge, nn_idx)
+        ii = np.concatenate([pairs[:, 0], ri]); jj = np.concatenate([pairs[:, 1], rj])
+        with prof.timer("pair_dist"):
+            d = pair_distances(xyz, ii, jj)
+        return ii, jj, d, len(ri)
+    sweep = RangeSweep(xyz, 0, n - 1, threshold, block_tile(), prof)
+    parts = list(sweep.blocks())
+    with prof.timer("nn_rescue"):
+        ri, rj, rd = sweep.rescue()
+    parts.append((ri, rj, rd))
+    ii, jj, d = (np.concatenate([p[k] for p in parts]) for k in range(3))
+    return ii.astype(np.int64), jj.astype(np.int64), d, len(ri)
+
+def distance_base(cluster_file, label):
+    """同 batch_pipeline_dual.distance_base：<base>.<stem>.txt → <base>"""
+    name, suf = Path(cluster_file).name, f".{CLUSTER_STEMS[label]}.txt"
+    return name[:-len(suf)] if name.endswith(suf) else name
+
+# ---------- 单个来源：distance + graph sweep + merge ----------
+def run_label(sample_dir, label, cluster_file, args, prof=NULL_PROFILE):
+    """
+    → dict：stats_by_thr（阈值 → metrics）、written（(thr, metrics 文件, comp 文件或 None, prefix, stats)）、
+            dist_out、components、bins、pairs、nn_added
+    """
+    sample_name = sample_dir.name
+    base = distance_base(cluster_file, label)
+    with prof.timer("parse"):
+        tab, cache_state = load_cluster_table(cluster_file, label)
+    if len(tab) == 0:
+        print(f"[WARN] {label}: {cluster_file} 中没有数据点，跳过", file=sys.stderr)
+        return None
+
+    with prof.timer("distance"):
+        ii, jj, d, n_rescue = distance_edges(tab.xyz, args.threshold, prof)
+    dist_out = None
+    if not args.skip_intermediates:
+        dist_dir = sample_dir / f"Whole_genome_distance_dual_{label}"
+        dist_dir.mkdir(parents=True, exist_ok=True)
+        dist_out = with_compression(dist_dir / f"{base}_distance_filtered.txt", args.compress)
+        with prof.timer("write_distance"):
+            with PairSink(dist_out, args.out_format, tab) as sink:
+                sink.write(ii, jj, d)
+
+    # 节点 id = 键在 cluster 文件中的首次出现序（重复键合并，同文本距离文件解析）
+    keys = tab.keys(":")
+    codes, uniq = pd.factorize(keys, sort=False)
+    labels = uniq.tolist()
+    index_of = {k: i for i, k in enumerate(labels)}
+    u, v = codes[ii].astype(np.int64), codes[jj].astype(np.int64)
+    del ii, jj
+    seq = np.column_stack([u, v]).ravel()
+    preset = preset_node_ids(args.node_mode, labels, index_of, seq, bins=labels)
+
+    # 合并表的行（同 merge_components_dual）与 locus 索引
+    split_dir = sample_dir / f"Split_based_on_chr_dual_{label}"
+    with prof.timer("merge"):
+        if split_dir.is_dir() and any(split_dir.glob("*.txt")):
+            orig_df = read_and_concat_split(split_dir, label)
+        else:
+            orig_df = pd.DataFrame({"homolog_like": tab.homolog, "locus": tab.locus_str})
+            orig_df["locus_id"] = orig_df["homolog_like"] + ":" + orig_df["locus"]
+        inverse, loci = pd.factorize(orig_df["locus_id"], sort=False)
+        locus_index = pd.Index(loci)
+        lab_pos = locus_index.get_indexer(pd.Index(labels))
+
+    out_root = sample_dir / f"graph_matrix_dual_{label}"
+    out_root.mkdir(parents=True, exist_ok=True)
+    prefix_of = threshold_prefixes(args.thresholds)
+    mat = np.full((len(locus_index), len(prefix_of)), -1, dtype=np.int32)
+    col_of = {thr: k for k, thr in enumerate(prefix_of)}
+    written, hc_all = [], None
+    for thr, _, nodes, comp, stats in sweep_edges(labels, u, v, d, preset, list(prefix_of), args.node_mode,
+                                                  args.backend, args.clustering, args.clustering_samples,
+                                                  args.clustering_seed, prof):
+        prefix = prefix_of[thr]
+        rows = component_rows(labels, nodes, comp)
+        with prof.timer("write"):
+            mdir, _, mf, compf = write_outputs(out_root, base, prefix, rows, stats,
+                                               comp_single=not args.skip_intermediates)
+        if args.top_k > 0:
+            with prof.timer("comp_tables"):
+                if hc_all is None:
+                    hc_all, homologs = homolog_codes(labels)
+                write_component_tables(mdir, base, prefix,
+                                       *component_tables(comp, hc_all[nodes], homologs, args.top_k))
+        with prof.timer("merge"):
+            pos = lab_pos[nodes]
+            hit = pos >= 0
+            mat[pos[hit], col_of[thr]] = comp[hit]
+        written.append((thr, mf, compf, prefix, stats))
+        print(f"Finished {label} threshold={thr} [{args.node_mode}]")
+
+    # 合并组件表：列顺序同 merge 对 {Sample}_comp_whole*.txt 的文件名排序
+    with prof.timer("merge"):
+        prefixes = list(prefix_of.values())
+        order = sorted(range(len(prefixes)), key=lambda k: f"{sample_name}_comp_{prefixes[k]}.txt")
+        cols = [f"component_{prefixes[k]}" for k in order]
+        mat = mat[:, order]
+        merged = component_frame(orig_df, cols, mat, inverse)
+        comp_dir = out_root / "components"
+        comp_dir.mkdir(parents=True, exist_ok=True)
+        comp_path = comp_dir / f"{sample_name}_components.txt"
+        with atomic_output(comp_path) as tmp:
+            merged.to_csv(tmp, sep="\t", index=False)
+        if args.compact:
+            save_component_matrix(comp_dir / f"{sample_name}_components.npz", locus_index, cols, mat)
+
+    prof.count(**{f"{label}_bins": len(tab), f"{label}_pairs": len(d) - n_rescue, f"{label}_nn_added": n_rescue,
+                  f"{label}_bin_cache": cache_state})
+    for thr, _, _, prefix, stats in written:
+        prof.append("per_threshold", {'label': label, 'threshold': thr, 'prefix': prefix,
+                                      'num_nodes': stats['num_nodes'], 'num_edges': stats['num_edges'],
+                                      'num_components': stats['num_components']})
+    return {'stats_by_thr': {thr: stats for thr, _, _, _, stats in written}, 'written': written,
+            'dist_out': dist_out, 'components': comp_path, 'bins': len(tab),
+            'pairs': len(d) - n_rescue, 'nn_added': n_rescue}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="单样本内存端到端：distance → graph（多阈值）→ merge → summary，一个进程内完成")
+    ap.add_argument("--sample_dir", default=None, help="样本目录（Sample-*）；默认由当前目录上溯")
+    ap.add_argument("--labels", default="euchr,h3k4", help="逗号分隔的来源（euchr,h3k4）；缺少 cluster 文件的来源跳过")
+    ap.add_argument("--threshold", type=float, default=5.0, help="距离阈值（同 Calculate_distance_whole_dual.py）")
+    ap.add_argument("--thresholds", nargs='+', default=["1","1.25","1.5","1.75","2","2.25","2.5","2.75","3"],
+                    help="组件 / metrics 阈值（同 cluster_and_merge_whole_dual.sh）；输出前缀 whole{thr}，thr 保持原样文本")
+    ap.add_argument("--node_mode", default="all_bins",
+                    choices=["leq_thr_endpoints","all_distance_endpoints","all_bins"])
+    ap.add_argument("--backend", default="networkx", choices=["networkx","sparse"])
+    ap.add_argument("--clustering", default="exact", choices=["exact","sampled"],
+                    help="平均聚类系数（同 analyze_graph_parallel_dual.py）")
+    ap.add_argument("--clustering_samples", type=int, default=1000, help="sampled 模式抽样节点数")
+    ap.add_argument("--clustering_seed", type=int, default=0, help="sampled 模式随机种子")
+    ap.add_argument("--top_k", type=int, default=20,
+                    help="每个阈值另写组件规模分布与前 top_k 大组件的 homolog 组成；0=不写")
+    ap.add_argument("--compact", action="store_true",
+                    help="另存紧凑列式组件文件 <Sample>_components.npz（同 merge_components_dual.py）")
+    ap.add_argument("--summary_thresholds", default="1.5,1.75,2.0,2.25,2.5",
+                    help="LCC 趋势图阈值（同 summarize_lcc_trend_dual.py --thresholds）；须包含在 --thresholds 中")
+    ap.add_argument("--out_suffix", default="ver2_dual", help="趋势图输出目录后缀（同 summarize_lcc_trend_dual.py）")
+    ap.add_argument("--color_euchr", default="#b0d9a5", help="euchr 柱状颜色")
+    ap.add_argument("--color_h3k4", default="#fdd379", help="h3k4 柱状颜色")
+    ap.add_argument("--skip_intermediates", action="store_true",
+                    help="不写中间文件：距离文件与 components_single/*.txt（最终产物不受影响）")
+    ap.add_argument("--out_format", default="text", choices=["text","binary","both"],
+                    help="中间距离文件格式（同 Calculate_distance_whole_dual.py）；组件与 metrics 总按全精度距离计算，"
+                         "与分阶段流水线读文本距离文件时一致")
+    ap.add_argument("--compress", default="none", choices=list(COMPRESS_CHOICES),
+                    help="中间距离文件的文本压缩（gz / zst）")
+    ap.add_argument("--metrics_db", default=os.environ.get('ANDIE_METRICS_DB'),
+                    help="同时写入跨样本 metrics 库（SQLite 路径，auto=样本上一级默认位置；默认取 ANDIE_METRICS_DB）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("inmemory", argv)
+
+    labels = [s.strip() for s in args.labels.split(",") if s.strip()]
+    bad = [s for s in labels if s not in CLUSTER_STEMS]
+    if bad:
+        ap.error(f"未知来源：{bad}（可选 {','.join(CLUSTER_STEMS)}）")
+    if args.clustering_samples < 1:
+        ap.error("--clustering_samples 至少为 1")
+    try:
+        threshold_prefixes(args.thresholds)
+    except ValueError as e:
+        ap.error(f"--thresholds：{e}")
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir or os.getcwd()))
+    sample_name = sample_dir.name
+
+    results, inputs = {}, {}
+    for label in labels:
+        cluster = find_cluster_file(str(sample_dir), sample_name, label)
+        inputs[label] = cluster
+        if cluster is None:
+            print(f"[WARN] {label}: 未找到 cluster 文件，跳过", file=sys.stderr)
+            continue
+        print(f"\n######## [{sample_name}] {label} ← {cluster} ########", flush=True)
+        res = run_label(sample_dir, label, cluster, args, prof)
+        if res is not None:
+            results[label] = res
+    if not results:
+        print(f"[ERROR] {sample_dir} 下没有可用的 cluster 文件", file=sys.stderr); sys.exit(2)
+
+    db_path = resolve_db_path(args.metrics_db, sample_dir)
+    if db_path:
+        with prof.timer("metrics_db"):
+            upsert_metrics(db_path, [(sample_name, label, prefix, stats, str(mf.resolve()))
+                                     for label, res in results.items() for _, mf, _, prefix, stats in res['written']])
+
+    # LCC 趋势（同 summarize_lcc_trend_dual.py 单样本模式，比例直接取自内存中的 metrics）
+    thrs = [t.strip() for t in args.summary_thresholds.split(",") if t.strip()]
+    ratios = {"euchr": [], "h3k4": []}
+    for t in thrs:
+        for label in ratios:
+            s = results.get(label, {}).get('stats_by_thr', {}).get(float(t))
+            ok = s is not None and s['num_nodes'] and s['num_nodes'] > 0
+            ratios[label].append(s['largest_cc_size'] / s['num_nodes'] if ok else None)
+    with prof.timer("summary"):
+        out_group, out_eu, out_h3, csv_path = write_lcc_trend(str(sample_dir), args.out_suffix, thrs, ratios,
+                                                              args.color_euchr, args.color_h3k4)
+    prof.count(node_mode=args.node_mode, backend=args.backend, threshold=args.threshold,
+               skip_intermediates=args.skip_intermediates)
+    prof_path = prof.write(sample_dir / f"{sample_name}_inmemory_dual")
+
+    # -------- REPORT：输出存储结构 --------
+    print("\n=== inmemory_pipeline_dual REPORT ===")
+    print(f"Sample name  : {sample_name}")
+    print(f"Sample dir   : {sample_dir}")
+    print(f"Thresholds   : distance ≤ {args.threshold:g} | graph {' '.join(args.thresholds)} | node mode {args.node_mode}")
+    for label in labels:
+        res = results.get(label)
+        if res is None:
+            print(f"  {label:<10} : 跳过（cluster 文件：{inputs[label] or '未找到'}）")
+            continue
+        print(f"  {label:<10} : {res['bins']} bins | {res['pairs']} pairs + {res['nn_added']} NN | "
+              f"{len(res['written'])} thresholds")
+        print(f"    cluster    -> {Path(inputs[label]).resolve()}")
+        print(f"    distance   -> {Path(res['dist_out']).resolve() if res['dist_out'] else '未写出（--skip_intermediates）'}")
+        print(f"    metrics    -> {res['written'][0][1].parent.parent.resolve()}/whole{{thr}}/")
+        print(f"    components -> {res['components'].resolve()}")
+    print(f"Summary      :")
+    print(f"  grouped    -> {out_group}")
+    print(f"  euchr only -> {out_eu}")
+    print(f"  h3k4  only -> {out_h3}")
+    print(f"  values.tsv -> {csv_path}")
+    if db_path:
+        print(f"Metrics DB   : {db_path.resolve()} (+{sum(len(r['written']) for r in results.values())} rows)")
+    if prof_path:
+        print(f"Profile      : {prof_path.resolve()}")
+    print("=====================================\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os, glob, sys, re
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from bin_cache_dual import load_cluster_table
+from profile_dual import StageProfile
+from stream_io_dual import atomic_output
+
 def ascend_to_sample_dir(start: Path) -> Path:
     p = start.resolve()
     if p.is_file(): p = p.parent
@@ -17,43 +22,69 @@ def read_and_concat_split(label_dir: Path, label: str) -> pd.DataFrame:
     读取 Split_based_on_chr_dual_{label}/*.txt 并拼接成一个 DataFrame
     - euchr: 需要列 homolog, locus
     - h3k4 : 需要列 chrom, allele, locus  -> 制作 homolog_like = f"{chrom}({allele})"
+    解析走共享列式读取（C 分词、分块，带持久缓存）；格式按各文件表头判定
     """
     files = sorted(label_dir.glob("*.txt"))
     if not files:
         raise FileNotFoundError(f"未发现拆分文件：{label_dir}")
     dfs = []
     for fp in files:
-        with open(fp, 'r', encoding='utf-8') as f:
-            first = f.readline().strip()
-        header = first.split()
-        fdf = pd.read_csv(fp, sep=r"\s+", engine="python")
-        if header and header[0].lower() == "homolog":    # euchr
-            need = {"homolog","locus"}
-            if not need.issubset(fdf.columns):
-                raise ValueError(f"{fp} 缺少列 {need}")
-            fdf["_homolog_like"] = fdf["homolog"].astype(str)
-            fdf["_locus"] = fdf["locus"].astype(str)
-        else:                                            # h3k4
-            need = {"chrom","allele","locus"}
-            if not need.issubset(fdf.columns):
-                raise ValueError(f"{fp} 缺少列 {need}")
-            fdf["_homolog_like"] = fdf["chrom"].astype(str) + "(" + fdf["allele"].astype(str) + ")"
-            fdf["_locus"] = fdf["locus"].astype(str)
-        dfs.append(fdf[["_homolog_like","_locus"]])
+        tab, _ = load_cluster_table(fp, require_xyz=False)
+        dfs.append(pd.DataFrame({"homolog_like": tab.homolog, "locus": tab.locus_str}))
     merged = pd.concat(dfs, ignore_index=True)
-    merged.rename(columns={"_homolog_like":"homolog_like","_locus":"locus"}, inplace=True)
     merged["locus_id"] = merged["homolog_like"] + ":" + merged["locus"]
     return merged
 
-if __name__ == "__main__":
+def fill_component_matrix(comp_files, locus_index):
+    """
+    一次遍历全部 *_comp_whole*.txt，填入预分配的 int32 矩阵（行 = locus_index，列 = 阈值文件顺序）
+    未出现在某组件文件中的 locus 记为 -1；返回 (列名列表, 矩阵)
+    """
+    mat = np.full((len(locus_index), len(comp_files)), -1, dtype=np.int32)
+    cols = []
+    for k, comp_file in enumerate(comp_files):
+        df = pd.read_csv(comp_file, sep=r"\s+", engine="c", dtype={"locus_id": str})
+        if "locus_id" not in df.columns or df.shape[1] != 2:
+            raise ValueError(f"{comp_file} 应为两列：locus_id 与 component_wholeX")
+        col = df.columns[1] if df.columns[0] == "locus_id" else df.columns[0]
+        pos = locus_index.get_indexer(df["locus_id"])
+        hit = pos >= 0
+        mat[pos[hit], k] = df[col].to_numpy()[hit]
+        cols.append(col)
+    return cols, mat
+
+def component_frame(orig_df, cols, mat, inverse):
+    """原始 bins + 各阈值列；有缺失的列与 left merge 一致（float + NaN），否则为整数"""
+    data = {}
+    for k, col in enumerate(cols):
+        v = mat[inverse, k]
+        data[col] = np.where(v < 0, np.nan, v) if (v < 0).any() else v.astype(np.int64)
+    return pd.concat([orig_df, pd.DataFrame(data, index=orig_df.index)], axis=1)
+
+def save_component_matrix(path, locus_index, cols, mat):
+    """紧凑列式文件（.npz，未压缩）：locus_id（唯一、按首次出现）、columns、int32 matrix（-1=缺失）"""
+    with atomic_output(path) as tmp:
+        np.savez(tmp, locus_id=np.asarray(locus_index, dtype=str), columns=np.asarray(cols, dtype=str), matrix=mat)
+
+def load_component_matrix(path):
+    """→ (locus_id ndarray, columns list, int32 matrix)"""
+    with np.load(path) as z:
+        return z["locus_id"], z["columns"].tolist(), z["matrix"]
+
+def main(argv=None):
     import argparse
     ap = argparse.ArgumentParser(description="合并多阈值组件（dual来源）")
     ap.add_argument("--source_label", required=True, choices=["euchr","h3k4"])
-    args = ap.parse_args()
+    ap.add_argument("--sample_dir", default=None,
+                    help="样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）")
+    ap.add_argument("--compact", action="store_true",
+                    help="另存紧凑列式文件 <Sample>_components.npz（locus 索引 + int32 组件矩阵）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("merge_components", argv)
 
     script_dir = Path(__file__).resolve().parent
-    project_dir = script_dir.parent
-    sample_dir = ascend_to_sample_dir(script_dir)
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
+    project_dir = sample_dir if args.sample_dir else script_dir.parent
     base_name = sample_dir.name
 
     # 输入/输出目录（按来源分开）
@@ -63,7 +94,8 @@ if __name__ == "__main__":
     out_dir.mkdir(parents=True, exist_ok=True)
 
     # 1) 原始 bins（由多个拆分文件拼接）
-    orig_df = read_and_concat_split(split_dir, args.source_label)
+    with prof.timer("parse_split"):
+        orig_df = read_and_concat_split(split_dir, args.source_label)
 
     # 2) 组件文件（多个阈值）
     pattern = str(comp_single_dir / f"{base_name}_comp_whole*.txt")
@@ -71,17 +103,24 @@ if __name__ == "__main__":
     if not comp_files:
         raise FileNotFoundError(f"在 {comp_single_dir} 下未找到 {pattern} 匹配文件")
 
-    merged = orig_df.copy()
-    for comp_file in comp_files:
-        df = pd.read_csv(comp_file, sep=r"\s+", engine="python")
-        if "locus_id" not in df.columns or df.shape[1] != 2:
-            raise ValueError(f"{comp_file} 应为两列：locus_id 与 component_wholeX")
-        merged = merged.merge(df, on="locus_id", how="left")
+    # 3) locus 索引只建一次，全部阈值列一次填入预分配矩阵（不再逐阈值 merge 复制整表）
+    with prof.timer("fill_matrix"):
+        inverse, uniq = pd.factorize(orig_df["locus_id"], sort=False)
+        locus_index = pd.Index(uniq)
+        cols, mat = fill_component_matrix(comp_files, locus_index)
+        merged = component_frame(orig_df, cols, mat, inverse)
 
     out_path = out_dir / f"{base_name}_components.txt"
     # 输出列顺序：homolog_like, locus, locus_id, component_whole*
     # （可按需调整；保留 homolog_like 便于核查）
-    merged.to_csv(out_path, sep="\t", index=False)
+    npz_path = out_dir / f"{base_name}_components.npz"
+    with prof.timer("write"):
+        with atomic_output(out_path) as tmp:
+            merged.to_csv(tmp, sep="\t", index=False)
+        if args.compact:
+            save_component_matrix(npz_path, locus_index, cols, mat)
+    prof.count(loci=len(locus_index), columns=len(cols), rows=len(merged), compact=args.compact)
+    prof_path = prof.write(out_path)
 
     # REPORT
     print("\n=== merge_components_dual REPORT ===")
@@ -91,7 +130,14 @@ if __name__ == "__main__":
     print(f"Comp single in : {comp_single_dir.resolve()}")
     print(f"Output dir     : {out_dir.resolve()}")
     print(f"Output file    : {out_path.resolve()}")
+    print(f"Loci x columns : {len(locus_index)} x {len(cols)}")
+    if args.compact:
+        print(f"Compact matrix : {npz_path.resolve()}")
+    if prof_path:
+        print(f"Profile        : {prof_path.resolve()}")
     print("====================================\n")
 
     print(f"✅ 合并完成 → {out_path}")
 
+if __name__ == "__main__":
+    main()
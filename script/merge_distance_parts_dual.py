@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并 --range 分块输出 → 单一规范 _distance_filtered.txt
+
+分块各自只看到部分数据，补的“最近邻”边可能重复或并非全局最近；直接 cat 与
+单进程 KD-tree 结果不一致。本脚本：
+  1) 分块读取 partial 文件（共享列式读取），只取 dist<=thr 的边，编码为 int64 键 (i*n+j, i<j)；
+     按 --chunk_edges 分批排序去重后落盘（外排序），内存与总边数无关
+  2) 多路归并各批次，按 (i,j) 顺序写出，距离按坐标重算（与 KD-tree 模式逐字节一致）
+  3) 对全局无边的 bin，用全体 bin 重新查询真正的全局最近邻，补边规则同 KD-tree 模式
+"""
+import sys, argparse, glob, shutil, tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from Calculate_distance_whole_dual import (
+    ascend_to_sample_dir, cKDTree,
+    pair_distances, nn_rescue_pairs, PairSink,
+)
+from edge_store_dual import store_paths, write_sorted_store
+from columnar_io_dual import iter_distance_chunks
+from bin_cache_dual import load_cluster_table
+from profile_dual import StageProfile
+
+# ---------- 分块读取 → 排序批次 ----------
+def bin_lookup(keys):
+    """键（chrom<TAB>locus）→ bin 下标的向量化查找；重复 bin 以第一次出现为准，未知键为 -1"""
+    first = ~pd.Index(keys).duplicated()
+    index, pos = pd.Index(keys[first]), np.flatnonzero(first)
+    def lookup(q):
+        k = index.get_indexer(q)
+        return np.where(k >= 0, pos[k], -1)
+    return lookup
+
+def spill_sorted_runs(part_files, lookup, n, thr, tmp_dir, chunk_edges):
+    """
+    分块解析 partial 文件，dist<=thr 的边写成有序去重的 .npy 批次
+    lookup: bin_lookup 返回的键 → bin 下标函数
+    返回 (runs, has_edge, n_lines, n_unknown)
+    """
+    runs, buf, buffered = [], [], 0
+    has_edge = np.zeros(n, dtype=bool)
+    n_lines = n_unknown = 0
+
+    def flush():
+        if not buf: return
+        keys = np.unique(np.concatenate(buf))
+        fp = Path(tmp_dir) / f"run{len(runs):05d}.npy"
+        np.save(fp, keys)
+        runs.append(fp)
+        buf.clear()
+
+    for fp in part_files:
+        for c1, l1, c2, l2, d in iter_distance_chunks(fp, chunksize=chunk_edges):
+            n_lines += len(d)
+            keep = d <= thr                  # 分块补的最近邻边（>thr）：丢弃，统一重算
+            i = lookup(c1[keep] + "\t" + l1[keep])
+            j = lookup(c2[keep] + "\t" + l2[keep])
+            ok = (i >= 0) & (j >= 0) & (i != j)
+            n_unknown += int((~ok).sum())
+            i, j = np.minimum(i[ok], j[ok]).astype(np.int64), np.maximum(i[ok], j[ok]).astype(np.int64)
+            has_edge[i] = True; has_edge[j] = True
+            buf.append(i * n + j); buffered += len(i)
+            if buffered >= chunk_edges:
+                flush(); buffered = 0
+    flush()
+    return runs, has_edge, n_lines, n_unknown
+
+# ---------- 多路归并 ----------
+def merge_sorted_runs(runs, block):
+    """
+    对若干有序 int64 批次做分块多路归并，逐块产出全局有序且去重的键
+    每轮取各批次当前块末尾的最小值为界，界内元素全部出队，保证相等键落在同一块
+    block 为每个批次的读入块长：一轮最多暂存 block × len(runs) 个键
+    """
+    arrs = [np.load(fp, mmap_mode='r') for fp in runs]
+    pos = [0] * len(arrs)
+    last = None
+    while True:
+        live = [k for k, a in enumerate(arrs) if pos[k] < len(a)]
+        if not live: break
+        bound = min(arrs[k][min(pos[k] + block, len(arrs[k])) - 1] for k in live)
+        parts = []
+        for k in live:
+            a = arrs[k]
+            end = pos[k] + int(np.searchsorted(a[pos[k]:pos[k] + block], bound, side='right'))
+            parts.append(np.asarray(a[pos[k]:end]))
+            pos[k] = end
+        keys = np.unique(np.concatenate(parts))
+        if last is not None and len(keys) and keys[0] == last:
+            keys = keys[1:]
+        if len(keys):
+            last = keys[-1]
+            yield keys
+
+# ---------- 全局最近邻 ----------
+def global_nn(xyz, query_idx):
+    """query_idx 中每个 bin 在全体 bin 中的最近邻（排除自身）；n==1 时返回 n"""
+    n = len(xyz)
+    if not len(query_idx) or n < 2:
+        return np.full(len(query_idx), n, dtype=np.intp)
+    if cKDTree:
+        _, idxs = cKDTree(xyz).query(xyz[query_idx], k=2)
+        return idxs[:, 1]
+    nb = np.empty(len(query_idx), dtype=np.intp)
+    for k, i in enumerate(query_idx):
+        d = xyz - xyz[i]
+        d2 = d[:, 0]*d[:, 0] + d[:, 1]*d[:, 1] + d[:, 2]*d[:, 2]
+        d2[i] = np.inf
+        nb[k] = int(np.argmin(d2))
+    return nb
+
+# ---------- 主流程 ----------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Merge --range partial distance outputs (dual formats)")
+    ap.add_argument("input_file", help="对应的 *.euchromatin_cluster.txt 或 *.h3k4me3_cluster.txt")
+    ap.add_argument("output_file", help="合并后的 *_distance_filtered.txt")
+    ap.add_argument("parts", nargs='+', help="partial 文件（可用 glob，如 'partial_X/X_dist_part*.txt'）")
+    ap.add_argument("--source_label", type=str, default=None, choices=["euchr","h3k4"],
+                    help="euchr/h3k4；若不传则自动判定")
+    ap.add_argument("--threshold", type=float, default=5.0,
+                    help="与分块计算一致的距离阈值（默认5.0）")
+    ap.add_argument("--chunk_edges", type=int, default=5_000_000,
+                    help="每批内存中暂存的边数上限（默认5e6，约40MB键）；归并时按批次数均分，"
+                         "各批次读入块长 = chunk_edges / 批次数，总暂存量仍不超过该值")
+    ap.add_argument("--out_format", default="text", choices=["text","binary","both"],
+                    help="同 Calculate_distance_whole_dual.py --out_format")
+    ap.add_argument("--sorted_index", action="store_true",
+                    help="同 Calculate_distance_whole_dual.py --sorted_index（需 --out_format binary/both）")
+    ap.add_argument("--sample_dir", default=None,
+                    help="样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("merge_distance_parts", argv)
+
+    script_dir = Path(__file__).resolve().parent
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
+    sample_name = sample_dir.name
+
+    if args.sorted_index and args.out_format == "text":
+        print("[ERROR] --sorted_index 需要 --out_format binary/both", file=sys.stderr); sys.exit(2)
+
+    part_files = []
+    for pat in args.parts:
+        hits = sorted(glob.glob(pat))
+        part_files.extend(hits if hits else [pat])
+    missing = [f for f in part_files if not Path(f).is_file()]
+    if missing:
+        print(f"[ERROR] partial 文件不存在：{missing[:5]}", file=sys.stderr); sys.exit(2)
+
+    with prof.timer("parse"):
+        tab, cache_state = load_cluster_table(args.input_file, args.source_label)
+    fmt, locus_idx = tab.fmt, tab.locus_idx
+    n = len(tab)
+    if n == 0:
+        print(f"[Info] No data points in {args.input_file}")
+        sys.exit(0)
+    lookup = bin_lookup(tab.keys("\t"))
+    xyz = tab.xyz
+
+    out_path = Path(args.output_file)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".merge_parts_", dir=out_path.parent)
+    pairs_written = added_nn = 0
+    try:
+        with prof.timer("spill_runs"):
+            runs, has_edge, n_lines, n_unknown = spill_sorted_runs(
+                part_files, lookup, n, args.threshold, tmp_dir, args.chunk_edges)
+        with PairSink(out_path, args.out_format, tab) as sink:
+            with prof.timer("merge_write"):
+                for keys in merge_sorted_runs(runs, max(1, args.chunk_edges // max(len(runs), 1))):
+                    ii, jj = keys // n, keys % n
+                    sink.write(ii, jj, pair_distances(xyz, ii, jj))
+                    pairs_written += len(keys)
+            with prof.timer("nn_rescue"):
+                nn_idx = np.full(n, n, dtype=np.intp)
+                iso = np.flatnonzero(~has_edge)
+                nn_idx[iso] = global_nn(xyz, iso)
+                ri, rj = nn_rescue_pairs(has_edge, nn_idx)
+            with prof.timer("write"):
+                sink.write(ri, rj, pair_distances(xyz, ri, rj))
+            pairs_written += len(ri); added_nn += len(ri)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    sorted_out = None
+    if args.sorted_index:
+        with prof.timer("sort_index"):
+            sorted_out = write_sorted_store(out_path)
+
+    prof.count(bins=n, part_files=len(part_files), part_lines=n_lines, sorted_runs=len(runs),
+               unknown_endpoints=n_unknown, pairs=pairs_written - added_nn, nn_added=added_nn,
+               threshold=args.threshold, bin_cache=cache_state)
+    prof_path = prof.write(out_path)
+
+    # -------- REPORT --------
+    print("\n=== merge_distance_parts_dual REPORT ===")
+    print(f"Sample name : {sample_name}")
+    print(f"Input file  : {Path(args.input_file).resolve()}")
+    print(f"Format      : {fmt} (locus_col={locus_idx})")
+    print(f"Bin cache   : {cache_state}")
+    print(f"Threshold   : {args.threshold}")
+    print(f"Parts       : {len(part_files)} files | {n_lines} lines | {len(runs)} sorted runs")
+    if n_unknown:
+        print(f"[WARN] {n_unknown} 行端点不在 cluster 文件中，已跳过", file=sys.stderr)
+    print(f"Bins        : {n}")
+    if args.out_format in ("text","both"):
+        print(f"Output file : {out_path.resolve()}")
+    if args.out_format in ("binary","both"):
+        print(f"Edge store  : {store_paths(out_path)[0].resolve()}")
+    if sorted_out:
+        print(f"Sorted store: {sorted_out[0].resolve()} (+ {sorted_out[1].name}, {sorted_out[2]} thresholds)")
+    print(f"Pairs<=thr  : {pairs_written}  | Added NN: {added_nn}")
+    if prof_path:
+        print(f"Profile     : {prof_path.resolve()}")
+    print("========================================\n")
+
+if __name__ == "__main__":
+    main()
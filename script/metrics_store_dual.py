@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨样本 metrics 库（SQLite，每个工程一个文件）
+
+表 graph_metrics：每个 (sample, label, threshold) 一行，主键即此三元组，按 (label, threshold) 另建索引
+  常用指标为独立列（num_nodes, largest_cc_size, ...），其余键（如 avg_clustering_ci95_*）存入 extra（JSON）
+默认位置：Sample-* 目录的上一级 / andie_metrics_dual.sqlite（同一工程的全部样本共用）
+写入：analyze_graph_parallel_dual.py --metrics_db（或环境变量 ANDIE_METRICS_DB）；已有结果用 ingest 回填
+并发：WAL + busy timeout，进程池 / 多个作业同时写入时排队而不报错
+
+命令行：
+  python metrics_store_dual.py ingest '/data/cohort/Sample-*' [--db PATH]   # 扫描已有 *_metrics.txt 回填
+  python metrics_store_dual.py show [--db PATH] [--label euchr]
+"""
+import sys, json, time, glob, argparse, sqlite3
+from pathlib import Path
+import pandas as pd
+
+from stream_io_dual import open_text
+
+DEFAULT_DB_NAME = "andie_metrics_dual.sqlite"
+BUSY_TIMEOUT_S = 120
+COLUMNS = {  # 独立列及其类型；其余 metrics 键进 extra
+    'node_mode': str, 'num_nodes': int, 'num_edges': int, 'num_components': int,
+    'largest_cc_size': int, 'avg_clustering': float, 'avg_clustering_method': str, 'density': float,
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS graph_metrics (
+    sample          TEXT NOT NULL,
+    label           TEXT NOT NULL,
+    threshold       REAL NOT NULL,
+    prefix          TEXT,
+    node_mode       TEXT,
+    num_nodes       INTEGER,
+    num_edges       INTEGER,
+    num_components  INTEGER,
+    largest_cc_size INTEGER,
+    avg_clustering  REAL,
+    avg_clustering_method TEXT,
+    density         REAL,
+    extra           TEXT,
+    source          TEXT,
+    updated         REAL,
+    PRIMARY KEY (sample, label, threshold)
+);
+CREATE INDEX IF NOT EXISTS idx_graph_metrics_label_thr ON graph_metrics (label, threshold);
+"""
+
+def default_db_path(sample_dir) -> Path:
+    return Path(sample_dir).resolve().parent / DEFAULT_DB_NAME
+
+def resolve_db_path(db, sample_dir=None):
+    """'auto' → 工程默认位置（无样本目录时为当前目录）；其他值原样返回；None 保持 None"""
+    if db is None or db == "":
+        return None
+    if db == "auto":
+        return default_db_path(sample_dir) if sample_dir else Path.cwd() / DEFAULT_DB_NAME
+    return Path(db)
+
+def connect(db_path):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT_S)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(SCHEMA)
+    return con
+
+def _row(sample, label, prefix, stats, source):
+    extra = {k: v for k, v in stats.items() if k not in COLUMNS and k != 'threshold'}
+    cols = {k: (None if stats.get(k) is None else typ(stats[k])) for k, typ in COLUMNS.items()}
+    return (sample, label, float(stats['threshold']), prefix, *cols.values(),
+            json.dumps(extra, default=str) if extra else None, source, time.time())
+
+def upsert_metrics(db_path, records):
+    """records: 可迭代 (sample, label, prefix, stats_dict, source)；单个事务写入，已存在的行被覆盖"""
+    rows = [_row(*r) for r in records]
+    if not rows:
+        return 0
+    ph = ",".join("?" * len(rows[0]))
+    con = connect(db_path)
+    try:
+        with con:
+            con.executemany(f"INSERT OR REPLACE INTO graph_metrics (sample, label, threshold, prefix, "
+                            f"{', '.join(COLUMNS)}, extra, source, updated) VALUES ({ph})", rows)
+    finally:
+        con.close()
+    return len(rows)
+
+def query_metrics(db_path, samples=None, labels=None, thresholds=None):
+    """一次查询 → DataFrame（按 sample, label, threshold 排序）；过滤条件为 None 时不限"""
+    where, params = [], []
+    for col, vals in (("sample", samples), ("label", labels), ("threshold", thresholds)):
+        if vals is not None:
+            vals = [float(v) for v in vals] if col == "threshold" else list(vals)
+            where.append(f"{col} IN ({','.join('?' * len(vals))})"); params += vals
+    sql = "SELECT * FROM graph_metrics" + (f" WHERE {' AND '.join(where)}" if where else "") \
+          + " ORDER BY sample, label, threshold"
+    con = connect(db_path)
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+# ---------- 回填：扫描已有 metrics 文本 ----------
+def parse_metrics_file(path):
+    """两列 key\\tvalue → dict；数值尽量转成 int/float"""
+    out = {}
+    with open_text(path, errors='ignore') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2 or parts[0].startswith("#"): continue
+            k, v = parts[0], parts[1]
+            for typ in (int, float):
+                try:
+                    v = typ(v); break
+                except ValueError:
+                    pass
+            out[k] = v
+    return out
+
+def scan_sample(sample_dir):
+    """Sample-*/graph_matrix_dual_{label}/whole*/*_metrics.txt → records（供 upsert_metrics）"""
+    s = Path(sample_dir)
+    for mf in sorted(s.glob("graph_matrix_dual_*/whole*/*_metrics.txt")):
+        label = mf.parent.parent.name[len("graph_matrix_dual_"):]
+        stats = parse_metrics_file(mf)
+        if 'threshold' not in stats:
+            print(f"[WARN] 缺少 threshold：{mf}", file=sys.stderr); continue
+        yield s.name, label, mf.parent.name, stats, str(mf.resolve())
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="跨样本 metrics 库（SQLite）")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ingest", help="扫描 Sample-* 下已有 metrics 文本写入库")
+    p.add_argument("samples", nargs='+', help="Sample-* 目录或 glob")
+    p.add_argument("--db", default=None, help=f"库路径（默认样本上一级 {DEFAULT_DB_NAME}）")
+    p = sub.add_parser("show", help="打印库中记录")
+    p.add_argument("--db", default="auto")
+    p.add_argument("--label", default=None, choices=["euchr","h3k4"])
+    args = ap.parse_args(argv)
+
+    if args.command == "ingest":
+        dirs = [Path(d) for pat in args.samples for d in (sorted(glob.glob(pat)) or [pat])
+                if Path(d).is_dir() and Path(d).name.startswith("Sample-")]
+        if not dirs:
+            print("[ERROR] 未找到任何 Sample-* 目录", file=sys.stderr); sys.exit(2)
+        db = Path(args.db) if args.db else default_db_path(dirs[0])
+        n = upsert_metrics(db, (r for d in dirs for r in scan_sample(d)))
+        print(f"[OK] {n} metrics rows from {len(dirs)} samples → {db.resolve()}")
+    else:
+        db = resolve_db_path(args.db)
+        df = query_metrics(db, labels=[args.label] if args.label else None)
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(df.drop(columns=["extra", "source", "updated"]).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+空模型：随机化坐标后重算距离与连通性，检验观测 LCC 占比是否偏离随机
+
+每个来源（euchr / h3k4）生成 --replicates 组随机坐标，每组完全在内存中计算：
+  KD-tree 点对（≤ 最大阈值，只枚举一次）→ 按距离排序 → 逐阈值取前缀做 csgraph 连通分量 → LCC 占比
+观测值用同一内核在原坐标上计算（节点语义同 analyze_graph_parallel_dual.py --node_mode；
+all_bins / all_distance_endpoints 下与 lcc_trend_values.tsv 的占比一致），观测与空分布可直接比较。
+
+随机化（--model）：
+  jitter          每个坐标加各向同性高斯噪声（标准差 --jitter_sigma）
+  homolog_rotate  每条 homolog 绕自身质心做随机刚体旋转：链内距离不变，homolog 之间的相对取向被打乱
+  uniform_box     全部 bin 在原坐标包围盒内均匀重采样
+（同一 homolog 内直接置换坐标不改变点集，几何图与 LCC 完全不变，因此不提供）
+
+输出目录 <Sample>/null_model_dual/：
+  {Sample}_null_{model}_replicates.tsv  label, replicate, threshold, num_nodes, largest_cc_size, ratio
+  {Sample}_null_{model}_summary.tsv     label, threshold, observed, null_mean, null_sd, z,
+                                        p_greater, p_less, p_two_sided, n_replicates
+经验 p 值：p_greater = (1+#{null ≥ obs})/(1+R)，p_less 同理，双侧 = min(1, 2×较小者)；z = (obs-mean)/sd（sd=0 为 NaN）
+
+并行：各来源的坐标 / homolog 编码 / 节点编号放入一块共享内存（multiprocessing.shared_memory），
+进程池 worker 启动时以只读视图挂载，任务只传 (来源, 重复号)；每组随机数种子为 (--seed, 来源, 重复号)，
+结果与 --workers 无关。
+"""
+import os, sys, argparse
+from pathlib import Path
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from Calculate_distance_whole_dual import ascend_to_sample_dir, cKDTree, pair_distances, NN_RTOL
+from Calculate_cross_distance_dual import locate_cluster
+from bin_cache_dual import load_cluster_table
+from profile_dual import StageProfile
+from stream_io_dual import atomic_output
+
+try:
+    from scipy import sparse
+    from scipy.sparse import csgraph
+    from scipy.spatial.transform import Rotation
+except Exception:
+    sparse = csgraph = Rotation = None
+
+MODELS = ("jitter", "homolog_rotate", "uniform_box")
+LABELS = ("euchr", "h3k4")
+OUT_DIRNAME = "null_model_dual"
+
+# ---------- 单组坐标 → 逐阈值 LCC ----------
+def lcc_by_threshold(xyz, node_of, n_nodes, thresholds, node_mode):
+    """
+    → (num_nodes, largest_cc_size)，均为与 thresholds 等长的 int64 数组
+    - node_of: 每个 bin 的节点编号（同 homolog:locus 的行合并为一个节点，同文件流程）
+    - 点对按 sqrt 度量距离 ≤ thr 取舍（同 analyze_graph 读距离文件时的过滤），KD-tree 半径略放宽后再精确截断
+    - leq_thr_endpoints：节点 = 当前前缀边的端点；其他模式：全部节点
+    """
+    thr = np.asarray(thresholds, dtype=float)
+    pairs = cKDTree(xyz).query_pairs(r=float(thr.max()) * (1 + NN_RTOL), output_type='ndarray')
+    d = pair_distances(xyz, pairs[:, 0], pairs[:, 1])
+    order = np.argsort(d, kind='stable')
+    ii, jj, d = node_of[pairs[order, 0]], node_of[pairs[order, 1]], d[order]
+    ends = np.searchsorted(d, thr, side='right')
+    num_nodes = np.empty(len(thr), dtype=np.int64)
+    lcc = np.empty(len(thr), dtype=np.int64)
+    for k, e in enumerate(ends.tolist()):
+        g = sparse.coo_matrix((np.ones(e, dtype=np.int8), (ii[:e], jj[:e])), shape=(n_nodes, n_nodes))
+        _, comp = csgraph.connected_components(g, directed=False)
+        if node_mode == "leq_thr_endpoints":
+            comp = comp[np.unique(np.concatenate([ii[:e], jj[:e]]))]
+        num_nodes[k] = len(comp)
+        lcc[k] = np.bincount(comp).max() if len(comp) else 0
+    return num_nodes, lcc
+
+# ---------- 随机化 ----------
+def randomize(xyz, codes, model, rng, sigma=1.0):
+    """按 model 产生一组随机坐标（新数组，不改动 xyz）"""
+    if model == "jitter":
+        return xyz + rng.normal(scale=sigma, size=xyz.shape)
+    if model == "uniform_box":
+        return rng.uniform(xyz.min(axis=0), xyz.max(axis=0), size=xyz.shape)
+    if model == "homolog_rotate":
+        n_groups = int(codes.max()) + 1
+        cnt = np.bincount(codes, minlength=n_groups).astype(float)[:, None]
+        cent = np.column_stack([np.bincount(codes, weights=xyz[:, k], minlength=n_groups) for k in range(3)])
+        cent /= np.maximum(cnt, 1.0)
+        rot = Rotation.random(n_groups, random_state=rng).as_matrix()
+        c = cent[codes]
+        return np.einsum('nij,nj->ni', rot[codes], xyz - c) + c
+    raise ValueError(f"未知 --model: {model}")
+
+# ---------- 共享内存中的只读输入 ----------
+def share_arrays(arrays):
+    """{名称: ndarray} → (SharedMemory, spec)；spec 为 [(名称, dtype, shape, 偏移)]，worker 据此挂载视图"""
+    spec, off = [], 0
+    for k, a in arrays.items():
+        off = (off + 63) // 64 * 64
+        spec.append((k, a.dtype.str, a.shape, off)); off += a.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(off, 1))
+    for (k, dt, shape, o), a in zip(spec, arrays.values()):
+        np.ndarray(shape, dt, buffer=shm.buf, offset=o)[...] = a
+    return shm, spec
+
+_SHARED = {}
+
+def attach_shared(shm_name, spec, cfg):
+    """进程池 initializer：挂载共享内存（只读视图）；unlink 只由创建方（主进程）负责"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _SHARED.clear()
+    _SHARED['shm'], _SHARED['cfg'] = shm, cfg
+    for k, dt, shape, o in spec:
+        a = np.ndarray(shape, dt, buffer=shm.buf, offset=o)
+        a.flags.writeable = False
+        _SHARED[k] = a
+
+def run_replicate(task):
+    """(来源序号, 重复号) → (来源序号, 重复号, num_nodes, lcc)；只读共享数组，种子与进程无关"""
+    li, r = task
+    cfg = _SHARED['cfg']
+    lab = cfg['labels'][li]
+    rng = np.random.default_rng([cfg['seed'], li, r])
+    xyz = randomize(_SHARED[f"{lab}.xyz"], _SHARED[f"{lab}.codes"], cfg['model'], rng, cfg['sigma'])
+    n, l = lcc_by_threshold(xyz, _SHARED[f"{lab}.node_of"], cfg['n_nodes'][lab], cfg['thresholds'], cfg['node_mode'])
+    return li, r, n, l
+
+def run_replicates(arrays, cfg, replicates, workers):
+    """全部 (来源, 重复号) 任务 → {来源: (R,T) num_nodes, (R,T) lcc}；workers=1 时在本进程内执行"""
+    tasks = [(li, r) for li in range(len(cfg['labels'])) for r in range(replicates)]
+    out = {lab: (np.zeros((replicates, len(cfg['thresholds'])), dtype=np.int64),
+                 np.zeros((replicates, len(cfg['thresholds'])), dtype=np.int64)) for lab in cfg['labels']}
+    if workers <= 1:
+        _SHARED.clear(); _SHARED.update(arrays, cfg=cfg)
+        try:
+            for li, r, n, l in map(run_replicate, tasks):
+                out[cfg['labels'][li]][0][r], out[cfg['labels'][li]][1][r] = n, l
+        finally:
+            _SHARED.clear()
+        return out
+    shm, spec = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_shared, initargs=(shm.name, spec, cfg)) as pool:
+            for li, r, n, l in pool.map(run_replicate, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+                out[cfg['labels'][li]][0][r], out[cfg['labels'][li]][1][r] = n, l
+    finally:
+        shm.close(); shm.unlink()
+    return out
+
+# ---------- 统计 ----------
+def null_summary(label, thresholds, observed, null_ratio):
+    """observed: (T,) 观测占比；null_ratio: (R,T) → 每阈值一行的 DataFrame"""
+    R = null_ratio.shape[0]
+    mean = null_ratio.mean(axis=0)
+    sd = null_ratio.std(axis=0, ddof=1) if R > 1 else np.full(len(thresholds), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(sd > 0, (observed - mean) / sd, np.nan)
+    p_greater = (1 + (null_ratio >= observed).sum(axis=0)) / (1 + R)
+    p_less = (1 + (null_ratio <= observed).sum(axis=0)) / (1 + R)
+    return pd.DataFrame({
+        'label': label, 'threshold': thresholds, 'observed': observed,
+        'null_mean': mean, 'null_sd': sd, 'z': z,
+        'p_greater': p_greater, 'p_less': p_less,
+        'p_two_sided': np.minimum(1.0, 2 * np.minimum(p_greater, p_less)), 'n_replicates': R,
+    })
+
+def ratio(num_nodes, lcc):
+    return np.where(num_nodes > 0, lcc / np.maximum(num_nodes, 1), 0.0)
+
+def default_workers():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# ---------- 主流程 ----------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Null-model replicates for LCC ratios (randomized coordinates, in-memory)")
+    ap.add_argument("--euchr_file", default=None, help="默认 <Sample>/<Sample>.euchromatin_cluster.txt（或 glob）")
+    ap.add_argument("--h3k4_file", default=None, help="默认 <Sample>/<Sample>.h3k4me3_cluster.txt（或 glob）")
+    ap.add_argument("--labels", default="euchr,h3k4", help="逗号分隔的来源；缺少 cluster 文件的来源跳过")
+    ap.add_argument("--thresholds", nargs='+', default=["1","1.25","1.5","1.75","2","2.25","2.5","2.75","3"],
+                    help="逐阈值检验（同 cluster_and_merge_whole_dual.sh 阈值）")
+    ap.add_argument("--node_mode", default="all_bins",
+                    choices=["leq_thr_endpoints", "all_distance_endpoints", "all_bins"],
+                    help="节点集合（同 analyze_graph_parallel_dual.py）；all_distance_endpoints 在最近邻补边后即全部 bin，按 all_bins 处理")
+    ap.add_argument("--model", default="homolog_rotate", choices=MODELS, help="坐标随机化方式（见模块说明）")
+    ap.add_argument("--jitter_sigma", type=float, default=1.0, help="--model jitter 的高斯噪声标准差（坐标单位）")
+    ap.add_argument("--replicates", type=int, default=200, help="每个来源的随机化次数")
+    ap.add_argument("--seed", type=int, default=0, help="随机种子（与 --workers 无关）")
+    ap.add_argument("--workers", type=int, default=default_workers(),
+                    help="进程池大小（默认本节点可用核数；批处理内每样本用 1）")
+    ap.add_argument("--out_dir", default=None, help=f"默认 <Sample>/{OUT_DIRNAME}")
+    ap.add_argument("--sample_dir", default=None,
+                    help="样本目录（Sample-*）；默认由脚本位置上溯（批处理驱动显式传入）")
+    args = ap.parse_args(argv)
+    prof = StageProfile("null", argv)
+
+    script_dir = Path(__file__).resolve().parent
+    sample_dir = ascend_to_sample_dir(Path(args.sample_dir) if args.sample_dir else script_dir)
+    sample_name = sample_dir.name
+    if cKDTree is None or sparse is None:
+        print("[ERROR] 空模型需要 scipy（cKDTree / csgraph）", file=sys.stderr); sys.exit(2)
+    if args.replicates < 1:
+        ap.error("--replicates 至少为 1")
+
+    given = {'euchr': args.euchr_file, 'h3k4': args.h3k4_file}
+    wanted = [lab.strip() for lab in args.labels.split(",") if lab.strip()]
+    bad = [lab for lab in wanted if lab not in LABELS]
+    if bad:
+        ap.error(f"未知来源：{bad}（可选 {','.join(LABELS)}）")
+    files = {lab: Path(given[lab]) if given[lab] else locate_cluster(sample_dir, lab) for lab in wanted}
+    files = {lab: fp for lab, fp in files.items() if fp is not None and fp.is_file()}
+    if not files:
+        print(f"[Info] 未找到 cluster 文件（{sample_dir}）")
+        sys.exit(0)
+
+    thr_str = list(args.thresholds)
+    thresholds = [float(t) for t in thr_str]
+    arrays, n_nodes, n_bins, caches = {}, {}, {}, {}
+    with prof.timer("parse"):
+        for lab, fp in files.items():
+            tab, caches[lab] = load_cluster_table(fp, lab)
+            if len(tab) < 2:
+                print(f"[Info] {lab}: 少于 2 个 bin，跳过"); continue
+            node_of, uniq = pd.factorize(tab.keys(":"))
+            arrays[f"{lab}.xyz"] = np.ascontiguousarray(tab.xyz, dtype=float)
+            arrays[f"{lab}.codes"] = np.asarray(tab.codes, dtype=np.int64)
+            arrays[f"{lab}.node_of"] = node_of.astype(np.int64)
+            n_nodes[lab], n_bins[lab] = len(uniq), len(tab)
+    labels = [lab for lab in files if lab in n_nodes]
+    if not labels:
+        sys.exit(0)
+
+    cfg = {'labels': labels, 'model': args.model, 'sigma': args.jitter_sigma, 'seed': args.seed,
+           'thresholds': thresholds, 'node_mode': args.node_mode, 'n_nodes': n_nodes}
+    with prof.timer("observed"):
+        observed = {lab: lcc_by_threshold(arrays[f"{lab}.xyz"], arrays[f"{lab}.node_of"], n_nodes[lab],
+                                          thresholds, args.node_mode) for lab in labels}
+    workers = max(1, min(args.workers, args.replicates * len(labels)))
+    with prof.timer("replicates"):
+        null = run_replicates(arrays, cfg, args.replicates, workers)
+
+    rep_rows, summ = [], []
+    for lab in labels:
+        nn, nl = null[lab]
+        nr = ratio(nn, nl)
+        rep_rows.append(pd.DataFrame({
+            'label': lab, 'replicate': np.repeat(np.arange(args.replicates), len(thr_str)),
+            'threshold': np.tile(thr_str, args.replicates),
+            'num_nodes': nn.ravel(), 'largest_cc_size': nl.ravel(), 'ratio': nr.ravel()}))
+        summ.append(null_summary(lab, thr_str, ratio(*observed[lab]), nr))
+    summary = pd.concat(summ, ignore_index=True)
+
+    out_dir = Path(args.out_dir) if args.out_dir else sample_dir / OUT_DIRNAME
+    rep_path = out_dir / f"{sample_name}_null_{args.model}_replicates.tsv"
+    summ_path = out_dir / f"{sample_name}_null_{args.model}_summary.tsv"
+    with prof.timer("write"):
+        with atomic_output(rep_path) as tmp:
+            pd.concat(rep_rows, ignore_index=True).to_csv(tmp, sep="\t", index=False)
+        with atomic_output(summ_path) as tmp:
+            summary.to_csv(tmp, sep="\t", index=False)
+
+    prof.count(replicates=args.replicates, workers=workers, model=args.model, node_mode=args.node_mode,
+               **{f"{lab}_bins": n_bins[lab] for lab in labels},
+               bin_cache=", ".join(f"{lab}={caches[lab]}" for lab in labels))
+    prof_path = prof.write(summ_path)
+
+    # -------- REPORT --------
+    print("\n=== null_model_dual REPORT ===")
+    print(f"Sample name : {sample_name}")
+    for lab in labels:
+        print(f"{lab:5s} in    : {files[lab].resolve()} ({n_bins[lab]} bins, {n_nodes[lab]} nodes, cache {caches[lab]})")
+    print(f"Model       : {args.model}" + (f" (sigma={args.jitter_sigma:g})" if args.model == "jitter" else "")
+          + f" | node_mode={args.node_mode}")
+    print(f"Replicates  : {args.replicates} per label | workers={workers} | seed={args.seed}")
+    print(f"Out dir     : {out_dir.resolve()}")
+    print(f"Files out   : {rep_path.name}, {summ_path.name}")
+    for r in summary.itertuples():
+        print(f"  {r.label:5s} thr={r.threshold:<5s} obs={r.observed:.4f} null={r.null_mean:.4f}±{r.null_sd:.4f} "
+              f"z={r.z:+.2f} p2={r.p_two_sided:.4g}")
+    if prof_path:
+        print(f"Profile     : {prof_path.resolve()}")
+    print("==============================\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可续跑的 DAG 流水线：distance → 逐阈值 clustering → merge → LCC summary
+
+任务图（每个样本）：
+  distance:{label}            cluster 文件 → Whole_genome_distance_dual_{label}/<base>_distance_filtered.*
+  cluster:{label}:{thr}       距离文件 (+cluster 文件) → graph_matrix_dual_{label}/whole{thr}/…metrics + components_single/…
+  merge:{label}               全部 cluster:{label}:* 输出 + Split_based_on_chr_dual_{label}/ → components/<Sample>_components.txt
+  summary                     summary 阈值对应的 metrics → viz_results_ver2_dual_*/…
+  cross（--cross）             两种 cluster 文件 → Whole_genome_distance_dual_cross/<base>_cross_*（h3k4↔euchr 邻近）
+  null（--null R）             cluster 文件 → null_model_dual/<Sample>_null_{model}_*（R 组随机坐标的 LCC 空分布）
+
+增量：任务的输出全部存在、最旧输出不早于最新输入、且参数与上次成功运行一致（<Sample>/.pipeline_dual/ 下的戳记）
+时跳过；上游需要重跑时下游一并重跑。因此新增一个阈值只会重跑该阈值的 clustering 以及 merge / summary。
+
+执行器：
+  local：本地进程池（默认本节点可用核数），各任务在 worker 内调用阶段脚本的 main(argv)
+  slurm：按拓扑序 sbatch 提交需要重跑的任务，依赖用 --dependency=afterok；作业成功后才写戳记
+
+用法：
+  python pipeline_dag_dual.py                       # 当前样本（由脚本位置上溯），本地执行
+  python pipeline_dag_dual.py '/data/Sample-*' --executor slurm --thresholds 1 1.5 2 2.5
+  python pipeline_dag_dual.py --dry_run             # 只打印计划
+"""
+import sys, json, time, hashlib, argparse, importlib, subprocess, contextlib, traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from batch_pipeline_dual import (
+    LABELS, SCRIPT_DIR, expand_samples, find_cluster_file, distance_base, distance_opts, distance_ext, run_stage, default_workers,
+)
+from Calculate_distance_whole_dual import ascend_to_sample_dir
+from stream_io_dual import open_text, COMPRESS_CHOICES
+
+STATE_DIRNAME = ".pipeline_dual"
+SUMMARY_SUFFIX = "ver2_dual"          # summarize_lcc_trend_dual.py --out_suffix 默认值
+# SLURM 资源（同原 .sh 脚本）
+SLURM_RES = {"distance": ("04:00:00", "8G"), "cross": ("04:00:00", "8G"), "null": ("08:00:00", "8G"),
+             "cluster": ("04:00:00", "8G"),
+             "merge": ("01:00:00", "8G"), "summary": ("00:20:00", "4G")}
+MODULES = {"distance": "Calculate_distance_whole_dual", "cross": "Calculate_cross_distance_dual", "null": "null_model_dual",
+           "cluster": "analyze_graph_parallel_dual",
+           "merge": "merge_components_dual", "summary": "summarize_lcc_trend_dual"}
+
+class Task:
+    """
+    DAG 节点：stage 对应阶段脚本，argv 为其命令行参数
+    inputs / outputs 为文件路径；deps 为上游任务 id
+    """
+    def __init__(self, tid, stage, sample_dir, argv, inputs, outputs, deps=()):
+        self.id, self.stage, self.sample_dir = tid, stage, Path(sample_dir)
+        self.argv, self.inputs, self.outputs, self.deps = list(argv), list(inputs), list(outputs), list(deps)
+
+    @property
+    def module(self):
+        return MODULES[self.stage]
+
+    @property
+    def params_hash(self):
+        return hashlib.sha1(json.dumps([self.module, self.argv]).encode()).hexdigest()
+
+    @property
+    def stamp(self):
+        return self.sample_dir / STATE_DIRNAME / "stamps" / f"{self.id.replace(':', '__')}.json"
+
+    @property
+    def log(self):
+        return self.sample_dir / STATE_DIRNAME / "logs" / f"{self.id.replace(':', '__')}.log"
+
+# ---------- 构图 ----------
+def build_tasks(sample_dir, cfg):
+    """一个样本的任务列表（拓扑序）；id 前缀为样本名"""
+    s = Path(sample_dir); name = s.name
+    tasks, summary_inputs, summary_deps = [], [], []
+    summary_thr = [float(t) for t in cfg['summary_thresholds'].split(",") if t.strip()]
+    txt = ".txt" + COMPRESS_CHOICES[cfg.get('compress') or "none"]
+    exts = {"text": [txt], "binary": [".edges.bin", ".nodes.tsv"],
+            "both": [txt, ".edges.bin", ".nodes.tsv"]}[cfg['out_format']]
+    for lab in LABELS:
+        cluster = find_cluster_file(s, lab)
+        if cluster is None:
+            continue
+        base = distance_base(cluster)
+        dist_stem = s / f"Whole_genome_distance_dual_{lab}" / f"{base}_distance_filtered"
+        dist_outs = [Path(f"{dist_stem}{e}") for e in exts]
+        if cfg['sorted_index']:
+            dist_outs += [Path(f"{dist_stem}.edges.sorted.bin"), Path(f"{dist_stem}.edges.sorted.idx.npz")]
+        dist_in = Path(f"{dist_stem}{distance_ext(cfg)}")
+        t_dist = Task(f"{name}:distance:{lab}", "distance", s,
+                      [str(cluster), f"{dist_stem}{txt}", "--source_label", lab,
+                       "--threshold", str(cfg['threshold']), "--out_format", cfg['out_format'],
+                       "--sample_dir", str(s), *distance_opts(cfg)],
+                      [cluster], dist_outs)
+        tasks.append(t_dist)
+
+        out_root = s / f"graph_matrix_dual_{lab}"
+        comp_files, cluster_ids = [], []
+        for t in cfg['thresholds']:
+            mf = out_root / f"whole{t}" / f"{base}_whole{t}_metrics.txt"
+            compf = out_root / "components_single" / f"{base}_comp_whole{t}.txt"
+            tc = Task(f"{name}:cluster:{lab}:{t}", "cluster", s,
+                      ["--distance_file", str(dist_in), "--threshold", t, "--output_prefix", f"whole{t}",
+                       "--node_mode", cfg['node_mode'], "--backend", cfg['backend'],
+                       "--source_label", lab, "--cluster_file", str(cluster),
+                       "--out_root", str(out_root), "--sample_dir", str(s),
+                       *(["--metrics_db", cfg['metrics_db']] if cfg['metrics_db'] else [])],
+                      [dist_in, cluster], [mf, compf], [t_dist.id])
+            tasks.append(tc)
+            comp_files.append(compf); cluster_ids.append(tc.id)
+            if float(t) in summary_thr:
+                summary_inputs.append(mf); summary_deps.append(tc.id)
+
+        split_files = sorted((s / f"Split_based_on_chr_dual_{lab}").glob("*.txt"))
+        tasks.append(Task(f"{name}:merge:{lab}", "merge", s,
+                          ["--source_label", lab, "--sample_dir", str(s)],
+                          comp_files + split_files,
+                          [out_root / "components" / f"{name}_components.txt"], cluster_ids))
+
+    clusters = {lab: find_cluster_file(s, lab) for lab in LABELS}
+    if cfg.get('cross') and all(clusters.values()):
+        cdir, base = s / "Whole_genome_distance_dual_cross", distance_base(clusters['euchr'])
+        tasks.append(Task(f"{name}:cross", "cross", s,
+                          ["--euchr_file", str(clusters['euchr']), "--h3k4_file", str(clusters['h3k4']),
+                           "--threshold", str(cfg['threshold']), "--thresholds", *cfg['thresholds'],
+                           "--sample_dir", str(s),
+                           *(["--mem_budget_mb", f"{cfg['mem_budget_mb']:g}"] if cfg.get('mem_budget_mb') else [])],
+                          list(clusters.values()),
+                          [cdir / f"{base}_cross_{k}" for k in ("pairs.txt", "nearest.tsv", "sweep.tsv")]))
+
+    if cfg.get('null') and any(clusters.values()):
+        ndir, found = s / "null_model_dual", {lab: fp for lab, fp in clusters.items() if fp}
+        tasks.append(Task(f"{name}:null", "null", s,
+                          ["--labels", ",".join(found), "--thresholds", *cfg['thresholds'],
+                           "--node_mode", cfg['node_mode'], "--model", cfg['null_model'],
+                           "--replicates", str(cfg['null']), "--workers", "1",
+                           *[a for lab, fp in found.items() for a in (f"--{lab}_file", str(fp))],
+                           "--sample_dir", str(s)],
+                          list(found.values()),
+                          [ndir / f"{name}_null_{cfg['null_model']}_{k}.tsv" for k in ("replicates", "summary")]))
+
+    if tasks:
+        tasks.append(Task(f"{name}:summary", "summary", s,
+                          ["--thresholds", cfg['summary_thresholds'], "--sample_dir", str(s)],
+                          summary_inputs,
+                          [s / f"viz_results_{SUMMARY_SUFFIX}_summary" / "lcc_trend_values.tsv",
+                           s / f"viz_results_{SUMMARY_SUFFIX}_summary" / "lcc_trend_grouped.png",
+                           s / f"viz_results_{SUMMARY_SUFFIX}_euchr" / "summary" / "lcc_trend_euchr.png",
+                           s / f"viz_results_{SUMMARY_SUFFIX}_h3k4" / "summary" / "lcc_trend_h3k4.png"],
+                          summary_deps))
+    return tasks
+
+# ---------- 增量判定 ----------
+def read_stamp(task):
+    try:
+        with open(task.stamp, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_stamp(task, path=None):
+    with open_text(path or task.stamp, 'w') as f:
+        json.dump({'task': task.id, 'module': task.module, 'argv': task.argv,
+                   'params': task.params_hash, 'time': time.time()}, f, indent=1)
+
+def stale_reason(task, stale_ids):
+    """需要重跑的原因；最新时返回 None"""
+    if any(d in stale_ids for d in task.deps):
+        return "upstream"
+    stamp = read_stamp(task)
+    if stamp is None:
+        return "never run"
+    if stamp.get('params') != task.params_hash:
+        return "params changed"
+    missing = [p for p in task.outputs if not Path(p).exists()]
+    if missing:
+        return f"missing {Path(missing[0]).name}"
+    t_out = min(Path(p).stat().st_mtime_ns for p in task.outputs)
+    t_in = max((Path(p).stat().st_mtime_ns for p in task.inputs if Path(p).exists()), default=0)
+    if t_in > t_out:
+        return "inputs newer"
+    return None
+
+def plan(tasks, force=False):
+    """拓扑序（构图顺序即拓扑序）逐个判定 → {task_id: reason}，只含需要重跑的任务"""
+    stale = {}
+    for t in tasks:
+        reason = "forced" if force else stale_reason(t, stale)
+        if reason:
+            stale[t.id] = reason
+    return stale
+
+# ---------- 本地执行器 ----------
+def run_task(module, argv, log_path):
+    """worker 内执行一个任务：导入阶段模块并调用 main(argv)，输出写入任务日志"""
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log, \
+         contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            run_stage(importlib.import_module(module).main, argv)
+        except Exception:
+            traceback.print_exc()
+            raise
+    return time.perf_counter() - t0
+
+def run_local(tasks, stale, workers):
+    """依赖就绪即提交；失败任务的下游标记为 blocked，其余分支继续"""
+    todo = {t.id: t for t in tasks if t.id in stale}
+    state = {tid: 'pending' for tid in todo}
+    by_id = {t.id: t for t in tasks}
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        running = {}
+        while True:
+            for tid, t in todo.items():
+                if state[tid] != 'pending': continue
+                dep_states = [state.get(d, 'done') for d in t.deps]
+                if any(s in ('failed', 'blocked') for s in dep_states):
+                    state[tid] = 'blocked'; results[tid] = ('blocked', 0.0, ''); continue
+                if all(s == 'done' for s in dep_states):
+                    state[tid] = 'running'
+                    running[pool.submit(run_task, t.module, t.argv, str(t.log))] = tid
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                tid = running.pop(fut)
+                try:
+                    secs = fut.result()
+                    write_stamp(by_id[tid])
+                    state[tid] = 'done'; results[tid] = ('done', secs, '')
+                except Exception as e:
+                    state[tid] = 'failed'
+                    results[tid] = ('failed', 0.0, f"{type(e).__name__}: {e}".replace("\n", " "))
+                print(f"[{results[tid][0].upper():6s}] {tid}"
+                      + (f" ({results[tid][2]})" if results[tid][2] else f" [{results[tid][1]:.1f}s]"), flush=True)
+    return results
+
+# ---------- SLURM 执行器 ----------
+def script_path(module):
+    return Path(importlib.import_module(module).__file__).resolve()
+
+def run_slurm(tasks, stale, dry_run=False):
+    """按拓扑序提交需要重跑的任务；作业脚本末尾把预写的戳记改名生效（afterok 语义：成功才更新）"""
+    jobs, results = {}, {}
+    for t in tasks:
+        if t.id not in stale: continue
+        jobs_dir = t.sample_dir / STATE_DIRNAME / "jobs"
+        jobs_dir.mkdir(parents=True, exist_ok=True)
+        t.log.parent.mkdir(parents=True, exist_ok=True)
+        tag = t.id.replace(':', '__')
+        pending_stamp = t.stamp.with_name(t.stamp.name + ".pending")
+        if not dry_run:
+            write_stamp(t, pending_stamp)
+        wall, mem = SLURM_RES[t.stage]
+        argv = " ".join(f'"{a}"' for a in t.argv)
+        job = jobs_dir / f"{tag}.sh"
+        with open(job, 'w', encoding='utf-8') as f:
+            f.write(f"""#!/bin/bash
+#SBATCH --job-name={tag}
+#SBATCH --output={t.log}
+#SBATCH --error={t.log}
+#SBATCH --time={wall}
+#SBATCH --mem={mem}
+#SBATCH --chdir={SCRIPT_DIR}
+set -euo pipefail
+
+python3 "{script_path(t.module)}" {argv}
+mv -f "{pending_stamp}" "{t.stamp}"
+""")
+        deps = [jobs[d] for d in t.deps if d in jobs]
+        cmd = ["sbatch", "--parsable"] + ([f"--dependency=afterok:{':'.join(deps)}"] if deps else []) + [str(job)]
+        if dry_run:
+            jobs[t.id] = f"<{tag}>"
+        else:
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            jobs[t.id] = out.strip().split(";")[0]
+        results[t.id] = ('submitted', 0.0, jobs[t.id])
+        print(f"[SUBMIT] {t.id} (jobid={jobs[t.id]}" + (f", after {','.join(deps)}" if deps else "") + ")", flush=True)
+    return results
+
+# ---------- 主流程 ----------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="可续跑的 DAG 流水线（local / slurm 执行器）")
+    ap.add_argument("samples", nargs='*',
+                    help="Sample-* 目录 / glob / @列表文件；默认由脚本位置上溯到当前样本")
+    ap.add_argument("--executor", default="local", choices=["local","slurm"])
+    ap.add_argument("--workers", type=int, default=default_workers(), help="local 执行器进程数")
+    ap.add_argument("--threshold", type=float, default=5.0, help="距离阈值")
+    ap.add_argument("--sorted_index", action="store_true",
+                    help="distance 阶段另存按距离排序的边存储 + 阈值索引，graph 阶段只读所需前缀（需 --out_format binary/both）")
+    ap.add_argument("--mem_budget_mb", type=float, default=None,
+                    help="distance 阶段流式枚举的点对内存预算（MB，同 Calculate_distance_whole_dual.py）")
+    ap.add_argument("--out_format", default="text", choices=["text","binary","both"])
+    ap.add_argument("--incremental", action="store_true",
+                    help="distance 任务增量模式：cluster 文件只改动少数 bin 时修补已有距离输出，不全量重算")
+    ap.add_argument("--compress", default="none", choices=list(COMPRESS_CHOICES),
+                    help="distance 文本输出压缩（gz / zst）；graph 任务直接读压缩文件")
+    ap.add_argument("--thresholds", nargs='+', default=["1","1.25","1.5","1.75","2","2.25","2.5","2.75","3"],
+                    help="clustering 阈值（每个阈值一个任务；前缀 whole{thr}，保持原样文本）")
+    ap.add_argument("--node_mode", default="all_bins",
+                    choices=["leq_thr_endpoints","all_distance_endpoints","all_bins"])
+    ap.add_argument("--backend", default="networkx", choices=["networkx","sparse"])
+    ap.add_argument("--summary_thresholds", default="1.5,1.75,2.0,2.25,2.5")
+    ap.add_argument("--metrics_db", default=None,
+                    help="clustering 任务同时写入跨样本 metrics 库（SQLite 路径；auto=各样本上一级默认位置）")
+    ap.add_argument("--cross", action="store_true",
+                    help="另加每样本一个 cross 任务（h3k4↔euchr 邻近点对、最近距离与阈值扫描）")
+    ap.add_argument("--null", type=int, default=0, metavar="R",
+                    help="另加每样本一个 null 任务：R 组随机坐标的 LCC 空分布与经验 p 值（0=不加）")
+    ap.add_argument("--null_model", default="homolog_rotate", choices=["jitter","homolog_rotate","uniform_box"],
+                    help="null 任务的坐标随机化方式（同 null_model_dual.py --model）")
+    ap.add_argument("--force", action="store_true", help="忽略增量判定，全部重跑")
+    ap.add_argument("--dry_run", action="store_true", help="只打印计划（slurm 下不提交）")
+    args = ap.parse_args(argv)
+    if args.sorted_index and args.out_format == "text":
+        ap.error("--sorted_index 需要 --out_format binary/both")
+
+    samples = expand_samples(args.samples) if args.samples else [ascend_to_sample_dir(SCRIPT_DIR)]
+    if not samples:
+        print("[ERROR] 未找到任何 Sample-* 目录", file=sys.stderr); sys.exit(2)
+    cfg = {'threshold': args.threshold, 'out_format': args.out_format, 'mem_budget_mb': args.mem_budget_mb,
+           'sorted_index': args.sorted_index, 'compress': args.compress, 'incremental': args.incremental,
+           'cross': args.cross,
+           'null': args.null, 'null_model': args.null_model, 'thresholds': args.thresholds,
+           'node_mode': args.node_mode, 'backend': args.backend,
+           'summary_thresholds': args.summary_thresholds,
+           'metrics_db': str(Path(args.metrics_db).resolve()) if args.metrics_db not in (None, "auto") else args.metrics_db}
+
+    tasks = [t for s in samples for t in build_tasks(s, cfg)]
+    stale = plan(tasks, args.force)
+    print("========== PLAN ==========")
+    print(f"Samples  : {len(samples)} | tasks: {len(tasks)} | to run: {len(stale)} | up to date: {len(tasks) - len(stale)}")
+    for t in tasks:
+        print(f"  {'RUN ' if t.id in stale else 'SKIP'} {t.id}" + (f"  ({stale[t.id]})" if t.id in stale else ""))
+    print("==========================")
+    if args.dry_run and args.executor == "local":
+        return
+
+    t0 = time.perf_counter()
+    if args.executor == "local":
+        results = run_local(tasks, stale, args.workers)
+    else:
+        results = run_slurm(tasks, stale, args.dry_run)
+    failed = [tid for tid, r in results.items() if r[0] in ('failed', 'blocked')]
+
+    # -------- REPORT --------
+    print("\n=== pipeline_dag_dual REPORT ===")
+    print(f"Executor    : {args.executor}" + (f" (workers={args.workers})" if args.executor == "local" else ""))
+    print(f"Tasks       : {len(tasks)} | skipped (up to date): {len(tasks) - len(stale)}")
+    for st in ('done', 'submitted', 'failed', 'blocked'):
+        n = sum(r[0] == st for r in results.values())
+        if n: print(f"  {st:10s}: {n}")
+    print(f"Wall time   : {time.perf_counter() - t0:.1f}s")
+    print(f"State dir   : <Sample>/{STATE_DIRNAME}/ (stamps, logs, jobs)")
+    for tid in failed:
+        print(f"  [{results[tid][0].upper()}] {tid}" + (f": {results[tid][2]}" if results[tid][2] else ""))
+    print("================================\n")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各阶段的结构化耗时 / 内存记录（JSON，默认写在该阶段输出旁）
+
+  prof = StageProfile("distance")
+  with prof.timer("parse"):
+      ...
+  prof.count(bins=n, pairs=m)
+  prof.write(output_path)            # → <output>.profile.json
+
+JSON 字段：stage, argv, host, pid, started, wall_s, timings（各阶段秒数，同名累加）,
+          counts, peak_rss_mb（本进程至今峰值；批处理 worker 内为进程级峰值）, cprofile
+环境变量：
+  ANDIE_PROFILE=0   不写 JSON（默认写）
+  ANDIE_CPROFILE=1  用 cProfile 包住整个运行，另存 <output>.pstats（python -m pstats 查看）
+"""
+import os, sys, json, time, socket, resource, contextlib
+from pathlib import Path
+
+from stream_io_dual import open_text
+
+PROFILE_SUFFIX = ".profile.json"
+PSTATS_SUFFIX = ".pstats"
+
+def peak_rss_mb():
+    """本进程峰值 RSS（MB）；Linux 上 ru_maxrss 单位为 KB，macOS 为字节"""
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024.0 * 1024.0) if sys.platform == "darwin" else r / 1024.0
+
+def profile_path(output_path):
+    return Path(f"{output_path}{PROFILE_SUFFIX}")
+
+class StageProfile:
+    """一次阶段运行的计时器 + 计数器；ANDIE_CPROFILE=1 时构造即开始 cProfile"""
+    def __init__(self, stage, argv=None):
+        self.stage = stage
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.timings, self.counts = {}, {}
+        self.enabled = os.environ.get("ANDIE_PROFILE", "1") != "0"
+        self._cprof = None
+        if os.environ.get("ANDIE_CPROFILE", "0") == "1":
+            import cProfile
+            self._cprof = cProfile.Profile()
+            self._cprof.enable()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - t0
+
+    def count(self, **kw):
+        for k, v in kw.items():
+            self.counts[k] = int(v) if hasattr(v, "__index__") else v
+
+    def append(self, key, item):
+        """列表型计数（如逐阈值的节点 / 边 / 组件数）"""
+        self.counts.setdefault(key, []).append(item)
+
+    def as_dict(self):
+        return {
+            'stage': self.stage, 'argv': self.argv, 'host': socket.gethostname(), 'pid': os.getpid(),
+            'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            'wall_s': round(time.perf_counter() - self._t0, 6),
+            'timings': {k: round(v, 6) for k, v in self.timings.items()},
+            'counts': self.counts,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+    def write(self, output_path):
+        """写 <output>.profile.json（及 cProfile 统计）；返回 JSON 路径，关闭时返回 None"""
+        data = self.as_dict()
+        if self._cprof is not None:
+            self._cprof.disable()
+            pstats_path = Path(f"{output_path}{PSTATS_SUFFIX}")
+            self._cprof.dump_stats(pstats_path)
+            self._cprof = None
+            data['cprofile'] = str(pstats_path)
+        if not self.enabled:
+            return None
+        path = profile_path(output_path)
+        with open_text(path, 'w') as f:
+            json.dump(data, f, indent=1, default=str)
+        return path
+
+class _NullProfile:
+    """未传入 StageProfile 时的占位：计时与计数均为空操作"""
+    def timer(self, name): return contextlib.nullcontext()
+    def count(self, **kw): pass
+    def append(self, key, item): pass
+
+NULL_PROFILE = _NullProfile()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按扩展名透明压缩的文本读写 + 原子输出（各阶段共用）
+
+  .gz          gzip（标准库）
+  .zst / .zstd zstd（需 zstandard 包；未安装时读写 .zst 报清晰错误）
+  其他         普通文本
+
+写：先写同目录隐藏临时文件 .tmp-<pid>-<文件名>，正常关闭时 os.replace 为目标名；
+    with 块内抛异常（或进程被杀）时目标文件不会出现或保持旧版本，下游不会读到截断文件。
+    压缩输出的压缩与写盘在后台线程进行，主线程只做格式化并把约 1MB 的文本块放入有界队列。
+读：open_text(path) 按扩展名解压；pandas.read_csv 直接传路径即可（同样按扩展名推断）。
+
+  with open_text(out, 'w') as f: f.write(...)
+  with atomic_output(out) as tmp: df.to_csv(tmp, ...)     # 供 to_csv / np.save / savefig 等按路径写的接口
+"""
+import os, io, gzip, queue, threading, contextlib
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_EXTS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+COMPRESS_CHOICES = {"none": "", "gz": ".gz", "zst": ".zst"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+WRITE_CHUNK = 1 << 20
+QUEUE_DEPTH = 8
+
+def compression_of(path):
+    """'gzip' | 'zstd' | None"""
+    return COMPRESSION_EXTS.get(Path(str(path)).suffix.lower())
+
+def strip_compression(name):
+    """去掉末尾压缩扩展名：X.txt.gz → X.txt"""
+    name = str(name)
+    for ext in COMPRESSION_EXTS:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def with_compression(path, compress):
+    """按 --compress 选项（none|gz|zst）给输出路径加扩展名"""
+    return Path(f"{path}{COMPRESS_CHOICES[compress or 'none']}")
+
+def _need_zstd(path):
+    if zstandard is None:
+        raise RuntimeError(f"读写 {path} 需要 zstandard 包（pip install zstandard），或改用 .gz")
+
+def tmp_path_for(path):
+    """同目录隐藏临时名；保留原扩展名，便于按路径写的接口推断格式"""
+    path = Path(path)
+    return path.with_name(f".tmp-{os.getpid()}-{path.name}")
+
+def _open_raw_writer(raw, kind):
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    if kind == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+    return None
+
+class _BackgroundCompressor(io.RawIOBase):
+    """
+    可写字节流：write 只把块放入有界队列，后台线程压缩并写入底层文件
+    后台异常在下一次 write / close 时于主线程重新抛出
+    """
+    def __init__(self, raw, kind):
+        super().__init__()
+        self._raw, self._comp = raw, _open_raw_writer(raw, kind)
+        self._q = queue.Queue(maxsize=QUEUE_DEPTH)
+        self._err = None
+        self._th = threading.Thread(target=self._run, name="stream-io-compress", daemon=True)
+        self._th.start()
+
+    def _run(self):
+        try:
+            while True:
+                buf = self._q.get()
+                if buf is None: break
+                self._comp.write(buf)
+            self._comp.close()
+        except BaseException as e:            # 记录后继续消费队列，避免主线程阻塞在 put
+            self._err = e
+            while self._q.get() is not None:
+                pass
+
+    def _check(self):
+        if self._err is not None:
+            raise self._err
+
+    def writable(self): return True
+
+    def write(self, b):
+        self._check()
+        self._q.put(bytes(b))
+        return len(b)
+
+    def close(self):
+        if self.closed: return
+        self._q.put(None)
+        self._th.join()
+        super().close()
+        self._check()
+
+class AtomicWriter:
+    """
+    open_text(..., 'w') 的返回值：文本句柄代理，写临时文件，close 时提交（改名），abort 时删除
+    作为上下文管理器使用时，with 块内异常 → abort
+    """
+    def __init__(self, path, binary=False, encoding='utf-8'):
+        self.path = Path(path)
+        self.tmp = tmp_path_for(self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        kind = compression_of(self.path)
+        if kind == "zstd": _need_zstd(self.path)
+        self._raw = open(self.tmp, 'wb')
+        self._bg = _BackgroundCompressor(self._raw, kind) if kind else None
+        sink = io.BufferedWriter(self._bg, buffer_size=WRITE_CHUNK) if self._bg else self._raw
+        self._fh = sink if binary else io.TextIOWrapper(sink, encoding=encoding, write_through=False)
+        self.closed = False
+
+    def write(self, s): return self._fh.write(s)
+    def writelines(self, lines): return self._fh.writelines(lines)
+    def flush(self): self._fh.flush()
+
+    def _close_handles(self):
+        try:
+            self._fh.close()
+        finally:
+            if not self._raw.closed:
+                self._raw.close()
+
+    def close(self):
+        """提交：关闭（等待后台压缩写完）后原子改名"""
+        if self.closed: return
+        self.closed = True
+        try:
+            self._close_handles()
+        except BaseException:
+            self._discard(); raise
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        """放弃：关闭并删除临时文件，目标文件保持原状"""
+        if self.closed: return
+        self.closed = True
+        try:
+            self._close_handles()
+        except BaseException:
+            pass
+        self._discard()
+
+    def _discard(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.tmp)
+
+    def __enter__(self): return self
+
+    def __exit__(self, et, ev, tb):
+        if et is None: self.close()
+        else: self.abort()
+        return False
+
+def open_text(path, mode='r', encoding='utf-8', errors=None):
+    """
+    按扩展名透明解压 / 压缩的文本文件
+    'r'：返回普通文本句柄；'w'：返回 AtomicWriter（压缩在后台线程，关闭时改名）
+    """
+    kind = compression_of(path)
+    if mode in ('w', 'wt'):
+        return AtomicWriter(path, encoding=encoding)
+    if mode not in ('r', 'rt'):
+        raise ValueError(f"open_text 不支持的模式: {mode}")
+    if kind == "gzip":
+        return gzip.open(path, 'rt', encoding=encoding, errors=errors)
+    if kind == "zstd":
+        _need_zstd(path)
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(raw), encoding=encoding, errors=errors)
+    return open(path, encoding=encoding, errors=errors)
+
+def open_binary(path, mode='w'):
+    """
+    二进制文件：'w' 原子写（按扩展名压缩；边表用无压缩名以便 memmap）；'r' 按扩展名透明解压读
+    用于逐字节拷贝文本行（增量修补距离文件时不解码、不重新格式化）
+    """
+    if mode in ('w', 'wb'):
+        return AtomicWriter(path, binary=True)
+    if mode not in ('r', 'rb'):
+        raise ValueError(f"open_binary 不支持的模式: {mode}")
+    kind = compression_of(path)
+    if kind == "gzip":
+        return gzip.open(path, 'rb')
+    if kind == "zstd":
+        _need_zstd(path)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    产出临时路径给按路径写的接口（to_csv / np.save / savez / savefig / json），
+    块正常结束后改名为 path，异常时删除临时文件
+    注意 np.save / np.savez 会自动补 .npy / .npz，因此 path 应已带该扩展名
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_path_for(path)
+    try:
+        yield tmp
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    os.replace(tmp, path)
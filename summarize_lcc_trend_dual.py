@@ -7,6 +7,11 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "script"))
+from metrics_store_dual import resolve_db_path, query_metrics
+from stream_io_dual import open_text, atomic_output
+from profile_dual import StageProfile
+
 # ---------- 公共：自动识别 Sample-* 目录 ----------
 def ascend_sample_dir(p: str):
     cur = os.path.abspath(p)
@@ -64,7 +69,7 @@ def parse_metrics(path: str):
     """
     out = {"threshold": None, "num_nodes": None, "largest_cc_size": None}
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        with open_text(path, errors="ignore") as f:
             for line in f:
                 line = line.strip()
                 if not line or line.startswith("#"): 
@@ -110,8 +115,8 @@ def plot_grouped_bars(thrs, ratios_eu, ratios_h3, out_png, color_eu="#b0d9a5", c
     ax.grid(axis="y", linestyle="--", alpha=0.3)
 
     plt.tight_layout()
-    os.makedirs(os.path.dirname(out_png), exist_ok=True)
-    plt.savefig(out_png, dpi=300)
+    with atomic_output(out_png) as tmp:
+        plt.savefig(tmp, dpi=300)
     plt.close(fig)
     print(f"[OK] 保存：{out_png}")
 
@@ -131,13 +136,227 @@ def plot_single_bars(thrs, ratios, out_png, title, color="#b0d9a5"):
     ax.grid(axis="y", linestyle="--", alpha=0.3)
 
     plt.tight_layout()
-    os.makedirs(os.path.dirname(out_png), exist_ok=True)
-    plt.savefig(out_png, dpi=300)
+    with atomic_output(out_png) as tmp:
+        plt.savefig(tmp, dpi=300)
+    plt.close(fig)
+    print(f"[OK] 保存：{out_png}")
+
+def plot_cohort_bands(thrs, bands, out_png, n_samples, colors):
+    """
+    队列趋势：每个 label 一条均值线 + 四分位带（q25–q75）+ 外带（q10–q90）
+    bands: DataFrame[label, threshold, n, mean, q10, q25, q50, q75, q90]
+    """
+    import numpy as np
+    x = np.arange(len(thrs))
+    pos = {float(t): k for k, t in enumerate(thrs)}
+
+    fig, ax = plt.subplots(figsize=(7.6, 5.2))
+    for label, name in (("euchr", "euchr"), ("h3k4", "h3k4me3")):
+        b = bands[bands["label"] == label]
+        if b.empty: continue
+        xs = b["threshold"].map(pos).to_numpy()
+        c = colors[label]
+        ax.fill_between(xs, b["q10"], b["q90"], color=c, alpha=0.18, linewidth=0)
+        ax.fill_between(xs, b["q25"], b["q75"], color=c, alpha=0.40, linewidth=0)
+        ax.plot(xs, b["mean"], marker="o", color=c, label=f"{name} mean (IQR, 10–90%)")
+
+    ax.set_title(f"Largest connected component ratio vs. distance threshold ({n_samples} samples)")
+    ax.set_xlabel("distance threshold")
+    ax.set_ylabel("largest_cc_size / num_nodes")
+    ax.set_xticks(x)
+    ax.set_xticklabels(thrs)
+    ax.set_ylim(0, 1.05)
+    ax.legend(loc="upper left", frameon=True)
+    ax.grid(axis="y", linestyle="--", alpha=0.3)
+
+    plt.tight_layout()
+    with atomic_output(out_png) as tmp:
+        plt.savefig(tmp, dpi=300)
+    plt.close(fig)
+    print(f"[OK] 保存：{out_png}")
+
+# ---------- 队列模式（metrics 库） ----------
+def cohort_summary(db_path, thrs, out_dir, colors):
+    """一次查询库中全部样本 → 每样本比例表、分位数带表与趋势图"""
+    df = query_metrics(db_path, thresholds=thrs)
+    df = df[df["num_nodes"] > 0].copy()
+    if df.empty:
+        raise RuntimeError(f"{db_path} 中没有阈值 {thrs} 的记录")
+    df["ratio"] = df["largest_cc_size"] / df["num_nodes"]
+    g = df.groupby(["label", "threshold"])["ratio"]
+    q = g.quantile([0.10, 0.25, 0.50, 0.75, 0.90]).unstack()
+    q.columns = [f"q{int(round(c * 100)):02d}" for c in q.columns]
+    bands = g.agg(n="count", mean="mean").join(q).reset_index()
+
+    os.makedirs(out_dir, exist_ok=True)
+    per_sample = df.pivot_table(index="sample", columns=["label", "threshold"], values="ratio")
+    per_sample.columns = [f"{lab}_{thr:g}" for lab, thr in per_sample.columns]
+    ps_path = os.path.join(out_dir, "lcc_ratio_per_sample.tsv")
+    bands_path = os.path.join(out_dir, "lcc_trend_cohort_values.tsv")
+    with atomic_output(ps_path) as tmp:
+        per_sample.to_csv(tmp, sep="\t")
+    with atomic_output(bands_path) as tmp:
+        bands.to_csv(tmp, sep="\t", index=False)
+    png = os.path.join(out_dir, "lcc_trend_cohort.png")
+    n_samples = df["sample"].nunique()
+    plot_cohort_bands(thrs, bands, png, n_samples, colors)
+
+    print("\n=== COHORT SUMMARY (存储结构) ===")
+    print(f"Metrics DB   : {os.path.abspath(db_path)}")
+    print(f"Samples      : {n_samples}  | labels: {', '.join(sorted(df['label'].unique()))}")
+    print(f"Outputs to   :")
+    print(f"  trend png  -> {png}")
+    print(f"  bands.tsv  -> {bands_path}")
+    print(f"  per-sample -> {ps_path}")
+    print("================================")
+
+# ---------- 渗流模式（距离文件 → 连续 LCC 曲线） ----------
+DIST_SUFFIXES = ("_distance_filtered.edges.sorted.bin", "_distance_filtered.edges.bin", "_distance_filtered.txt",
+                 "_distance_filtered.txt.gz", "_distance_filtered.txt.zst")
+CLUSTER_STEMS = {"euchr": "euchromatin_cluster", "h3k4": "h3k4me3_cluster"}
+
+def find_distance_file(sample_dir: str, sample_name: str, label: str):
+    """Whole_genome_distance_dual_<label>/ 下的距离文件：优先 <Sample> 前缀，按 DIST_SUFFIXES 顺序（排序存储 > 二进制 > 文本）"""
+    ddir = os.path.join(sample_dir, f"Whole_genome_distance_dual_{label}")
+    for suf in DIST_SUFFIXES:
+        fp = os.path.join(ddir, f"{sample_name}{suf}")
+        if os.path.isfile(fp):
+            return fp
+    for suf in DIST_SUFFIXES:
+        hits = sorted(glob.glob(os.path.join(ddir, f"*{suf}")))
+        if hits:
+            return hits[0]
+    return None
+
+def find_cluster_file(sample_dir: str, sample_name: str, label: str):
+    stem = CLUSTER_STEMS[label]
+    fp = os.path.join(sample_dir, f"{sample_name}.{stem}.txt")
+    if os.path.isfile(fp):
+        return fp
+    hits = sorted(glob.glob(os.path.join(sample_dir, f"*{stem}.txt")))
+    return hits[0] if hits else None
+
+def plot_percolation(curves, est, out_png, colors, max_distance):
+    """两条阶梯曲线（LCC 占比 vs 距离）+ 各自 χ 峰值处的虚线"""
+    fig, ax = plt.subplots(figsize=(7.6, 5.2))
+    for label, name in (("euchr", "euchr"), ("h3k4", "h3k4me3")):
+        if label not in curves: continue
+        c, e = curves[label], est[label]
+        x = list(c["distance"]) + [max_distance]
+        y = list(c["lcc_frac"].fillna(0.0)) + [c["lcc_frac"].fillna(0.0).iloc[-1]]
+        ax.step(x, y, where="post", color=colors[label], label=f"{name} (t_c≈{e['t_c_chi']:.3g})")
+        if e["t_c_chi"] == e["t_c_chi"]:
+            ax.axvline(e["t_c_chi"], color=colors[label], linestyle="--", alpha=0.8)
+
+    ax.set_title("Largest connected component ratio vs. distance (percolation curve)")
+    ax.set_xlabel("distance threshold")
+    ax.set_ylabel("largest_cc_size / num_nodes")
+    ax.set_xlim(0, max_distance)
+    ax.set_ylim(0, 1.05)
+    ax.legend(loc="upper left", frameon=True)
+    ax.grid(linestyle="--", alpha=0.3)
+
+    plt.tight_layout()
+    with atomic_output(out_png) as tmp:
+        plt.savefig(tmp, dpi=300)
     plt.close(fig)
     print(f"[OK] 保存：{out_png}")
 
+def percolation_summary(sample_dir, sample_name, out_dir, node_mode, max_distance, colors, argv=None):
+    """
+    每个 label：读一次距离文件，按距离单遍 union-find 得到精确的 LCC 占比阶梯曲线与渗流阈值估计
+    （计算在 analyze_graph_parallel_dual.percolation_sweep）
+    """
+    from analyze_graph_parallel_dual import percolation_sweep
+    prof = StageProfile("percolation", argv)
+    curves, est, inputs = {}, {}, {}
+    for label in ("euchr", "h3k4"):
+        dist = find_distance_file(sample_dir, sample_name, label)
+        cluster = find_cluster_file(sample_dir, sample_name, label)
+        inputs[label] = dist
+        if dist is None or (node_mode == "all_bins" and cluster is None):
+            print(f"[WARN] {label}: 缺少距离文件或 cluster 文件，跳过", file=sys.stderr)
+            continue
+        curves[label], est[label] = percolation_sweep(dist, node_mode, cluster, max_distance, prof)
+        prof.count(**{f"{label}_edges": est[label]["n_edges"], f"{label}_steps": len(curves[label])})
+    if not curves:
+        raise RuntimeError(f"{sample_dir} 下没有可用的距离文件")
+
+    curve_path = os.path.join(out_dir, "percolation_curve.tsv")
+    est_path = os.path.join(out_dir, "percolation_thresholds.tsv")
+    png = os.path.join(out_dir, "percolation_curve.png")
+    with atomic_output(curve_path) as tmp:
+        pd.concat([c.assign(label=lab) for lab, c in curves.items()], ignore_index=True)[
+            ["label", "distance", "lcc_size", "num_nodes", "lcc_frac"]
+        ].to_csv(tmp, sep="\t", index=False)
+    est_df = pd.DataFrame([{"label": lab, "node_mode": node_mode, "max_distance": max_distance,
+                            "num_nodes": int(curves[lab]["num_nodes"].iloc[-1]), **e} for lab, e in est.items()])
+    with atomic_output(est_path) as tmp:
+        est_df.to_csv(tmp, sep="\t", index=False)
+    plot_percolation(curves, est, png, colors, max_distance)
+    prof_path = prof.write(curve_path)
+
+    print("\n=== PERCOLATION SUMMARY (存储结构) ===")
+    print(f"Sample dir   : {sample_dir}")
+    print(f"Distance in  :")
+    for lab, fp in inputs.items():
+        print(f"  {lab:<10} -> {fp or '未找到'}")
+    print(f"Node mode    : {node_mode} | max distance {max_distance:g}")
+    for lab, e in est.items():
+        print(f"  {lab:<10} : t_c(χ peak)={e['t_c_chi']:.4g} | t_jump={e['t_jump']:.4g} (+{e['jump']:.3f}) | "
+              f"t_half={e['t_half']:.4g} | LCC@max={e['lcc_frac_max']:.3f} | {len(curves[lab])} steps / {e['n_edges']} edges")
+    print(f"Outputs to   :")
+    print(f"  curve.tsv  -> {curve_path}")
+    print(f"  thresholds -> {est_path}")
+    print(f"  curve png  -> {png}")
+    if prof_path:
+        print(f"  profile    -> {prof_path}")
+    print("======================================")
+
+# ---------- 单样本趋势图 + 数值表 ----------
+def write_lcc_trend(sample_dir, out_suffix, used_thr, ratios, color_eu="#b0d9a5", color_h3="#fdd379"):
+    """
+    ratios: {"euchr": [...], "h3k4": [...]}，与 used_thr 等长，缺失为 None
+    → (分组图, euchr 图, h3k4 图, lcc_trend_values.tsv) 路径（内存端到端模式同样调用）
+    """
+    # 把 None 转为 0（保持柱状图不报错），同时记录缺失信息
+    def fill_none_to_zero(arr, label):
+        out = []
+        for i, v in enumerate(arr):
+            if v is None:
+                print(f"[WARN] {label} 在 thr={used_thr[i]} 缺少数据，按 0 绘制。", file=sys.stderr)
+                out.append(0.0)
+            else:
+                out.append(float(v))
+        return out
+
+    eu_vals = fill_none_to_zero(ratios["euchr"], "euchr")
+    h3_vals = fill_none_to_zero(ratios["h3k4"], "h3k4")
+
+    # 输出目录结构（全部带 ver2_dual* 后缀，避免覆盖旧结果）
+    out_group = os.path.join(sample_dir, f"viz_results_{out_suffix}_summary", "lcc_trend_grouped.png")
+    out_eu    = os.path.join(sample_dir, f"viz_results_{out_suffix}_euchr", "summary", "lcc_trend_euchr.png")
+    out_h3    = os.path.join(sample_dir, f"viz_results_{out_suffix}_h3k4",  "summary", "lcc_trend_h3k4.png")
+
+    # 画图：一张分组对比 + 各自单张
+    plot_grouped_bars(used_thr, eu_vals, h3_vals, out_group, color_eu=color_eu, color_h3=color_h3)
+    plot_single_bars(used_thr, eu_vals, out_eu, "Largest CC ratio (euchr)", color=color_eu)
+    plot_single_bars(used_thr, h3_vals, out_h3, "Largest CC ratio (h3k4me3)", color=color_h3)
+
+    # 存一份 CSV 方便你核查
+    df = pd.DataFrame({
+        "threshold": used_thr,
+        "ratio_euchr": eu_vals,
+        "ratio_h3k4": h3_vals
+    })
+    csv_path = os.path.join(sample_dir, f"viz_results_{out_suffix}_summary", "lcc_trend_values.tsv")
+    with atomic_output(csv_path) as tmp:
+        df.to_csv(tmp, sep="\t", index=False)
+
+    return out_group, out_eu, out_h3, csv_path
+
 # ---------- 主程序 ----------
-def main():
+def main(argv=None):
     ap = argparse.ArgumentParser(
         description="统计 graph_matrix_dual_euchr/h3k4 下 whole{thr} 的 largest_cc 占比并画柱状图（自动识别样本名与路径）"
     )
@@ -146,10 +365,51 @@ def main():
     ap.add_argument("--color_euchr", default="#b0d9a5", help="euchr 柱状颜色")
     ap.add_argument("--color_h3k4", default="#fdd379", help="h3k4 柱状颜色")
     ap.add_argument("--out_suffix", default="ver2_dual", help="输出目录后缀，避免覆盖旧结果")
-    args = ap.parse_args()
+    ap.add_argument("--sample_dir", default=None, help="样本目录（Sample-*）；默认由当前目录上溯")
+    ap.add_argument("--metrics_db", default=None,
+                    help="跨样本 metrics 库（SQLite 路径，auto=样本上一级默认位置）；单样本模式下优先查库，缺失再探测文件")
+    ap.add_argument("--cohort", action="store_true",
+                    help="队列模式：一次查询库中全部样本，画均值 + 分位数带（需要 --metrics_db）")
+    ap.add_argument("--out_dir", default=None,
+                    help="队列模式输出目录（默认库所在目录下 viz_results_{suffix}_cohort）；渗流模式默认 <Sample>/viz_results_{suffix}_summary")
+    ap.add_argument("--percolation", action="store_true",
+                    help="渗流模式：直接读本样本距离文件，单遍 union-find 得到 LCC 占比随距离的精确阶梯曲线与渗流阈值估计")
+    ap.add_argument("--node_mode", default="all_bins",
+                    choices=["leq_thr_endpoints", "all_distance_endpoints", "all_bins"],
+                    help="渗流模式的节点集合（同 analyze_graph_parallel_dual.py；默认 all_bins，与批处理一致）；"
+                         "leq_thr_endpoints 的节点只有已加入边的端点，LCC 占比从第一条边起即为 1，渗流模式不接受")
+    ap.add_argument("--max_distance", type=float, default=5.0,
+                    help="渗流模式只用 d ≤ 该值的边（应等于距离阶段 --threshold，之外只有最近邻补边）")
+    args = ap.parse_args(argv)
 
-    sample_dir, sample_name = ascend_sample_dir(os.getcwd())
     thrs = [t.strip() for t in args.thresholds.split(",") if t.strip()]
+    if args.cohort:
+        try:
+            here = ascend_sample_dir(args.sample_dir or os.getcwd())[0]
+        except RuntimeError:
+            here = None
+        db_path = resolve_db_path(args.metrics_db or "auto", here)
+        if not os.path.isfile(db_path):
+            raise RuntimeError(f"metrics 库不存在：{db_path}")
+        out_dir = args.out_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)),
+                                               f"viz_results_{args.out_suffix}_cohort")
+        cohort_summary(db_path, thrs, out_dir, {"euchr": args.color_euchr, "h3k4": args.color_h3k4})
+        return
+
+    if args.percolation and args.node_mode == "leq_thr_endpoints":
+        ap.error("--percolation 需要 --node_mode all_bins 或 all_distance_endpoints（leq_thr_endpoints 下 LCC 占比恒为 1）")
+    sample_dir, sample_name = ascend_sample_dir(args.sample_dir or os.getcwd())
+    if args.percolation:
+        out_dir = args.out_dir or os.path.join(sample_dir, f"viz_results_{args.out_suffix}_summary")
+        percolation_summary(sample_dir, sample_name, out_dir, args.node_mode, args.max_distance,
+                            {"euchr": args.color_euchr, "h3k4": args.color_h3k4}, argv)
+        return
+    db_path = resolve_db_path(args.metrics_db, sample_dir)
+    from_db = {}
+    if db_path and os.path.isfile(db_path):
+        rows = query_metrics(db_path, samples=[sample_name], thresholds=thrs)
+        from_db = {(r.label, r.threshold): (f"{db_path}:{r.prefix}", r.threshold, r.num_nodes, r.largest_cc_size)
+                   for r in rows.itertuples()}
     print(f"[INFO] Sample dir: {sample_dir}")
     print(f"[INFO] Sample name: {sample_name}")
     print(f"[INFO] Thresholds: {thrs}")
@@ -159,10 +419,10 @@ def main():
     used_thr = []  # 真正找到文件的阈值顺序（两侧都尽量齐全；缺失用 None）
 
     for t in thrs:
-        # euchr
-        me_path_eu, th_eu, n_eu, lcc_eu = find_metrics_file(sample_dir, sample_name, "euchr", t)
+        # euchr（库中有则直接取，否则探测文件）
+        me_path_eu, th_eu, n_eu, lcc_eu = from_db.get(("euchr", float(t))) or find_metrics_file(sample_dir, sample_name, "euchr", t)
         # h3k4
-        me_path_h3, th_h3, n_h3, lcc_h3 = find_metrics_file(sample_dir, sample_name, "h3k4", t)
+        me_path_h3, th_h3, n_h3, lcc_h3 = from_db.get(("h3k4", float(t))) or find_metrics_file(sample_dir, sample_name, "h3k4", t)
 
         # 打印来源
         print(f"\n[SCAN] thr={t}")
@@ -181,39 +441,8 @@ def main():
 
         used_thr.append(t)
 
-    # 把 None 转为 0（保持柱状图不报错），同时记录缺失信息
-    def fill_none_to_zero(arr, label):
-        out = []
-        for i, v in enumerate(arr):
-            if v is None:
-                print(f"[WARN] {label} 在 thr={used_thr[i]} 缺少数据，按 0 绘制。", file=sys.stderr)
-                out.append(0.0)
-            else:
-                out.append(float(v))
-        return out
-
-    eu_vals = fill_none_to_zero(ratios["euchr"], "euchr")
-    h3_vals = fill_none_to_zero(ratios["h3k4"], "h3k4")
-
-    # 输出目录结构（全部带 ver2_dual* 后缀，避免覆盖旧结果）
-    out_group = os.path.join(sample_dir, f"viz_results_{args.out_suffix}_summary", "lcc_trend_grouped.png")
-    out_eu    = os.path.join(sample_dir, f"viz_results_{args.out_suffix}_euchr", "summary", "lcc_trend_euchr.png")
-    out_h3    = os.path.join(sample_dir, f"viz_results_{args.out_suffix}_h3k4",  "summary", "lcc_trend_h3k4.png")
-
-    # 画图：一张分组对比 + 各自单张
-    plot_grouped_bars(used_thr, eu_vals, h3_vals, out_group, color_eu=args.color_euchr, color_h3=args.color_h3k4)
-    plot_single_bars(used_thr, eu_vals, out_eu, "Largest CC ratio (euchr)", color=args.color_euchr)
-    plot_single_bars(used_thr, h3_vals, out_h3, "Largest CC ratio (h3k4me3)", color=args.color_h3k4)
-
-    # 存一份 CSV 方便你核查
-    df = pd.DataFrame({
-        "threshold": used_thr,
-        "ratio_euchr": eu_vals,
-        "ratio_h3k4": h3_vals
-    })
-    csv_path = os.path.join(sample_dir, f"viz_results_{args.out_suffix}_summary", "lcc_trend_values.tsv")
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-    df.to_csv(csv_path, sep="\t", index=False)
+    out_group, out_eu, out_h3, csv_path = write_lcc_trend(sample_dir, args.out_suffix, used_thr, ratios,
+                                                          args.color_euchr, args.color_h3k4)
 
     # 汇报存储结构
     print("\n=== SUMMARY (存储结构) ===")